@@ -0,0 +1,53 @@
+import collections
+
+import design_hash
+
+DEFAULT_APP_HEIGHT = 667
+DEFAULT_APP_WIDTH = 375
+
+def check_batch(pool, designs, canvas_width=DEFAULT_APP_WIDTH, canvas_height=DEFAULT_APP_HEIGHT):
+	# Validates many designs at once. designs is a list of dictionaries with the "elements" tree and
+	# the "solutions" to validate against it. Returns the Solver.check() result for each design, in order.
+	# Designs with the same structure are checked on the same worker so they share one encoding,
+	# and the groups are spread over the pool's workers so they run in parallel.
+	groups = collections.OrderedDict()
+	for index in range(0, len(designs)):
+		key = design_hash.structure_hash(designs[index]["elements"], canvas_width, canvas_height)
+		if key not in groups:
+			groups[key] = []
+		groups[key].append(index)
+
+	chunks = split_groups(list(groups.values()), pool.num_workers)
+
+	tasks = []
+	results = [None] * len(designs)
+	try:
+		for chunk in chunks:
+			payload = dict()
+			payload["designs"] = [designs[index] for index in chunk]
+			payload["canvas_width"] = canvas_width
+			payload["canvas_height"] = canvas_height
+			tasks.append((chunk, pool.submit("check_batch", payload)))
+
+		for chunk, task in tasks:
+			chunk_results = task.result()
+			for index, result in zip(chunk, chunk_results):
+				results[index] = result
+	except Exception:
+		# Don't leave the rest of the batch running on the pool if the pool was full or a chunk failed
+		for chunk, task in tasks:
+			task.cancel()
+		raise
+	return results
+
+def split_groups(groups, num_workers):
+	# Large groups are split so every worker gets some of the work, 
+	# but each piece still only contains designs with the same structure
+	total = sum(len(group) for group in groups)
+	chunk_size = max(1, -(-total // num_workers))
+
+	chunks = []
+	for group in groups:
+		for start in range(0, len(group), chunk_size):
+			chunks.append(group[start:start + chunk_size])
+	return chunks
@@ -0,0 +1,96 @@
+# Solves many designs without going through the web server and writes the solutions as JSON lines
+#
+# 	python batch_solve.py ../specification -o solutions.ndjson --solutions 20 --time-budget 60 --seed 1
+#
+# Each line of the output has the design name (the file name), its solutions and the solver stats
+import argparse
+import json
+import os
+import sys
+import time
+
+import custom_solver
+import design_loader
+import solver_pool
+
+def solve_designs(pool, designs, num_solutions=custom_solver.NUM_SOLUTIONS, time_budget=None, check_timeout=None, seed=None):
+	# Queues every design on the pool and yields (design, result, error) in the same order as the designs
+	tasks = []
+	for design in designs:
+		payload = dict()
+		payload["elements"] = design.elements
+		payload["solutions"] = []
+		payload["canvas_width"] = design.canvas_width
+		payload["canvas_height"] = design.canvas_height
+		payload["num_solutions"] = num_solutions
+		payload["time_budget"] = time_budget
+		payload["check_timeout"] = check_timeout
+		if seed is not None:
+			payload["seed"] = seed
+		tasks.append((design, pool.submit("solve", payload)))
+
+	for design, task in tasks:
+		try:
+			yield design, task.result(), None
+		except solver_pool.TaskFailed as error:
+			yield design, None, str(error)
+
+def main():
+	parser = argparse.ArgumentParser(description='Generate designs for constraints trees and specification files')
+	parser.add_argument("paths", nargs="+",
+						help="design files, directories of design files or glob patterns")
+	parser.add_argument("-o", "--output", dest="output",
+						help="file to write the solutions to as JSON lines (default: standard output)", default=None)
+	parser.add_argument("-n", "--solutions", dest="num_solutions",
+						help="number of solutions to find for each design (default:%(default)s)", type=int, default=custom_solver.NUM_SOLUTIONS)
+	parser.add_argument("-t", "--time-budget", dest="time_budget",
+						help="maximum seconds to search for each design (default: no limit)", type=float, default=None)
+	parser.add_argument("--check-timeout", dest="check_timeout",
+						help="maximum seconds for a single call to Z3 (default: no limit)", type=float, default=None)
+	parser.add_argument("-s", "--seed", dest="seed",
+						help="random seed for the search, so runs can be repeated (default: random)", type=int, default=None)
+	parser.add_argument("-w", "--workers", dest="workers",
+						help="number of solver processes (default:%(default)s)", type=int, default=solver_pool.DEFAULT_NUM_WORKERS)
+	cmd_args = parser.parse_args()
+
+	designs = design_loader.load_designs(cmd_args.paths)
+	if not len(designs):
+		parser.error("No designs found in " + " ".join(cmd_args.paths))
+
+	if cmd_args.output is not None:
+		output = open(cmd_args.output, "w")
+	else:
+		# The solver prints its progress, so send that (and anything the workers print) to stderr
+		# to keep standard output for the solutions
+		output = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+		os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+	# Every design is queued up front, so the queue has to be able to hold all of them
+	pool = solver_pool.SolverPool(cmd_args.workers, max_queue=len(designs))
+
+	time_start = time.time()
+	num_failed = 0
+	try:
+		results = solve_designs(pool, designs, cmd_args.num_solutions, cmd_args.time_budget, cmd_args.check_timeout, cmd_args.seed)
+		for design, result, error in results:
+			line = dict()
+			line["design"] = design.name
+			if error is not None:
+				line["error"] = error
+				num_failed += 1
+			else:
+				line["solutions"] = result["solutions"]
+				line["stats"] = result["stats"]
+			output.write(json.dumps(line) + "\n")
+			output.flush()
+
+			status = "failed" if error is not None else str(len(result["solutions"])) + " solutions"
+			print(design.name + ": " + status, file=sys.stderr)
+	finally:
+		pool.close()
+		output.close()
+
+	print("Solved " + str(len(designs) - num_failed) + " of " + str(len(designs)) + " designs in " + str(round(time.time() - time_start, 2)) + " seconds", file=sys.stderr)
+
+if __name__ == "__main__":
+	main()
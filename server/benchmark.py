@@ -0,0 +1,216 @@
+# Runs the solver over a set of designs and reports how long it takes to find solutions
+#
+# 	python benchmark.py ../specification --seed 1 -o results.json
+# 	python benchmark.py ../specification --seed 1 --compare results.json
+# 	python benchmark.py ../specification --ordering random,first_fail,dom_wdeg,top_down
+# 	python benchmark.py ../specification --search dfs,beam
+# 	python benchmark.py ../specification --no-layout-engine
+#
+# The designs are solved one at a time in this process so the timings are not affected by other searches.
+# With the same seed the search visits the same assignments in the same order, so the counts
+# (Z3 calls, pruned branches, solutions) only change when the solver does.
+import argparse
+import contextlib
+import copy
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import custom_solver
+import design_loader
+import search
+
+DEFAULT_SEED = 1
+DEFAULT_REPEAT = 3
+
+# Counts that have to be the same on every run for the benchmark to be deterministic
+COUNTED_STATS = ["num_solutions", "z3_calls", "branches_pruned", "invalid_solutions", "exhausted"]
+
+# Times reported as the median over the repeated runs
+TIMED_STATS = ["time_first_solution", "time_to_n", "time_total", "time_structure", "time_encoding", "time_z3", "time_filter"]
+
+def run_design(design, num_solutions, seed, time_budget=None, ordering=search.DEFAULT_ORDERING, search_mode=search.DEFAULT_SEARCH_MODE, 
+	use_layout_engine=True):
+	# The solver prints its progress, which would slow down and clutter the benchmark
+	with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+		time_start = time.time()
+		solver = custom_solver.Solver(copy.deepcopy(design.elements), [], design.canvas_width, design.canvas_height,
+			seed=seed, num_solutions=num_solutions, time_budget=time_budget, ordering=ordering, search_mode=search_mode, 
+			use_layout_engine=use_layout_engine)
+		solutions = solver.solve()
+		time_total = time.time() - time_start
+
+	stats = solver.stats()
+	run = dict()
+	for key in COUNTED_STATS:
+		run[key] = stats[key]
+
+	# Time to the first and to the last of the solutions asked for, measured from the start of the search
+	solution_times = stats["solution_times"]
+	run["time_first_solution"] = solution_times[0] if len(solution_times) else None
+	run["time_to_n"] = solution_times[num_solutions - 1] if len(solution_times) >= num_solutions else None
+	run["time_total"] = time_total
+	run["time_structure"] = stats["time_structure"]
+	run["time_encoding"] = stats["time_encoding"]
+	run["time_z3"] = stats["time_z3"]
+	run["time_filter"] = stats["time_filter"]
+	run["filter_checks"] = stats["filter_checks"]
+	run["time_layout"] = stats["time_layout"]
+	run["layout_checks"] = stats["layout_checks"]
+	run["timed_out"] = stats["timed_out"]
+
+	# Symmetry cost of the designs returned (lower is better)
+	costs = [solution["cost"] for solution in solutions]
+	run["mean_cost"] = statistics.mean(costs) if len(costs) else None
+	return run
+
+def benchmark_design(design, num_solutions, seed, repeat, time_budget=None, ordering=search.DEFAULT_ORDERING, 
+	search_mode=search.DEFAULT_SEARCH_MODE, label=None, use_layout_engine=True):
+	runs = [run_design(design, num_solutions, seed, time_budget, ordering, search_mode, use_layout_engine) for i in range(0, repeat)]
+
+	result = dict()
+	result["design"] = label if label is not None else design.name
+	result["ordering"] = ordering
+	result["search_mode"] = search_mode
+	result["mean_cost"] = runs[0]["mean_cost"]
+	for key in COUNTED_STATS:
+		result[key] = runs[0][key]
+
+	for key in TIMED_STATS:
+		times = [run[key] for run in runs if run[key] is not None]
+		result[key] = statistics.median(times) if len(times) == len(runs) else None
+
+	# A search that ran out of time can stop at a different point on each run
+	result["timed_out"] = any(run["timed_out"] for run in runs)
+	result["deterministic"] = all(all(run[key] == runs[0][key] for key in COUNTED_STATS) for run in runs)
+	result["runs"] = runs
+	return result
+
+def get_commit():
+	try:
+		output = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL)
+		return output.decode("utf-8").strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def run_benchmark(designs, num_solutions, seed, repeat, time_budget=None, orderings=[search.DEFAULT_ORDERING], 
+	search_modes=[search.DEFAULT_SEARCH_MODE], use_layout_engine=True):
+	report = dict()
+	report["commit"] = get_commit()
+	report["time"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+	report["python"] = platform.python_version()
+	report["seed"] = seed
+	report["num_solutions"] = num_solutions
+	report["repeat"] = repeat
+	report["time_budget"] = time_budget
+	report["orderings"] = orderings
+	report["search_modes"] = search_modes
+	report["use_layout_engine"] = use_layout_engine
+	report["designs"] = []
+	for design in designs:
+		for ordering, search_mode in itertools.product(orderings, search_modes):
+			# With more than one ordering or search mode each design is reported once for each of them
+			options = ([ordering] if len(orderings) > 1 else []) + ([search_mode] if len(search_modes) > 1 else [])
+			label = design.name + " [" + ", ".join(options) + "]" if len(options) else design.name
+			print("Benchmarking " + label + "...", file=sys.stderr)
+			report["designs"].append(benchmark_design(design, num_solutions, seed, repeat, time_budget, ordering, search_mode, label, 
+				use_layout_engine))
+	return report
+
+def format_time(value):
+	return "-" if value is None else "%.3f" % value
+
+def format_cost(value):
+	return "-" if value is None else "%.0f" % value
+
+def format_change(value, previous):
+	if value is None or previous is None or previous == 0:
+		return ""
+	return " (%+.0f%%)" % ((value - previous) * 100.0 / previous)
+
+def print_report(report, baseline=None):
+	previous = dict()
+	if baseline is not None:
+		previous = dict((result["design"], result) for result in baseline["designs"])
+
+	columns = ["design", "solutions", "first (s)", "to n (s)", "total (s)", "z3 calls", "pruned", "encoding (s)", "filter (s)", "mean cost"]
+	rows = []
+	for result in report["designs"]:
+		before = previous.get(result["design"], dict())
+		row = [result["design"], str(result["num_solutions"]),
+			format_time(result["time_first_solution"]) + format_change(result["time_first_solution"], before.get("time_first_solution")),
+			format_time(result["time_to_n"]) + format_change(result["time_to_n"], before.get("time_to_n")),
+			format_time(result["time_total"]) + format_change(result["time_total"], before.get("time_total")),
+			str(result["z3_calls"]) + format_change(result["z3_calls"], before.get("z3_calls")),
+			str(result["branches_pruned"]) + format_change(result["branches_pruned"], before.get("branches_pruned")),
+			format_time(result["time_encoding"]) + format_change(result["time_encoding"], before.get("time_encoding")),
+			format_time(result.get("time_filter")) + format_change(result.get("time_filter"), before.get("time_filter")),
+			format_cost(result.get("mean_cost")) + format_change(result.get("mean_cost"), before.get("mean_cost"))]
+		if not result["deterministic"]:
+			row[0] += " *"
+		rows.append(row)
+
+	widths = [max(len(row[i]) for row in rows + [columns]) for i in range(0, len(columns))]
+	for row in [columns] + rows:
+		print("  ".join(row[i].ljust(widths[i]) for i in range(0, len(columns))))
+
+	if any(not result["deterministic"] for result in report["designs"]):
+		print("* the counts were different between runs (the search probably ran out of time)")
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark the solver on a set of designs')
+	parser.add_argument("paths", nargs="*", default=[os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "specification")],
+						help="design files, directories of design files or glob patterns (default: the specification folder)")
+	parser.add_argument("-o", "--output", dest="output",
+						help="file to save the results to as JSON", default=None)
+	parser.add_argument("-c", "--compare", dest="compare",
+						help="results saved from an earlier run to compare against", default=None)
+	parser.add_argument("-n", "--solutions", dest="num_solutions",
+						help="number of solutions to find for each design (default:%(default)s)", type=int, default=custom_solver.NUM_SOLUTIONS)
+	parser.add_argument("-s", "--seed", dest="seed",
+						help="random seed for the search (default:%(default)s)", type=int, default=DEFAULT_SEED)
+	parser.add_argument("-r", "--repeat", dest="repeat",
+						help="number of times to solve each design, the times are the median (default:%(default)s)", type=int, default=DEFAULT_REPEAT)
+	parser.add_argument("-t", "--time-budget", dest="time_budget",
+						help="maximum seconds to search for each design (default: no limit)", type=float, default=None)
+	parser.add_argument("--ordering", dest="orderings",
+						help="variable orderings to run each design with, separated by commas: " + ", ".join(sorted(search.ORDERINGS.keys())) + " (default:%(default)s)", 
+						default=search.DEFAULT_ORDERING)
+	parser.add_argument("--search", dest="search_modes",
+						help="search modes to run each design with, separated by commas: " + ", ".join(search.SEARCH_MODES) + " (default:%(default)s)", 
+						default=search.DEFAULT_SEARCH_MODE)
+	parser.add_argument("--no-layout-engine", dest="use_layout_engine", action="store_false",
+						help="check complete assignments with Z3 instead of computing their layout")
+	cmd_args = parser.parse_args()
+
+	orderings = cmd_args.orderings.split(",")
+	for ordering in orderings:
+		if ordering not in search.ORDERINGS:
+			parser.error("unknown ordering: " + ordering)
+
+	search_modes = cmd_args.search_modes.split(",")
+	for search_mode in search_modes:
+		if search_mode not in search.SEARCH_MODES:
+			parser.error("unknown search mode: " + search_mode)
+
+	designs = design_loader.load_designs(cmd_args.paths)
+	report = run_benchmark(designs, cmd_args.num_solutions, cmd_args.seed, max(1, cmd_args.repeat), cmd_args.time_budget, orderings, search_modes, 
+		cmd_args.use_layout_engine)
+
+	baseline = None
+	if cmd_args.compare is not None:
+		with open(cmd_args.compare) as baseline_file:
+			baseline = json.load(baseline_file)
+	print_report(report, baseline)
+
+	if cmd_args.output is not None:
+		with open(cmd_args.output, "w") as output_file:
+			json.dump(report, output_file, indent=2)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,89 @@
+import collections
+import threading
+
+import design_hash
+
+# Number of designs and solution checks to remember
+DEFAULT_MAX_ENTRIES = 2048
+
+class CheckCache(object):
+	# LRU cache of /check results keyed on the content of the constraints tree and of each saved solution
+	def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+		self.max_entries = max_entries
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key):
+		with self.lock:
+			if key not in self.entries:
+				self.misses += 1
+				return None
+
+			self.hits += 1
+			self.entries.move_to_end(key)
+			return self.entries[key]
+
+	def put(self, key, value):
+		with self.lock:
+			self.entries[key] = value
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.max_entries:
+				self.entries.popitem(last=False)
+
+	def check(self, elements, solutions, run_check):
+		# Returns the same result as Solver.check() but only sends the tree and the solutions that
+		# haven't been checked against it before to run_check(elements, solutions)
+		tree_key = design_hash.canonical_hash(elements)
+		valid = self.get(tree_key)
+
+		unchecked = []
+		for solution in solutions:
+			outcome = self.get(solution_key(tree_key, solution))
+			if outcome is not None:
+				apply_outcome(solution, outcome)
+			else:
+				unchecked.append(solution)
+
+		if valid is None or len(unchecked):
+			# Only send what the solver needs, so the returned solutions carry just the fields the check set
+			stripped = [{"id": solution["id"], "elements": solution["elements"]} for solution in unchecked]
+			result = run_check(elements, stripped)
+
+			valid = result["valid"]
+			self.put(tree_key, valid)
+			for solution, checked in zip(unchecked, result["solutions"]):
+				outcome = get_outcome(checked)
+				self.put(solution_key(tree_key, solution), outcome)
+				apply_outcome(solution, outcome)
+
+		results = dict()
+		results["valid"] = valid
+		results["solutions"] = solutions
+		return results
+
+def solution_key(tree_key, solution):
+	return design_hash.canonical_hash([tree_key, solution["elements"]])
+
+def get_outcome(checked):
+	# The fields Solver.check() sets on a solution
+	outcome = dict()
+	outcome["valid"] = checked["valid"]
+	for field in ["added", "removed", "conflicts"]:
+		if field in checked:
+			outcome[field] = checked[field]
+	return outcome
+
+def apply_outcome(solution, outcome):
+	# Updates the solution the same way Solver.check() would have
+	solution["valid"] = outcome["valid"]
+	if "added" in outcome:
+		# Shapes were added or removed since the solution was found
+		solution["added"] = outcome["added"]
+		solution["removed"] = outcome["removed"]
+	elif outcome["valid"]:
+		if "conflicts" in solution:
+			del solution["conflicts"]
+	else:
+		solution["conflicts"] = outcome["conflicts"]
@@ -1,5 +1,6 @@
 import jsonpickle
-import copy
+import contextlib
+import threading
 import uuid
 from z3 import *
 import z3_helper
@@ -8,41 +9,121 @@ import solver_helpers as sh
 import time
 import random
 import constraint_builder
+import design_hash
+import solver_cache as sc
+import layered_solver
+import tracing
+import search
+import size_bounds
 
 GRID_CONSTANT = 5
 GLOBAL_PROXIMITY = 5
 NUM_SOLUTIONS = 10
 NUM_DIFFERENT = 5
 
+# Z3's default timeout for a check (no timeout)
+NO_TIMEOUT = 4294967295
+
+class RunningCheck(object):
+	# Lets another thread interrupt the Z3 check running in this process (see solver_tasks.watch_for_cancel).
+	# Z3 keeps an interrupt until the next check starts, and a push in the meantime fails with "push canceled",
+	# so only a running check is interrupted and the interrupt is cleared as soon as the check returns.
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.running = False
+		self.interrupted = False
+
+	@contextlib.contextmanager
+	def check(self):
+		with self.lock:
+			self.running = True
+			self.interrupted = False
+		try:
+			yield
+		finally:
+			with self.lock:
+				self.running = False
+				if self.interrupted:
+					clear_interrupt()
+
+	def interrupt(self):
+		with self.lock:
+			if self.running:
+				main_ctx().interrupt()
+				self.interrupted = True
+
+def clear_interrupt():
+	# Starting a check clears an interrupt Z3 still has
+	z3.Solver().check()
+
+running_check = RunningCheck()
+
+# Scopes the request specific constraints are kept in on top of the structural constraints
+# Locks change on almost every edit and previous solutions are only used when solving, so they go on top
+SOLVER_LAYERS = ["locks", "previous"]
+
 class Solver(object): 
-	def __init__(self, elements, solutions, canvas_width, canvas_height, relative_designs=None): 
+	def __init__(self, elements, solutions, canvas_width, canvas_height, relative_designs=None, on_solution=None, 
+		seed=None, num_solutions=NUM_SOLUTIONS, should_stop=None, solver_cache=None, time_budget=None, check_timeout=None, tracer=None, 
+		domain_cache=None, nogood_cache=None, ordering=search.DEFAULT_ORDERING, search_mode=search.DEFAULT_SEARCH_MODE, 
+		beam_width=search.DEFAULT_BEAM_WIDTH, use_layout_engine=True): 
+		# Records how long each phase takes when a tracer is given
+		self.tracer = tracer if tracer is not None else tracing.NO_TRACE
+
 		self.solutions = [] # Initialize the variables somewhere
-		self.unassigned = []
 		self.elements = elements
 		self.previous_solutions = solutions
 		self.canvas_width = canvas_width
 		self.canvas_height = canvas_height
 		self.relative_search = False
-		self.shapes, self.root = self.build_shape_hierarchy()
-		self.root = self.root[0]
+		with self.tracer.span("build_hierarchy"): 
+			self.shapes, self.root = self.build_shape_hierarchy()
+			self.root = self.root[0]
 
-		self.variables = self.init_variables()
-		self.output_variables = self.init_output_variables()
+		# Time spent building the assumption literals the search checks assignments with (see search.SearchEngine)
+		self.time_encoding = 0
+		with self.tracer.span("init_variables"): 
+			self.variables = self.init_variables()
+			self.output_variables = self.init_output_variables()
+			time_encoding_start = time.time()
+			for variable in self.variables: 
+				variable.literals = variable.get_assignment_literals()
+			self.time_encoding += time.time() - time_encoding_start
 		self.previous_solution = IntVector('PrevSolution', len(self.variables))
 		self.variables_different = Int('VariablesDifferent')
 
 		# Construct the solver instance we will use for Z3
-		self.solver = z3.Solver()
-		self.solver_helper = z3_helper.Z3Helper(self.solver, canvas_width, canvas_height)
-		self.cb = constraint_builder.ConstraintBuilder(self.solver)
-		self.init_domains()
+		# If a solver for the same structure was already encoded, reuse it instead
+		self.solver_cache = solver_cache
+		self.structure_key = None
+		self.cached_solver = None
+		time_structure_start = time.time()
+		with self.tracer.span("structure") as span: 
+			if self.solver_cache is not None or domain_cache is not None or nogood_cache is not None: 
+				self.structure_key = design_hash.structure_hash(self.elements, canvas_width, canvas_height)
+			if self.solver_cache is not None: 
+				self.cached_solver = self.solver_cache.checkout(self.structure_key)
+
+			self.structure_cached = self.cached_solver is not None
+			span.set("cached", self.structure_cached)
+			if self.structure_cached: 
+				self.layers = self.cached_solver.layers
+			else: 
+				self.layers = layered_solver.LayeredSolver(z3.Solver(), SOLVER_LAYERS)
+			self.solver = self.layers.solver
+			self.layers_replaced_start = self.layers.num_replaced
 
-		# Initialize the set of constraints on shapes and containers
-		for shape in self.shapes.values(): 
-			if shape.type == "canvas": 
-				self.cb.init_canvas_constraints(shape)
-			elif shape.type == "container": 
-				self.cb.init_container_constraints(shape)
+			self.solver_helper = z3_helper.Z3Helper(self.solver, canvas_width, canvas_height)
+			self.cb = constraint_builder.ConstraintBuilder(self.solver)
+
+			# Needed by filter_domains even when the constraints are already in the cached solver
+			with self.tracer.span("size_bounds") as bounds_span: 
+				self.size_bounds = size_bounds.SizeBounds(self.root, canvas_width, canvas_height)
+				bounds_span.set("values_removed", self.size_bounds.num_removed())
+
+			if not self.structure_cached: 
+				self.init_structure_constraints()
+		self.time_structure = time.time() - time_structure_start
 
 		# Initialize the previous solution constraints
 		# self.cb.init_previous_solution_constraints(self.previous_solutions, self.shapes)
@@ -60,12 +141,315 @@ class Solver(object):
 
 		# Timing variables to measure performance for various parts
 		self.time_z3 = 0
-		self.time_encoding = 0
 		self.invalid_solutions = 0 # Used to keep track of the number of invalid solutions
 		self.num_solutions = 0
 		self.branches_pruned = 0
 		self.z3_calls = 0
 
+		# Seconds from the start of the search until each solution was found, and until the search ended
+		self.solution_times = []
+		self.time_search = 0
+
+		# Called with each new solution and the current stats as soon as it is found so callers can report progress
+		self.on_solution = on_solution
+
+		# Seeded random number generator used for the randomized search so a search can be repeated
+		self.seed = seed
+		self.random = random.Random(seed)
+		self.max_solutions = num_solutions
+
+		# Checked between calls to Z3 so the search can be stopped early
+		self.should_stop = should_stop
+		self.stopped = False
+
+		# Time limits in seconds for the whole search and for a single call to Z3
+		# When the budget runs out the search returns the solutions it has found so far
+		self.time_budget = time_budget
+		self.check_timeout = check_timeout
+		self.deadline = None
+		self.timed_out = False
+		self.checks_timed_out = 0
+
+		# Whether the search ran out of assignments to try (so there are no more solutions to find)
+		self.exhausted = False
+
+		# Search state kept between solutions (see search.SearchEngine) and how it chooses the next variable
+		self.engine = None
+		if ordering not in search.ORDERINGS: 
+			raise ValueError("Unknown variable ordering: " + str(ordering))
+		self.ordering = ordering
+
+		# How the search orders the values (see search.SEARCH_MODES)
+		if search_mode not in search.SEARCH_MODES: 
+			raise ValueError("Unknown search mode: " + str(search_mode))
+		self.search_mode = search_mode
+		self.beam_width = beam_width
+
+		# Beam search finds more designs than it returns and keeps the others for the next request that
+		# continues the search. Values it skipped because of their estimated cost are counted in cost_pruned.
+		self.reserve = []
+		self.candidates_start = 0
+		self.cost_pruned = 0
+
+		# Whether these results continue the search of an earlier request
+		self.continued = False
+
+		# Domains left after removing the values that can't be solved, for designs filtered before
+		self.domain_cache = domain_cache
+		self.locks_key = None
+		self.domains_cached = False
+		self.filter_checks = 0
+		self.values_removed = 0
+		self.values_forced = 0
+		self.time_filter = 0
+
+		# Nogoods learned from the unsat checks of the search, kept for the design's structure and locks when a cache is given
+		self.nogood_cache = nogood_cache
+		self.nogoods = None
+		self.nogoods_learned = 0
+		self.nogood_hits = 0
+		self.backjumps = 0
+
+		# Whether complete assignments are checked by computing their layout instead of with Z3 (see layout_engine)
+		self.use_layout_engine = use_layout_engine
+		self.layout_checks = 0
+		self.time_layout = 0
+
+	def stats(self):
+		# Snapshot of the performance counters so they can be reported outside of the solver
+		stats = dict()
+		stats["num_solutions"] = self.num_solutions
+		stats["invalid_solutions"] = self.invalid_solutions
+		stats["branches_pruned"] = self.branches_pruned
+		stats["z3_calls"] = self.z3_calls
+		stats["time_z3"] = self.time_z3
+		stats["time_encoding"] = self.time_encoding
+		stats["stopped"] = self.stopped
+		stats["timed_out"] = self.timed_out
+		stats["checks_timed_out"] = self.checks_timed_out
+		stats["exhausted"] = self.exhausted
+		stats["time_structure"] = self.time_structure
+		stats["structure_cached"] = self.structure_cached
+		stats["layers_replaced"] = self.layers.num_replaced - self.layers_replaced_start
+		stats["solution_times"] = list(self.solution_times)
+		stats["time_search"] = self.time_search
+		stats["continued"] = self.continued
+		stats["ordering"] = self.ordering
+		stats["search_mode"] = self.search_mode
+		stats["cost_pruned"] = self.cost_pruned
+		stats["domains_cached"] = self.domains_cached
+		stats["filter_checks"] = self.filter_checks
+		stats["values_removed"] = self.values_removed
+		stats["values_forced"] = self.values_forced
+		stats["time_filter"] = self.time_filter
+		stats["nogoods_learned"] = self.nogoods_learned
+		stats["nogood_hits"] = self.nogood_hits
+		stats["backjumps"] = self.backjumps
+		stats["layout_checks"] = self.layout_checks
+		stats["time_layout"] = self.time_layout
+		return stats
+
+	def reset_stats(self): 
+		# Counts start over for each request that continues the search
+		self.num_solutions = 0
+		self.invalid_solutions = 0
+		self.branches_pruned = 0
+		self.z3_calls = 0
+		self.time_z3 = 0
+		self.time_encoding = 0
+		self.time_structure = 0
+		self.checks_timed_out = 0
+		self.solution_times = []
+		self.time_search = 0
+		self.filter_checks = 0
+		self.time_filter = 0
+		self.nogoods_learned = 0
+		self.nogood_hits = 0
+		self.backjumps = 0
+		self.layout_checks = 0
+		self.time_layout = 0
+		self.cost_pruned = 0
+		self.layers_replaced_start = self.layers.num_replaced
+
+	def init_structure_constraints(self): 
+		with self.tracer.span("init_domains"): 
+			self.init_domains()
+			for constraint in self.size_bounds.get_constraints(self): 
+				self.solver.add(constraint)
+
+		# Initialize the set of constraints on shapes and containers
+		with self.tracer.span("encode_constraints"): 
+			for shape in self.shapes.values(): 
+				if shape.type == "canvas": 
+					self.cb.init_canvas_constraints(shape)
+				elif shape.type == "container": 
+					self.cb.init_container_constraints(shape)
+
+		# What each assignment literal means, so the search can assume them instead of adding and removing assignments
+		time_encoding_start = time.time()
+		with self.tracer.span("encode_assignment_literals"): 
+			for variable in self.variables: 
+				for index in range(0, len(variable.domain)): 
+					self.solver.add(Implies(variable.literals[index], self.get_assignment_constraint(variable, index)))
+		self.time_encoding += time.time() - time_encoding_start
+
+	def set_lock_layer(self): 
+		# Replaces the lock constraints, unless the locks are the same as the ones the solver already has
+		locks = []
+		for shape in self.shapes.values(): 
+			if shape.locks is not None: 
+				locks.append([shape.shape_id, shape.locks, [shape.element.get(lock) for lock in shape.locks]])
+
+		self.locks_key = design_hash.canonical_hash(locks)
+		with self.tracer.span("lock_layer") as span: 
+			recorder = layered_solver.ConstraintRecorder()
+			lock_builder = constraint_builder.ConstraintBuilder(recorder)
+			for shape in self.shapes.values(): 
+				lock_builder.init_locks(shape)
+			span.set("replaced", self.layers.set_layer("locks", recorder.constraints, key=self.locks_key))
+
+	def filter_domains(self): 
+		# Removes the values of each decision variable that can't be solved with the structure and locks of the design
+		# (so the search never tries them) and finds the variables left with a single value, which the search then fixes.
+		# Must be called after set_lock_layer and before set_previous_solution_layer. Filtered domains are cached by the
+		# structure and locks, since the previous solutions only block single assignments and not values.
+		time_filter_start = time.time()
+		domains = None
+		cache_key = None
+		if self.domain_cache is not None or self.nogood_cache is not None: 
+			cache_key = design_hash.canonical_hash([self.structure_key, self.locks_key])
+		if self.nogood_cache is not None: 
+			self.nogoods = self.nogood_cache.get_store(cache_key)
+		if self.domain_cache is not None: 
+			domains = self.domain_cache.get(cache_key)
+		self.domains_cached = domains is not None
+
+		with self.tracer.span("filter_domains", cached=self.domains_cached) as span: 
+			if domains is None: 
+				self.layers.push_through("locks")
+				domains, complete = self.find_feasible_values()
+				if self.domain_cache is not None and complete: 
+					self.domain_cache.put(cache_key, domains)
+
+			for variable in self.variables: 
+				variable.feasible = domains[variable.key()]
+			self.values_removed = sum([len(variable.domain) - len(variable.feasible) for variable in self.variables])
+			self.values_forced = len([variable for variable in self.variables if len(variable.feasible) == 1])
+			span.set("values_removed", self.values_removed)
+			span.set("values_forced", self.values_forced)
+		self.time_filter = time.time() - time_filter_start
+
+	def find_feasible_values(self): 
+		# Checks each value of each variable as an assumption. A model found for one value shows which values
+		# the other variables can have, so those don't have to be checked again.
+		# Returns the feasible indexes for each variable and whether every check gave an answer.
+		# A value Z3 gave up on is kept, so the search still tries it, and so are the values left unchecked
+		# when the solver is asked to stop. Values removed by the size bounds are never kept.
+		supported = dict()
+		for variable in self.variables: 
+			supported[variable.key()] = set()
+
+		def add_supports(model): 
+			for variable in self.variables: 
+				for index in range(0, len(variable.domain)): 
+					if is_true(model.eval(self.get_assignment_constraint(variable, index), model_completion=True)): 
+						supported[variable.key()].add(index)
+
+		if self.stop_requested(): 
+			# Nothing is checked, but the values the size bounds removed can't be solved either way
+			domains = dict()
+			for variable in self.variables: 
+				domains[variable.key()] = [index for index in range(0, len(variable.domain)) if not self.size_bounds.is_removed(variable, index)]
+			return domains, False
+
+		complete = True
+		result = self.filter_check([])
+		if result == unsat: 
+			# Nothing can be solved with these locks
+			return dict((variable.key(), []) for variable in self.variables), True
+		if result == sat: 
+			add_supports(self.solver.model())
+
+		domains = dict()
+		for variable in self.variables: 
+			feasible = []
+			for index in range(0, len(variable.domain)): 
+				if self.size_bounds.is_removed(variable, index): 
+					# Too large for the canvas (see size_bounds.SizeBounds)
+					continue
+				if self.stop_requested(): 
+					complete = False
+				elif index not in supported[variable.key()]: 
+					result = self.filter_check([variable.literals[index]])
+					if result == unsat: 
+						continue
+					if result == sat: 
+						add_supports(self.solver.model())
+					else: 
+						complete = False
+				feasible.append(index)
+			domains[variable.key()] = feasible
+		return domains, complete
+
+	def filter_check(self, assumptions): 
+		# Counted apart from the search's calls to Z3 (how many are needed depends on the models Z3 happens to return)
+		self.filter_checks += 1
+		return self.check_within_budget(assumptions)
+
+	def set_previous_solution_layer(self, previous_solutions): 
+		# Replaces the constraints that prevent the given solutions from being found again
+		previous = [[solution["id"], solution["elements"], solution.get("added"), solution.get("removed")] for solution in previous_solutions]
+
+		with self.tracer.span("previous_solution_layer", num_solutions=len(previous_solutions)) as span: 
+			recorder = layered_solver.ConstraintRecorder()
+			previous_builder = constraint_builder.ConstraintBuilder(recorder)
+			previous_builder.init_previous_solution_constraints(previous_solutions, self.shapes)
+			span.set("replaced", self.layers.set_layer("previous", recorder.constraints, key=design_hash.canonical_hash(previous)))
+
+	def release(self): 
+		# Removes everything this request added and gives the structural constraints back to the cache
+		if self.solver_cache is None: 
+			return
+
+		# The locks and previous solution layers are kept so the next request only replaces the ones that changed
+		self.layers.end_search()
+		self.solver.set("timeout", NO_TIMEOUT)
+		if self.cached_solver is None: 
+			self.cached_solver = sc.CachedSolver(self.layers, len(self.solver.sexpr()))
+		self.solver_cache.checkin(self.structure_key, self.cached_solver)
+		self.solver_cache = None
+
+	def stop_requested(self): 
+		if not self.stopped and self.should_stop is not None and self.should_stop(): 
+			print("Stopping the search early.")
+			self.stopped = True
+
+		if not self.stopped and self.deadline is not None and time.time() > self.deadline: 
+			print("Time budget used up, stopping the search.")
+			self.stopped = True
+			self.timed_out = True
+		return self.stopped
+
+	def check_within_budget(self, assumptions=[]): 
+		# Calls Z3 with a timeout of whichever is shorter: the time left in the budget or the timeout for one check
+		timeout = self.check_timeout
+		if self.deadline is not None: 
+			remaining = max(self.deadline - time.time(), 0.001)
+			timeout = remaining if timeout is None else min(timeout, remaining)
+
+		# A solver kept for a session still has the timeout of the request before, so it is always set
+		if timeout is not None: 
+			self.solver.set("timeout", int(math.ceil(timeout * 1000)))
+		else: 
+			self.solver.set("timeout", NO_TIMEOUT)
+
+		with running_check.check(): 
+			result = self.solver.check(*assumptions)
+		if result == unknown: 
+			# Z3 gave up, so this branch is skipped without knowing whether it had solutions
+			self.checks_timed_out += 1
+		return result
+
 	def build_shape_hierarchy(self): 
 		shapes = dict()
 		root = self.construct_shape_hierarchy([self.elements], shapes)
@@ -165,7 +549,7 @@ class Solver(object):
 	def compute_search_space(self):
 		total = 1
 		for variable in self.variables:
-			total *= len(variable.domain)
+			total *= len(variable.get_feasible_values())
 		return total		
 
 	# def init_global_constraints():
@@ -179,11 +563,14 @@ class Solver(object):
 		results = dict()
 
 		# Encode the fixed constraints 
-		for shape in self.shapes.values(): 
-			self.cb.init_locks(shape)
+		# The previous solutions are checked one at a time below so they should not be blocked
+		self.set_lock_layer()
+		self.set_previous_solution_layer([])
+		self.layers.begin_search()
 
 		time_start = time.time()
-		valid = self.z3_check(time_start)
+		with self.tracer.span("check_tree"): 
+			valid = self.z3_check(time_start)
 
 		results["valid"] = valid
 
@@ -218,10 +605,11 @@ class Solver(object):
 				# For this solution, fix the values of the variables to the solution values
 				# Otherwise, check the solution for validity again
 				# This encodes the values that should be fixed for this solution
-				self.cb.init_solution_constraints(self.shapes, elements, solution["id"])
+				with self.tracer.span("check_solution"): 
+					self.cb.init_solution_constraints(self.shapes, elements, solution["id"])
 
-				start_time = time.time()
-				result = self.z3_check(start_time)
+					start_time = time.time()
+					result = self.z3_check(start_time)
 
 				# update the valid state of the solution
 				solution["valid"] = result
@@ -251,29 +639,34 @@ class Solver(object):
 		return results
 
 	def solve(self):
+		start_time = time.time()
+		if self.time_budget is not None: 
+			self.deadline = start_time + self.time_budget
+
 		# Initialize the set of fixed constraints on shapes and containers
-		for shape in self.shapes.values(): 
-			self.cb.init_locks(shape)
+		self.set_lock_layer()
+
+		# Remove the values that can't be solved with the locks before searching
+		self.filter_domains()
 			
 		# Initialize the constraints preventing previous solutions from re-occuring
-		self.cb.init_previous_solution_constraints(self.previous_solutions, self.shapes)
+		self.set_previous_solution_layer(self.previous_solutions)
 
-		self.unassigned = copy.copy(self.variables)
+		# Anything the search adds goes on top of the layers and is removed when the solver is released
+		self.layers.begin_search()
 
 		# For debugging how large the search space isd
 		size = self.compute_search_space()
-		print("Total search space size: " + str(size))
-
-		start_time = time.time()
+		print("Total search space size: " + str(size) + " (" + str(self.values_removed) + " values removed, " + str(self.values_forced) + " variables forced)")
 
 		# Z3 looping version
 		# self.z3_solve(start_time, size)
 
-		# Branch and bound regular 
-		# self.branch_and_bound(start_time)
-
-		# Branch and bound get one solution at a time
-		self.branch_and_bound_n_solutions(start_time)
+		# Branch and bound that continues from where the last solution was found
+		with self.tracer.span("search") as span: 
+			self.resumable_search(start_time)
+			span.set("z3_calls", self.z3_calls)
+			span.set("branches_pruned", self.branches_pruned)
 
 		end_time = time.time()
 		print("number of solutions found: " + str(len(self.solutions)))
@@ -292,39 +685,51 @@ class Solver(object):
 			print("No solutions found.")
 		return self.solutions
 
-	def select_next_variable(self):
-		return self.unassigned.pop()
+	def continue_solve(self, previous_solutions, num_solutions=NUM_SOLUTIONS, on_solution=None, should_stop=None, time_budget=None, check_timeout=None, tracer=None): 
+		# Finds the next num_solutions by continuing the search of the last call to solve() or continue_solve()
+		# (for "show more" when the constraints haven't changed) and returns only the new solutions.
+		# The solutions this solver found itself are still blocked, so only the previous solutions it doesn't know about
+		# (e.g. saved from another session) need to be blocked before continuing.
+		found = set(solution["id"] for solution in self.solutions)
+		unknown = [solution for solution in previous_solutions if solution["id"] not in found]
+		if len(unknown): 
+			recorder = layered_solver.ConstraintRecorder()
+			previous_builder = constraint_builder.ConstraintBuilder(recorder)
+			previous_builder.init_previous_solution_constraints(unknown, self.shapes)
+			self.engine.add_to_base([constraint for constraint, name in recorder.constraints])
+			if self.engine.layout is not None: 
+				self.engine.layout.block_previous_solutions(unknown)
+
+		self.reset_stats()
+		self.continued = True
+		self.tracer = tracer if tracer is not None else tracing.NO_TRACE
+		self.max_solutions = num_solutions
+		self.on_solution = on_solution
+		self.should_stop = should_stop
+		self.stopped = False
+		self.timed_out = False
+		self.time_budget = time_budget
+		self.check_timeout = check_timeout
 
-	def select_next_variable_random(self): 
-		# Select a random index to assign
-		random_index = random.randint(0, len(self.unassigned)-1)
-		return random_index, self.unassigned.pop(random_index)
-
-	def restore_variable(self, variable, index):
-		variable.assigned = None
-		self.unassigned.insert(index, variable)
+		start_time = time.time()
+		self.deadline = start_time + time_budget if time_budget is not None else None
 
-	def get_randomized_domain(self, variable):
-		randomized_domain = variable.domain[0:len(variable.domain)]
-		random.shuffle(randomized_domain)
-		return randomized_domain
+		num_found = len(self.solutions)
+		with self.tracer.span("search", continued=True) as span: 
+			self.resumable_search(start_time)
+			span.set("z3_calls", self.z3_calls)
+			span.set("branches_pruned", self.branches_pruned)
 
-	def encode_assigned_variables(self):
-		variable_equals_assigned = []
-		for variable in self.variables:
-			variable_equals_assigned.append(variable.z3 == variable.assigned)
-		self.solver.add(And(variable_equals_assigned))
+		new_solutions = self.solutions[num_found:]
+		new_solutions.sort(key=lambda s: s["cost"])
+		print("number of solutions found (continued): " + str(len(new_solutions)))
+		return new_solutions
 
-	def encode_assigned_variable(self, variable):
-		time_encoding_start = time.time()
+	def get_assignment_constraint(self, variable, index): 
+		# Proximity and margin take the value from their domain, the other variables are the index in their domain
 		if variable.name == "proximity" or variable.name == "margin":
-			prox_value = variable.domain[variable.assigned]
-			self.solver.add(variable.z3 == prox_value)
-		else:
-			self.solver.add(variable.z3 == variable.assigned)
-
-		time_encoding_end = time.time()
-		self.time_encoding += (time_encoding_end - time_encoding_start)
+			return variable.z3 == variable.domain[index]
+		return variable.z3 == index
 
 	# Computes the number of variables that are different than the previous solution
 	def num_variables_different(self): 
@@ -335,6 +740,9 @@ class Solver(object):
 		return vars_diff
 
 	def encode_previous_solution_from_model(self, model): 
+		self.solver.add(self.get_previous_solution_constraint(model))
+
+	def get_previous_solution_constraint(self, model): 
 		# The next solution cannot be the exact same outputs as the previous assignment
 		# It may be possible for multiple solutions to have the same outputs (exact x,y coordinates for all shapes)
 		# So to restrict this, we encode the X,Y positions in the clauses to prevent these solutions
@@ -346,7 +754,7 @@ class Solver(object):
 			variable_value = int(variable_value)
 			all_values.append(variable.z3 == variable_value)
 
-		self.solver.add(Not(And(all_values)))	
+		return Not(And(all_values))
 
 	def encode_constraints_for_model(self, model): 
 		# Pop the previous 
@@ -393,22 +801,11 @@ class Solver(object):
 			print(variable.name)
 			print(variable_value)
 
-	def print_solution(self):
-		print("------------Solution------------")
-		for variable in self.variables:
-			print(variable.shape_id)
-			print(str(variable.domain[variable.assigned]))
-
-	def print_partial_solution(self):
-		for variable in self.variables:
-			if variable.assigned is not None:
-				print(variable.shape_id)
-				print(str(variable.domain[variable.assigned]))
-
-
 	def z3_check(self, time_start): 
 		time_z3_start = time.time()
-		result = self.solver.check()
+		with running_check.check(): 
+			result = self.solver.check()
+		self.z3_calls += 1
 		time_z3_end = time.time()
 		time_z3_total = time_z3_end - time_z3_start
 		self.time_z3 += time_z3_total
@@ -459,189 +856,95 @@ class Solver(object):
 			else: 
 				self.invalid_solutions += 1
 
-	def branch_and_bound(self, time_start, state=sh.Solution()):
-		if self.num_solutions >= NUM_SOLUTIONS:
+	def get_cost_cutoff(self): 
+		# Cost of the k-th best design beam search has to choose from in this request, or None if it has fewer than k
+		candidates = self.solutions[self.candidates_start:] + self.reserve
+		if len(candidates) < self.max_solutions: 
+			return None
+		return sorted([candidate["cost"] for candidate in candidates])[self.max_solutions - 1]
+
+	def estimate_cost(self, model): 
+		with self.tracer.span("estimate_cost"): 
+			return sh.Solution().compute_cost_from_model(self.shapes, model)
+
+	def resumable_search(self, time_start): 
+		# Finds each solution by continuing the depth first search from the assignment of the previous one
+		# so each new solution only costs the part of the search after it, instead of starting over from the root
+		if self.engine is None and self.search_mode == "beam": 
+			self.engine = search.BeamSearchEngine(self, self.ordering, self.beam_width)
+		elif self.engine is None: 
+			self.engine = search.SearchEngine(self, self.ordering)
+
+		self.candidates_start = len(self.solutions)
+		if self.search_mode == "beam": 
+			self.beam_search(time_start)
 			return
 
-		if len(self.unassigned) == 0:
-			# Ask the solver for a solution to the X,Y location varibles
-			constraints = self.solver.sexpr()
-			time_z3_start = time.time()
-			result = self.solver.check();
-			self.z3_calls += 1
-			time_z3_end = time.time()
-			time_z3_total = time_z3_end - time_z3_start
-			self.time_z3 += time_z3_total
-			unsat_core = self.solver.unsat_core()
-			self.print_solution()
-
-			if str(result) == 'sat':
-				# print("------Valid solution------")
-				self.num_solutions += 1
+		while self.num_solutions < self.max_solutions and not self.stop_requested():
+			state = sh.Solution(self.tracer)
+			with self.tracer.span("find_solution") as span: 
+				model = self.engine.next_solution()
+				span.set("found", model is not None)
 
-				# Find one solution for now
-				time_z3_start = time.time()
-				model = self.solver.model()
-				time_z3_start = time.time()
-				time_z3_total = time_z3_end - time_z3_start
-				self.time_z3 += time_z3_total
+			if model is None: 
+				if self.engine.exhausted: 
+					# Every assignment has been tried. If Z3 timed out on some of them there might still be more solutions
+					print("No more solutions could be found.")
+					self.exhausted = self.checks_timed_out == 0
+				break
 
-				# Keep the solution & convert to json
+			with self.tracer.span("convert_to_json"): 
 				sln = state.convert_to_json(self.shapes, model)
-				self.solutions.append(sln)
-				if len(self.solutions) == NUM_SOLUTIONS:
-					time_end = time.time()
-					total_time = time_end - time_start
-					print("Total time to " + str(NUM_SOLUTIONS) + ": " + str(total_time))
-				return
-			else:
-				self.invalid_solutions += 1
-				# self.print_solution()
-		else:
-			# Selects the next variable to assign
-			var_i, next_var = self.select_next_variable()
-			state.add_assigned_variable(next_var)
 
-			# Randomize the order in which we iterate through the domain
-			# random_domain = self.get_randomized_domain(next_var)
-			for val_index in range(0, len(next_var.domain)):
-				next_var.assigned = val_index
+			# Later assignments cannot produce the same outputs again
+			self.engine.block_solution(model)
 
-				# Creates a new stack context for the variable assignment
-				self.solver.push()
-
-				# Set the value of the variable to fixed in the solver
-				self.encode_assigned_variable(next_var)
-
-				# GGet a solution
-				time_z3_start = time.time()
-				result = self.solver.check()
-				self.z3_calls += 1
-				time_z3_end = time.time()
-				time_z3_total = time_z3_end - time_z3_start
-				self.time_z3 += time_z3_total
-
-				# Only branch if the result so far is satisfiable
-				if str(result) == 'sat':
-					self.branch_and_bound(time_start, state)
-				else: 
-					# print("pruning branch: ")
-					# self.print_partial_solution()
-					self.branches_pruned+=1
-
-				# Remove the stack context after the branch for this assignment has been explored
-				self.solver.pop()
-
-			# Then unassign the value
-			self.restore_variable(next_var, var_i)
-		return 
-
-	def branch_and_bound_n_solutions(self, time_start): 
-		while self.num_solutions < NUM_SOLUTIONS:
-			state = sh.Solution()
-			sln = self.branch_and_bound_random(time_start, state)
-			if sln is not None: 
-				self.solutions.append(sln)
-				self.num_solutions += 1
-			else: 
-				print("No more solutions could be found.")
-				break 
+			self.solutions.append(sln)
+			self.num_solutions += 1
+			self.solution_times.append(time.time() - time_start)
+			if self.on_solution is not None: 
+				self.on_solution(sln, self.stats())
 
 		time_end = time.time()
-		total_time = time_end - time_start
-		print("Total time to " + str(NUM_SOLUTIONS) + ": " + str(total_time))
-
-	def restore_state(self): 
-		# Unassign and reset the variables
-		for variable in self.variables: 
-			variable.assigned = None
-
-		self.unassigned = copy.copy(self.variables)
-
-		# Restore the stack context for the solver
-		for i in range(0, len(self.variables)):
-			self.solver.pop()
-
-	def branch_and_bound_random(self, time_start, state):
-		if len(self.unassigned) == 0:
-			time_z3_start = time.time()
-			result = self.solver.check()
-			constraints = self.solver.sexpr()
-			unsat_core = self.solver.unsat_core()
-			self.z3_calls += 1
-			time_z3_end = time.time()
-			time_z3_total = time_z3_end - time_z3_start
-			self.time_z3 += time_z3_total
-
-			if str(result) == 'sat':
-				# Find one solution for now
-				time_z3_start = time.time()
-				model = self.solver.model()
-				time_z3_start = time.time()
-				time_z3_total = time_z3_end - time_z3_start
-				self.time_z3 += time_z3_total
-
-				# Keep the solution & convert to json
-				self.print_solution()
-
-				sln = state.convert_to_json(self.shapes, model)
-				self.restore_state()
-
-				# Encode the previous solution outputs into the model so we don't produce it again in the next iteration
-				self.encode_previous_solution_from_model(model)
-				return sln
-			else:
-				self.invalid_solutions += 1
-				# self.print_solution()
-		else:
-			# Selects the next variable to assign
-			var_i, next_var = self.select_next_variable_random()
-			state.add_assigned_variable(next_var)
-
-			# Randomize the order in which we iterate through the domain
-			random_domain = self.get_randomized_domain(next_var)
-			for val_index in range(0, len(random_domain)):
-				dom_value = random_domain[val_index]
-				in_domain_index = next_var.domain.index(dom_value)
-				next_var.assigned = in_domain_index
-
-				# Creates a new stack context for the variable assignment
-				self.solver.push()
-
-				# Set the value of the variable to fixed in the solvfer
-				self.encode_assigned_variable(next_var)
-
-				# GGet a solution
-				time_z3_start = time.time()
-				result = self.solver.check()
-				unsat_core = self.solver.unsat_core()
-				self.z3_calls += 1
-				time_z3_end = time.time()
-				time_z3_total = time_z3_end - time_z3_start
-				self.time_z3 += time_z3_total
-
-				# Only branch if the result so far is satisfiable
-				if str(result) == 'sat':
-					sln = self.branch_and_bound_random(time_start, state)
-					if sln is not None: 
-						return sln
-				else: 
-					# print("pruning branch: ")
-					# self.print_partial_solution()
-					self.branches_pruned+=1
-
-				# Remove the stack context after the branch for this assignment has been explored
-				self.solver.pop()
-
-			# Then unassign the value
-			self.restore_variable(next_var, var_i)
-		return 
-
-
-
-
-
-
-
-
-
+		self.time_search = time_end - time_start
+		print("Total time to " + str(self.max_solutions) + ": " + str(self.time_search))
+
+	def beam_search(self, time_start): 
+		# Finds BEAM_CANDIDATES designs for each one asked for and keeps the ones with the lowest cost,
+		# together with the designs left over from earlier requests. The others are kept for the next request.
+		num_candidates = 0
+		while num_candidates < self.max_solutions * search.BEAM_CANDIDATES and not self.stop_requested():
+			with self.tracer.span("find_solution") as span: 
+				model = self.engine.next_solution()
+				span.set("found", model is not None)
+
+			if model is None: 
+				if self.engine.exhausted: 
+					# The values skipped for their cost might still have designs
+					print("No more solutions could be found.")
+					self.exhausted = self.checks_timed_out == 0 and not self.engine.pruned_by_cost
+				break
+
+			with self.tracer.span("convert_to_json"): 
+				sln = sh.Solution(self.tracer).convert_to_json(self.shapes, model)
+			self.engine.block_solution(model)
+			self.solutions.append(sln)
+			num_candidates += 1
+			self.solution_times.append(time.time() - time_start)
+
+		candidates = self.solutions[self.candidates_start:] + self.reserve
+		candidates.sort(key=lambda s: s["cost"])
+		kept = candidates[0:self.max_solutions]
+		self.reserve = candidates[self.max_solutions:]
+		self.solutions = self.solutions[0:self.candidates_start] + kept
+		self.num_solutions = len(kept)
+		if len(self.reserve): 
+			self.exhausted = False
+
+		# The designs are only reported once it is known which ones are kept
+		for sln in kept: 
+			if self.on_solution is not None: 
+				self.on_solution(sln, self.stats())
+
+		self.time_search = time.time() - time_start
+		print("Total time to " + str(self.max_solutions) + " (best of " + str(num_candidates) + " found): " + str(self.time_search))
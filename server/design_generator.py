@@ -0,0 +1,69 @@
+import itertools
+import random
+
+import design_loader
+
+# Leaf types the client can create
+LEAF_TYPES = ["text", "button", "field", "image"]
+
+# Default range of leaf sizes, small enough that a few levels of groups still fit on the canvas
+DEFAULT_LEAF_WIDTH = (20, 60)
+DEFAULT_LEAF_HEIGHT = (10, 30)
+
+# Container properties that can be locked, with the values a lock can take
+# (the arrangement and alignment are indexes into their domains, as in the solutions the solver returns)
+LOCKABLE_PROPERTIES = {
+	"arrangement": [0, 1],
+	"alignment": [1],
+	"proximity": [10, 20, 30, 40, 50],
+}
+
+def generate_design(depth=1, fan_out=3, leaf_width=DEFAULT_LEAF_WIDTH, leaf_height=DEFAULT_LEAF_HEIGHT, lock_density=0,
+	seed=None, canvas_width=design_loader.DEFAULT_APP_WIDTH, canvas_height=design_loader.DEFAULT_APP_HEIGHT):
+	# Builds a canvas -> page -> groups -> leaves tree with depth levels of groups under the page
+	# and fan_out children in the page and in every group, so it has fan_out ** (depth + 1) leaves.
+	# Each container is locked with a probability of lock_density to a random value of one of its properties.
+	# Leaf sizes are even so a leaf can be centred in its container.
+	generator = random.Random(seed)
+	names = itertools.count()
+
+	def new_leaf():
+		leaf = dict()
+		leaf["name"] = "leaf" + str(next(names))
+		leaf["type"] = generator.choice(LEAF_TYPES)
+		leaf["label"] = leaf["name"]
+		leaf["size"] = {"width": random_even(generator, leaf_width), "height": random_even(generator, leaf_height)}
+		return leaf
+
+	def new_container(container_type, level):
+		container = dict()
+		container["name"] = container_type + str(next(names))
+		container["type"] = container_type
+		container["children"] = []
+		for i in range(0, fan_out):
+			container["children"].append(new_container("group", level + 1) if level < depth else new_leaf())
+
+		if generator.random() < lock_density:
+			lock = generator.choice(sorted(LOCKABLE_PROPERTIES.keys()))
+			container["locks"] = [lock]
+			container[lock] = generator.choice(LOCKABLE_PROPERTIES[lock])
+		return container
+
+	canvas = dict()
+	canvas["name"] = "canvas"
+	canvas["type"] = "canvas"
+	canvas["location"] = {"x": 0, "y": 0}
+	canvas["size"] = {"width": canvas_width, "height": canvas_height}
+	canvas["children"] = [new_container("page", 0)]
+
+	name = "depth" + str(depth) + "-fanout" + str(fan_out) + "-locks" + str(lock_density)
+	return design_loader.Design(name, canvas, canvas_width, canvas_height)
+
+def random_even(generator, size_range):
+	low, high = size_range
+	return 2 * generator.randint(int(low + 1) // 2, int(high) // 2)
+
+def count_leaves(element):
+	if "children" not in element:
+		return 1
+	return sum(count_leaves(child) for child in element["children"])
@@ -0,0 +1,30 @@
+import hashlib
+import json
+
+def canonical_hash(value):
+	# Hash of a JSON value that doesn't depend on the order of the keys in its dictionaries
+	canonical = json.dumps(value, sort_keys=True, separators=(",", ":"))
+	return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+def structure_hash(elements, canvas_width, canvas_height):
+	# Hash of only the parts of the element tree that the structural constraints depend on
+	# (names, types, leaf sizes, order and children), so trees that differ only in locks,
+	# locations or labels share the same encoding
+	structure = dict()
+	structure["canvas"] = [canvas_width, canvas_height]
+	structure["tree"] = get_structure(elements)
+	return canonical_hash(structure)
+
+def get_structure(element):
+	structure = dict()
+	structure["name"] = element["name"]
+	structure["type"] = element["type"]
+	structure["order"] = element.get("order", "important")
+
+	# Container sizes are solved for, but leaf and canvas sizes are constants in the constraints
+	if element["type"] not in ["page", "group", "labelGroup"] and "size" in element:
+		structure["size"] = [element["size"]["width"], element["size"]["height"]]
+
+	if "children" in element:
+		structure["children"] = [get_structure(child) for child in element["children"]]
+	return structure
@@ -0,0 +1,140 @@
+import collections
+import glob
+import json
+import os
+
+DEFAULT_APP_HEIGHT = 667
+DEFAULT_APP_WIDTH = 375
+
+# Fields of the older flat specification format that are carried over onto the leaf elements
+SPEC_ELEMENT_FIELDS = ["name", "type", "label", "location", "size", "order", "importance", "path", "tag"]
+
+class Design(object):
+	def __init__(self, name, elements, canvas_width=DEFAULT_APP_WIDTH, canvas_height=DEFAULT_APP_HEIGHT):
+		# elements is the constraints tree in the same format the client sends to /solve
+		self.name = name
+		self.elements = elements
+		self.canvas_width = canvas_width
+		self.canvas_height = canvas_height
+
+def find_design_files(paths):
+	# Expands directories (and glob patterns) into the JSON files inside of them
+	files = []
+	for path in paths:
+		if os.path.isdir(path):
+			files.extend(sorted(glob.glob(os.path.join(path, "*.json"))))
+		elif any(character in path for character in "*?["):
+			files.extend(sorted(glob.glob(path)))
+		else:
+			files.append(path)
+	return files
+
+def load_designs(paths):
+	designs = []
+	for path in find_design_files(paths):
+		designs.extend(load_design_file(path))
+	return designs
+
+def load_design_file(path):
+	# A file can contain a constraints tree exported from the client, a specification in the
+	# older flat format (see the specification folder), or a list of either
+	with open(path) as design_file:
+		data = json.load(design_file)
+
+	base_name = os.path.splitext(os.path.basename(path))[0]
+	if isinstance(data, list):
+		return [to_design(base_name + "-" + str(i), item) for i, item in enumerate(data)]
+	return [to_design(base_name, data)]
+
+def to_design(name, data):
+	if data.get("type") == "canvas":
+		size = data.get("size", dict())
+		return Design(name, data, size.get("width", DEFAULT_APP_WIDTH), size.get("height", DEFAULT_APP_HEIGHT))
+
+	if "elements" in data and isinstance(data["elements"], list):
+		return convert_specification(name, data)
+
+	raise ValueError("Design " + name + " is not a constraints tree or a specification")
+
+def convert_specification(name, spec):
+	# Builds the canvas -> page -> groups -> shapes tree the solver expects from a flat specification.
+	# Elements with a "group" go into that group (in the order they are listed), elements with "labels"
+	# are put together with the element they label in a labelGroup, and "locked" elements keep their location.
+	canvas_size = spec.get("canvas_size", dict())
+	canvas_width = canvas_size.get("width", DEFAULT_APP_WIDTH)
+	canvas_height = canvas_size.get("height", DEFAULT_APP_HEIGHT)
+
+	leaves = collections.OrderedDict()
+	for spec_element in spec["elements"]:
+		element = dict()
+		for field in SPEC_ELEMENT_FIELDS:
+			if field in spec_element:
+				element[field] = spec_element[field]
+
+		if spec_element.get("locked", False):
+			element["locks"] = ["location"]
+		leaves[element["name"]] = element
+
+	groups = collections.OrderedDict()
+	for spec_group in spec.get("groups", []):
+		groups[spec_group["name"]] = new_container(spec_group["name"], "group", spec_group.get("order"))
+
+	labelled = dict()
+	for spec_element in spec["elements"]:
+		target = spec_element.get("labels")
+		if target in leaves and spec_element.get("group") == find_group(spec, target):
+			labelled[target] = spec_element["name"]
+
+	page = new_container(name + "-page", "page")
+	placed = set()
+	for spec_element in spec["elements"]:
+		element_name = spec_element["name"]
+		if element_name in placed:
+			continue
+
+		# Labels are placed together with the element they label
+		target = spec_element.get("labels")
+		if target in labelled and labelled[target] == element_name:
+			element_name = target
+		child = leaves[element_name]
+		if element_name in labelled:
+			label_name = labelled[element_name]
+			child = new_container(label_name + "-group", "labelGroup")
+			child["children"] = [leaves[label_name], leaves[element_name]]
+			placed.add(label_name)
+		placed.add(element_name)
+
+		group_name = spec_element.get("group")
+		if group_name is None:
+			page["children"].append(child)
+			continue
+
+		if group_name not in groups:
+			groups[group_name] = new_container(group_name, "group")
+		group = groups[group_name]
+		if not len(group["children"]):
+			page["children"].append(group)
+		group["children"].append(child)
+
+	canvas = dict()
+	canvas["name"] = name + "-canvas"
+	canvas["type"] = "canvas"
+	canvas["location"] = {"x": 0, "y": 0}
+	canvas["size"] = {"width": canvas_width, "height": canvas_height}
+	canvas["children"] = [page]
+	return Design(name, canvas, canvas_width, canvas_height)
+
+def find_group(spec, element_name):
+	for spec_element in spec["elements"]:
+		if spec_element["name"] == element_name:
+			return spec_element.get("group")
+	return None
+
+def new_container(name, container_type, order=None):
+	container = dict()
+	container["name"] = name
+	container["type"] = container_type
+	container["children"] = []
+	if order is not None:
+		container["order"] = order
+	return container
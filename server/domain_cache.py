@@ -0,0 +1,33 @@
+import collections
+import threading
+
+# Number of designs to keep the filtered domains of
+DEFAULT_MAX_ENTRIES = 256
+
+class DomainCache(object):
+	# Keeps the values left in the domain of each decision variable after filtering out the ones that can't be solved,
+	# for recently solved designs. The key is the structure and the locks of the design, which are all the filtering depends on.
+	def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+		self.max_entries = max_entries
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key):
+		# Returns a dictionary of variable names to the domain indexes left for them, or None
+		with self.lock:
+			if key not in self.entries:
+				self.misses += 1
+				return None
+
+			self.hits += 1
+			self.entries.move_to_end(key)
+			return self.entries[key]
+
+	def put(self, key, domains):
+		with self.lock:
+			self.entries[key] = domains
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.max_entries:
+				self.entries.popitem(last=False)
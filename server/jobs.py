@@ -0,0 +1,200 @@
+import threading
+import time
+import uuid
+
+import portfolio
+
+# Finished jobs are kept around for this long so the client can still collect the results
+JOB_EXPIRY_SECONDS = 600
+
+class Job(object):
+	def __init__(self, job_id, request=None):
+		self.job_id = job_id
+
+		# Anything the caller wants to keep with the job until it finishes (e.g. the request that started it)
+		self.request = request
+		self.status = "queued"
+		self.solutions = []
+		self.stats = dict()
+		self.error = None
+
+		# Phase timings from the solver, only when the request asked for them
+		self.trace = None
+		self.time_created = time.time()
+		self.time_started = None
+		self.time_finished = None
+
+		# The pool task (or portfolio search) running the job and whether it has been asked to stop
+		self.handle = None
+		self.cancelled = False
+
+		# Everything that happened to the job in order, so the solutions can be streamed as they are found
+		self.events = []
+		self.lock = threading.Condition()
+
+	def start(self):
+		with self.lock:
+			self.status = "running"
+			self.time_started = time.time()
+
+	def add_solution(self, solution, stats):
+		# Called from the worker thread each time the solver finds a new design
+		with self.lock:
+			self.solutions.append(solution)
+			self.stats = stats
+			self.add_event("solution", solution)
+
+	def finish(self, solutions, stats, trace=None):
+		# Cancelled jobs still finish with the solutions they found before they stopped
+		with self.lock:
+			self.status = "cancelled" if self.cancelled else "done"
+			self.solutions = solutions
+			self.stats = stats
+			self.trace = trace
+			self.time_finished = time.time()
+			self.add_event(self.status, self.summary())
+
+	def cancel(self):
+		if self.is_finished():
+			return False
+
+		self.cancelled = True
+		if self.handle is not None:
+			self.handle.cancel()
+		return True
+
+	def fail(self, error):
+		with self.lock:
+			self.status = "failed"
+			self.error = error
+			self.time_finished = time.time()
+			self.add_event("failed", self.summary())
+
+	def add_event(self, event_type, data):
+		# Must be called while holding the lock
+		self.events.append((event_type, data))
+		self.lock.notify_all()
+
+	def wait_for_events(self, start_index, timeout=None):
+		# Blocks until there are events after start_index (or the timeout passes) and returns them
+		with self.lock:
+			if len(self.events) <= start_index and not self.is_finished():
+				self.lock.wait(timeout)
+			return self.events[start_index:]
+
+	def is_finished(self):
+		return self.status == "done" or self.status == "failed" or self.status == "cancelled"
+
+	def elapsed(self):
+		# Time spent solving so far (or in total once the job is finished)
+		if self.time_started is None:
+			return 0
+		time_end = self.time_finished if self.time_finished is not None else time.time()
+		return time_end - self.time_started
+
+	def summary(self):
+		# Status of the job without the solutions. Must be called while holding the lock
+		job = dict()
+		job["job_id"] = self.job_id
+		job["status"] = self.status
+		job["elapsed"] = self.elapsed()
+
+		progress = dict(self.stats)
+		progress["solutions_found"] = len(self.solutions)
+		job["progress"] = progress
+
+		# Whether the solver tried every design, so asking for more will not find any
+		job["exhausted"] = self.stats.get("exhausted", False)
+
+		if self.error is not None:
+			job["error"] = self.error
+
+		if self.trace is not None:
+			job["trace"] = self.trace
+		return job
+
+	def to_json(self):
+		with self.lock:
+			job = self.summary()
+			job["solutions"] = list(self.solutions)
+			return job
+
+class JobManager(object):
+	def __init__(self, pool, on_job_finished=None):
+		# Jobs run on the solver pool's worker processes, the manager only keeps track of their state
+		# on_job_finished(kind, job) is called once each job is done, has failed or was cancelled
+		self.pool = pool
+		self.on_job_finished = on_job_finished
+		self.jobs = dict()
+
+		# Latest job for each design session. A new job in a session cancels the one before it
+		# since its results would be out of date
+		self.sessions = dict()
+		self.lock = threading.Lock()
+
+	def submit(self, kind, payload, num_searches=1, session_id=None, request=None):
+		# Raises solver_pool.PoolFull if there are already too many jobs waiting
+		# Solves with more than one search race differently seeded searches against each other
+		if session_id is not None:
+			previous_job = self.get_session_job(session_id)
+			if previous_job is not None and previous_job.cancel():
+				print("Solve job " + previous_job.job_id + " was superseded by a newer request.")
+
+		job = Job(uuid.uuid4().hex, request)
+		on_event = lambda event_type, data: self.handle_event(kind, job, event_type, data)
+		if kind == "solve" and num_searches > 1:
+			job.handle = portfolio.PortfolioSearch(self.pool, payload, num_searches, on_event=on_event).start()
+		else:
+			# Solves that keep their search for the session to continue later go to the worker that has it
+			job.handle = self.pool.submit(kind, payload, on_event=on_event, affinity=payload.get("search_session"))
+
+		with self.lock:
+			self.remove_expired_jobs()
+			self.jobs[job.job_id] = job
+			if session_id is not None:
+				self.sessions[session_id] = job.job_id
+		return job
+
+	def cancel(self, job_id):
+		job = self.get(job_id)
+		if job is None:
+			return None
+
+		job.cancel()
+		return job
+
+	def get_session_job(self, session_id):
+		with self.lock:
+			job_id = self.sessions.get(session_id)
+			return self.jobs.get(job_id) if job_id is not None else None
+
+	def handle_event(self, kind, job, event_type, data):
+		if event_type == "started":
+			job.start()
+		elif event_type == "solution":
+			job.add_solution(data["solution"], data["stats"])
+		elif event_type == "result":
+			job.finish(data["solutions"], data["stats"], data.get("trace"))
+		elif event_type == "error":
+			print("Solve job " + job.job_id + " failed: " + str(data))
+			job.fail(str(data))
+		elif event_type == "cancelled":
+			# Cancelled before a worker picked it up
+			job.finish(job.solutions, job.stats)
+
+		if job.is_finished() and self.on_job_finished is not None:
+			self.on_job_finished(kind, job)
+
+	def get(self, job_id):
+		with self.lock:
+			return self.jobs.get(job_id)
+
+	def remove_expired_jobs(self):
+		now = time.time()
+		expired = [job_id for job_id, job in self.jobs.items() if job.is_finished() and (now - job.time_finished) > JOB_EXPIRY_SECONDS]
+		for job_id in expired:
+			del self.jobs[job_id]
+
+		expired_sessions = [session_id for session_id, job_id in self.sessions.items() if job_id not in self.jobs]
+		for session_id in expired_sessions:
+			del self.sessions[session_id]
@@ -0,0 +1,79 @@
+class ConstraintRecorder(object):
+	# Stands in for a Z3 solver so a ConstraintBuilder can be used to collect constraints into a layer
+	def __init__(self):
+		self.constraints = []
+
+	def add(self, constraint):
+		self.constraints.append((constraint, ""))
+
+	def assert_and_track(self, constraint, name):
+		self.constraints.append((constraint, name))
+
+class LayeredSolver(object):
+	# Z3 solver whose constraints are kept in layers. The structural constraints are asserted once at the base
+	# and each named layer above them lives in its own push/pop scope, in the order given by layer_names.
+	# Replacing a layer only pops that layer and the ones above it, the layers below are kept as they are.
+	# Any scopes pushed for a search sit on top of the last layer.
+	def __init__(self, solver, layer_names):
+		self.solver = solver
+		self.layer_names = layer_names
+		self.layers = dict()
+		self.keys = dict()
+		for name in layer_names:
+			self.layers[name] = []
+			self.keys[name] = None
+
+		# Number of layers that currently have their scope pushed on the solver
+		self.num_pushed = 0
+
+		# Number of layers that were re-asserted since this was created (to measure the savings)
+		self.num_replaced = 0
+
+	def set_layer(self, name, constraints, key=None):
+		# constraints is a list of (constraint, tracking name) pairs
+		# If the key is the same as the one the layer was last set with, the layer is kept as it is
+		index = self.layer_names.index(name)
+		if key is not None and key == self.keys[name] and self.num_pushed > index:
+			self.pop_to(self.num_pushed)
+			return False
+
+		self.pop_to(index)
+		self.layers[name] = constraints
+		self.keys[name] = key
+		self.num_replaced += 1
+		return True
+
+	def begin_search(self):
+		# Pushes any layers that are missing and then a scope for the search
+		self.pop_to(self.num_pushed)
+		while self.num_pushed < len(self.layer_names):
+			self.push_layer(self.layer_names[self.num_pushed])
+		self.solver.push()
+
+	def push_through(self, name):
+		# Pushes the layers up to and including the named one and pops any above it,
+		# so a check only sees the constraints of those layers
+		index = self.layer_names.index(name)
+		self.pop_to(min(self.num_pushed, index + 1))
+		while self.num_pushed <= index:
+			self.push_layer(self.layer_names[self.num_pushed])
+
+	def end_search(self):
+		# Removes everything that was added since begin_search
+		self.pop_to(self.num_pushed)
+
+	def pop_to(self, num_layers):
+		# Pops the search scopes and any layers above the first num_layers
+		scopes = self.solver.num_scopes() - num_layers
+		if scopes > 0:
+			self.solver.pop(scopes)
+		self.num_pushed = min(self.num_pushed, num_layers)
+
+	def push_layer(self, name):
+		self.solver.push()
+		for constraint, tracking_name in self.layers[name]:
+			if len(tracking_name):
+				self.solver.assert_and_track(constraint, tracking_name)
+			else:
+				self.solver.add(constraint)
+		self.num_pushed += 1
@@ -0,0 +1,272 @@
+from fractions import Fraction
+
+class LayoutModel(object):
+	# Stands in for a Z3 model of a layout the engine computed, for the code that reads solutions out of models
+	def __init__(self, values):
+		# Z3 AST id of the variable -> integer value. Printing a Z3 expression to get its name is slow.
+		self.values = values
+
+	def __getitem__(self, z3_variable):
+		return LayoutValue(self.values[z3_variable.get_id()])
+
+class LayoutValue(object):
+	# The parts of a Z3 integer value the solutions are read with
+	def __init__(self, value):
+		self.value = value
+
+	def as_long(self):
+		return self.value
+
+	def as_string(self):
+		return str(self.value)
+
+class LayoutEngine(object):
+	# Computes the layout for an assignment of every decision variable without calling Z3.
+	# When every container orders its children ("important"), the arrangement, alignment and proximity fix the size
+	# of each container (bottom up) and the position of each shape inside it (top down), so there is only one layout
+	# that can satisfy the constraints. The engine computes it the way ConstraintBuilder encodes it and then checks the
+	# rest of the constraints (bounds, overlaps, order, locks and blocked solutions) on it directly.
+	#
+	# The arithmetic follows the encoding exactly: half of a leaf or canvas size is a rational (Python division of a
+	# constant), half of a container size is integer division of a Z3 Int, and positions and container sizes are integers.
+	# Trees the engine can't compute this way (see get_unsupported_reason) are checked with Z3 instead.
+	def __init__(self, solver):
+		self.shapes = solver.shapes
+		self.root = solver.root
+		self.canvas_width = solver.canvas_width
+		self.canvas_height = solver.canvas_height
+		self.unsupported_reason = self.get_unsupported_reason()
+
+		# Leaf positions of the solutions that can't be found again
+		self.leaves = [shape for shape in self.shapes.values() if shape.type == "leaf"]
+		self.blocked = set()
+
+	def is_supported(self):
+		return self.unsupported_reason is None
+
+	def get_unsupported_reason(self):
+		for shape in self.shapes.values():
+			if shape.type == "container" and (shape.order != "important" or not len(shape.children)):
+				return "container " + shape.shape_id + " doesn't order its children"
+			if shape.type != "container" and not (isinstance(shape.width, int) and isinstance(shape.height, int)):
+				return shape.shape_id + " doesn't have an integer size"
+			for lock in (shape.locks if shape.locks is not None else []):
+				if lock not in ["location", "label"] and lock not in shape.variables:
+					return shape.shape_id + " has an unknown lock " + str(lock)
+		if self.root.type != "canvas" or len(self.root.children) != 1:
+			return "the tree doesn't have a canvas with one page"
+		return None
+
+	def block_layout(self, model):
+		# Blocks the leaf positions of a solution found by the search (see Solver.get_previous_solution_constraint)
+		self.blocked.add(tuple((model[leaf.variables.x.z3].as_long(), model[leaf.variables.y.z3].as_long()) for leaf in self.leaves))
+
+	def block_previous_solutions(self, solutions):
+		# Blocks previous solutions the way ConstraintBuilder.init_previous_solution_constraints does. Its constraint also
+		# compares the labels, which are only fixed by a label lock, so a solution is only blocked if all of its labels are locked to its values.
+		for solution in solutions:
+			if len(solution.get("added", [])) or len(solution.get("removed", [])):
+				continue
+
+			elements = solution["elements"]
+			leaves = [self.shapes[element_id] for element_id in elements if self.shapes[element_id].type == "leaf"]
+			labels_fixed = True
+			for leaf in leaves:
+				if "label" in leaf.variables:
+					locked = leaf.locks is not None and "label" in leaf.locks
+					if not locked or leaf.element["label"] != elements[leaf.shape_id]["label"]:
+						labels_fixed = False
+			if not labels_fixed or len(leaves) != len(self.leaves):
+				continue
+
+			self.blocked.add(tuple((elements[leaf.shape_id]["location"]["x"], elements[leaf.shape_id]["location"]["y"]) for leaf in self.leaves))
+
+	def solve(self):
+		# Returns a LayoutModel for the assigned values of the variables, or None if they can't be solved
+		sizes = dict()
+		if not self.compute_size(self.root.children[0], sizes):
+			return None
+
+		positions = dict()
+		if not self.place_page(positions, sizes) or not self.place_children(self.root.children[0], positions, sizes):
+			return None
+
+		if not self.check_bounds(positions, sizes) or not self.check_locks(positions):
+			return None
+
+		if tuple(positions[leaf.shape_id] for leaf in self.leaves) in self.blocked:
+			return None
+		return LayoutModel(self.get_values(positions, sizes))
+
+	def compute_size(self, shape, sizes):
+		# Sizes of the shape and the shapes in it. A container is as long as its children and the space between them
+		# along its arrangement and as wide as its widest child across it.
+		if shape.type == "leaf":
+			sizes[shape.shape_id] = (shape.width, shape.height)
+			return True
+
+		for child in shape.children:
+			if not self.compute_size(child, sizes):
+				return False
+
+		proximity = get_value(shape.variables.proximity)
+		widths = [sizes[child.shape_id][0] for child in shape.children]
+		heights = [sizes[child.shape_id][1] for child in shape.children]
+		space = proximity * (len(shape.children) - 1)
+		if is_vertical(shape):
+			sizes[shape.shape_id] = (max(widths), sum(heights) + space)
+		else:
+			sizes[shape.shape_id] = (sum(widths) + space, max(heights))
+		return True
+
+	def place_page(self, positions, sizes):
+		canvas = self.root
+		page = canvas.children[0]
+		positions[canvas.shape_id] = (canvas.orig_x, canvas.orig_y)
+		margin = get_value(canvas.variables.margin)
+		width, height = sizes[page.shape_id]
+
+		alignment = canvas.variables.alignment
+		if alignment.assigned == alignment.domain.index("left"):
+			x = canvas.orig_x + margin
+		elif alignment.assigned == alignment.domain.index("center"):
+			x = canvas.orig_x + Fraction(canvas.width, 2) - width // 2
+		else:
+			x = canvas.orig_x + canvas.width - margin - width
+
+		justification = canvas.variables.justification
+		if justification.assigned == justification.domain.index("top"):
+			y = canvas.orig_y + margin
+		elif justification.assigned == justification.domain.index("center"):
+			y = canvas.orig_y + Fraction(canvas.height, 2) - height // 2
+		else:
+			y = canvas.orig_y + canvas.height - margin - height
+
+		if not is_integer(x) or not is_integer(y):
+			return False
+		positions[page.shape_id] = (int(x), int(y))
+
+		# The page stays inside the canvas minus the margin
+		return (x >= canvas.orig_x + margin and y >= canvas.orig_y + margin and
+			x + width <= canvas.orig_x + canvas.width - margin and y + height <= canvas.orig_y + canvas.height - margin)
+
+	def place_children(self, container, positions, sizes):
+		# The children follow each other from the start of the container (they fill it exactly along the arrangement)
+		# and are aligned across it
+		container_x, container_y = positions[container.shape_id]
+		container_width, container_height = sizes[container.shape_id]
+		proximity = get_value(container.variables.proximity)
+		vertical = is_vertical(container)
+		alignment = container.variables.alignment
+		left = alignment.assigned == alignment.domain.index("left")
+		center = alignment.assigned == alignment.domain.index("center")
+
+		offset = 0
+		for child in container.children:
+			width, height = sizes[child.shape_id]
+			if vertical:
+				y = container_y + offset
+				if left:
+					x = container_x + proximity
+				elif center:
+					x = container_x + container_width // 2 - half(child, width)
+				else:
+					x = container_x + container_width - proximity - width
+				offset += height + proximity
+			else:
+				x = container_x + offset
+				if left:
+					y = container_y + proximity
+				elif center:
+					y = container_y + container_height // 2 - half(child, height)
+				else:
+					y = container_y + container_height - proximity - height
+				offset += width + proximity
+
+			if not is_integer(x) or not is_integer(y):
+				return False
+			positions[child.shape_id] = (int(x), int(y))
+
+			# Children stay inside their container
+			if x < container_x or y < container_y or x + width > container_x + container_width or y + height > container_y + container_height:
+				return False
+
+			# The first child is at the start of the container and the last child at the end
+			if child.order == "first" and (y != container_y if vertical else x != container_x):
+				return False
+			if child.order == "last" and (y + height != container_y + container_height if vertical else x + width != container_x + container_width):
+				return False
+
+		if not self.check_overlaps(container, positions, sizes, proximity):
+			return False
+
+		for child in container.children:
+			if child.type == "container" and not self.place_children(child, positions, sizes):
+				return False
+		return True
+
+	def check_overlaps(self, container, positions, sizes, proximity):
+		# Children are at least the proximity apart (see ConstraintBuilder.non_overlapping)
+		children = container.children
+		for i in range(0, len(children)):
+			x1, y1 = positions[children[i].shape_id]
+			width1, height1 = sizes[children[i].shape_id]
+			for j in range(i + 1, len(children)):
+				x2, y2 = positions[children[j].shape_id]
+				width2, height2 = sizes[children[j].shape_id]
+				if not (x1 + width1 + proximity <= x2 or x2 + width2 + proximity <= x1 or
+					y1 + height1 + proximity <= y2 or y2 + height2 + proximity <= y1):
+					return False
+		return True
+
+	def check_bounds(self, positions, sizes):
+		# Every shape is inside the canvas (see Solver.init_domains)
+		for shape in self.shapes.values():
+			x, y = positions[shape.shape_id]
+			width, height = sizes.get(shape.shape_id, (shape.width, shape.height))
+			if x < 0 or y < 0 or x + width > self.canvas_width or y + height > self.canvas_height:
+				return False
+		return True
+
+	def check_locks(self, positions):
+		# Labels are free in the encoding, so only location and variable locks can fail
+		for shape in self.shapes.values():
+			for lock in (shape.locks if shape.locks is not None else []):
+				if lock == "location":
+					if positions[shape.shape_id] != (shape.orig_x, shape.orig_y):
+						return False
+				elif lock != "label" and get_value(shape.variables[lock]) != shape.variable_values[lock]:
+					return False
+		return True
+
+	def get_values(self, positions, sizes):
+		values = dict()
+		for shape in self.shapes.values():
+			x, y = positions[shape.shape_id]
+			values[shape.variables.x.z3.get_id()] = x
+			values[shape.variables.y.z3.get_id()] = y
+			if shape.type == "container":
+				values[shape.width.get_id()], values[shape.height.get_id()] = sizes[shape.shape_id]
+			for name in ["arrangement", "alignment", "proximity", "justification", "margin"]:
+				if name in shape.variables:
+					values[shape.variables[name].z3.get_id()] = get_value(shape.variables[name])
+		return values
+
+def get_value(variable):
+	# The value the variable's Z3 variable has for its assignment (see Solver.get_assignment_constraint)
+	if variable.name == "proximity" or variable.name == "margin":
+		return variable.domain[variable.assigned]
+	return variable.assigned
+
+def is_vertical(container):
+	arrangement = container.variables.arrangement
+	return arrangement.assigned == arrangement.domain.index("vertical")
+
+def half(shape, length):
+	# Half of a container's size is integer division in Z3, half of a leaf's size is a rational
+	if shape.type == "container":
+		return length // 2
+	return Fraction(length, 2)
+
+def is_integer(value):
+	return Fraction(value).denominator == 1
@@ -0,0 +1,136 @@
+import threading
+
+# Default histogram buckets in seconds, from fast /check calls to long solves
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+SOLUTION_BUCKETS = [0, 1, 2, 5, 10, 20, 50]
+
+# Minimal metrics in the Prometheus text exposition format
+class Metric(object):
+	def __init__(self, name, help_text, metric_type, label_names=[]):
+		self.name = name
+		self.help_text = help_text
+		self.metric_type = metric_type
+		self.label_names = label_names
+		self.values = dict()
+		self.lock = threading.Lock()
+
+	def get_key(self, labels):
+		return tuple(str(labels.get(label_name, "")) for label_name in self.label_names)
+
+	def format_labels(self, key, extra=None):
+		pairs = [(name, value) for name, value in zip(self.label_names, key)]
+		if extra is not None:
+			pairs.append(extra)
+
+		if not len(pairs):
+			return ""
+
+		escaped = [name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for name, value in pairs]
+		return "{" + ",".join(escaped) + "}"
+
+	def render(self):
+		lines = ["# HELP " + self.name + " " + self.help_text, "# TYPE " + self.name + " " + self.metric_type]
+		with self.lock:
+			for key in sorted(self.values.keys()):
+				lines.extend(self.render_value(key, self.values[key]))
+		return lines
+
+	def render_value(self, key, value):
+		return [self.name + self.format_labels(key) + " " + format_number(value)]
+
+class Counter(Metric):
+	def __init__(self, name, help_text, label_names=[]):
+		Metric.__init__(self, name, help_text, "counter", label_names)
+
+	def inc(self, amount=1, **labels):
+		key = self.get_key(labels)
+		with self.lock:
+			self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+	# The value is read from a function when the metrics are rendered (None leaves it out)
+	# Totals that are already counted somewhere else can be exposed the same way with metric_type="counter"
+	def __init__(self, name, help_text, get_value, metric_type="gauge"):
+		Metric.__init__(self, name, help_text, metric_type)
+		self.get_value = get_value
+
+	def render(self):
+		value = self.get_value()
+		with self.lock:
+			self.values = dict() if value is None else {(): value}
+		return Metric.render(self)
+
+class Histogram(Metric):
+	def __init__(self, name, help_text, label_names=[], buckets=LATENCY_BUCKETS):
+		Metric.__init__(self, name, help_text, "histogram", label_names)
+		self.buckets = buckets
+
+	def observe(self, value, **labels):
+		key = self.get_key(labels)
+		with self.lock:
+			if key not in self.values:
+				self.values[key] = {"counts": [0] * len(self.buckets), "sum": 0, "count": 0}
+
+			observations = self.values[key]
+			for i in range(0, len(self.buckets)):
+				if value <= self.buckets[i]:
+					observations["counts"][i] += 1
+			observations["sum"] += value
+			observations["count"] += 1
+
+	def render_value(self, key, observations):
+		lines = []
+		for bucket, count in zip(self.buckets, observations["counts"]):
+			lines.append(self.name + "_bucket" + self.format_labels(key, ("le", format_number(bucket))) + " " + str(count))
+		lines.append(self.name + "_bucket" + self.format_labels(key, ("le", "+Inf")) + " " + str(observations["count"]))
+		lines.append(self.name + "_sum" + self.format_labels(key) + " " + format_number(observations["sum"]))
+		lines.append(self.name + "_count" + self.format_labels(key) + " " + str(observations["count"]))
+		return lines
+
+class Registry(object):
+	def __init__(self):
+		self.metrics = []
+
+	def register(self, metric):
+		self.metrics.append(metric)
+		return metric
+
+	def render(self):
+		lines = []
+		for metric in self.metrics:
+			lines.extend(metric.render())
+		return "\n".join(lines) + "\n"
+
+def format_number(value):
+	if isinstance(value, float) and value.is_integer():
+		return str(int(value))
+	return str(value)
+
+REGISTRY = Registry()
+
+# HTTP
+request_latency = REGISTRY.register(Histogram("scout_request_duration_seconds", "Time to handle a request, per endpoint.", ["endpoint", "method"]))
+requests_total = REGISTRY.register(Counter("scout_requests_total", "Requests handled, per endpoint and status code.", ["endpoint", "method", "status"]))
+
+# Solver (fed from the counters custom_solver.Solver reports in its stats)
+solver_task_duration = REGISTRY.register(Histogram("scout_solver_task_duration_seconds", "Time from starting to finishing a solver task.", ["task", "status"]))
+z3_calls_total = REGISTRY.register(Counter("scout_z3_calls_total", "Calls to the Z3 solver.", ["task"]))
+z3_seconds_total = REGISTRY.register(Counter("scout_z3_seconds_total", "Time spent inside Z3 checks.", ["task"]))
+encoding_seconds_total = REGISTRY.register(Counter("scout_encoding_seconds_total", "Time spent building the assumption literals the search checks assignments with.", ["task"]))
+structure_seconds_total = REGISTRY.register(Counter("scout_structure_encoding_seconds_total", "Time spent encoding or looking up the structural constraints.", ["task"]))
+structure_cache_total = REGISTRY.register(Counter("scout_structure_cache_total", "Requests that reused (hit) or built (miss) the structural constraints.", ["task", "result"]))
+branches_pruned_total = REGISTRY.register(Counter("scout_branches_pruned_total", "Search branches pruned because Z3 found them unsatisfiable.", ["task"]))
+invalid_solutions_total = REGISTRY.register(Counter("scout_invalid_solutions_total", "Complete assignments that turned out to be unsatisfiable.", ["task"]))
+checks_timed_out_total = REGISTRY.register(Counter("scout_checks_timed_out_total", "Z3 checks that gave up because of a timeout or cancellation.", ["task"]))
+solutions_per_request = REGISTRY.register(Histogram("scout_solutions_per_request", "Number of solutions returned by a solve.", ["task"], buckets=SOLUTION_BUCKETS))
+
+def record_solver_stats(task, stats):
+	z3_calls_total.inc(stats.get("z3_calls", 0) + stats.get("filter_checks", 0), task=task)
+	z3_seconds_total.inc(stats.get("time_z3", 0), task=task)
+	encoding_seconds_total.inc(stats.get("time_encoding", 0), task=task)
+	structure_seconds_total.inc(stats.get("time_structure", 0), task=task)
+	branches_pruned_total.inc(stats.get("branches_pruned", 0), task=task)
+	invalid_solutions_total.inc(stats.get("invalid_solutions", 0), task=task)
+	checks_timed_out_total.inc(stats.get("checks_timed_out", 0), task=task)
+	if "structure_cached" in stats:
+		structure_cache_total.inc(1, task=task, result="hit" if stats["structure_cached"] else "miss")
@@ -0,0 +1,54 @@
+import collections
+import threading
+
+# Number of designs to keep the nogoods of, and the most nogoods kept for one design
+DEFAULT_MAX_ENTRIES = 256
+MAX_NOGOODS = 10000
+
+class NogoodStore(object):
+	# Sets of assignments that can't be solved together, learned from the unsat cores of the search.
+	# An assignment is a (variable key, domain index) pair. Each nogood is indexed by each of its assignments
+	# so finding the nogoods that a new assignment completes only looks at the ones that contain it.
+	def __init__(self, max_nogoods=MAX_NOGOODS):
+		self.max_nogoods = max_nogoods
+		self.nogoods = set()
+		self.watches = dict()
+
+	def __len__(self):
+		return len(self.nogoods)
+
+	def add(self, nogood):
+		# Returns whether the nogood was new
+		nogood = frozenset(nogood)
+		if nogood in self.nogoods or len(self.nogoods) >= self.max_nogoods:
+			return False
+
+		self.nogoods.add(nogood)
+		for assignment in nogood:
+			self.watches.setdefault(assignment, []).append(nogood)
+		return True
+
+	def find(self, assignment, assignments):
+		# Returns a nogood that contains the assignment and is part of the given set of assignments, or None
+		for nogood in self.watches.get(assignment, []):
+			if nogood <= assignments:
+				return nogood
+		return None
+
+class NogoodCache(object):
+	# Keeps the nogoods learned for recently solved designs. The key is the structure and the locks of the design,
+	# so only nogoods that follow from those are stored here (see search.SearchEngine.learn).
+	def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+		self.max_entries = max_entries
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+
+	def get_store(self, key):
+		with self.lock:
+			if key not in self.entries:
+				self.entries[key] = NogoodStore()
+			self.entries.move_to_end(key)
+			store = self.entries[key]
+			while len(self.entries) > self.max_entries:
+				self.entries.popitem(last=False)
+			return store
@@ -0,0 +1,146 @@
+import random
+import threading
+
+import custom_solver
+
+# Number of differently seeded searches to race against each other for one solve
+DEFAULT_NUM_SEARCHES = 4
+
+# Statistics that are added up over all of the searches in the portfolio
+SUMMED_STATS = ["invalid_solutions", "branches_pruned", "z3_calls", "time_z3", "time_encoding"]
+
+def solution_key(solution):
+	# Two solutions are the same design if all of the leaf level shapes are in the same place
+	# (this matches the output variables the solver uses to block repeated solutions)
+	key = []
+	for element_id, element in solution["elements"].items():
+		if element["type"] not in ["canvas", "page", "group", "labelGroup"]:
+			key.append((element_id, element["location"]["x"], element["location"]["y"]))
+	key.sort()
+	return tuple(key)
+
+class PortfolioSearch(object):
+	# Runs several randomized searches with different seeds on the solver pool and keeps the unique solutions
+	# from whichever searches find them first. Sends the same events as a single solver pool task
+	# ("started", "solution", "result", "error") to on_event.
+	def __init__(self, pool, payload, num_searches=DEFAULT_NUM_SEARCHES, on_event=None):
+		self.pool = pool
+		self.payload = payload
+		self.num_searches = max(1, num_searches)
+		self.num_solutions = payload.get("num_solutions", custom_solver.NUM_SOLUTIONS)
+		self.on_event = on_event
+
+		self.tasks = []
+		self.solutions = []
+		self.solution_keys = set()
+
+		# Latest stats reported by each search and the number of searches that have finished
+		self.search_stats = dict()
+		self.num_finished = 0
+		self.num_succeeded = 0
+		self.started = False
+		self.finished = False
+		self.lock = threading.Lock()
+		self.done = threading.Event()
+
+	def start(self):
+		base_seed = self.payload.get("seed")
+		if base_seed is None:
+			base_seed = random.randint(0, 2**31)
+
+		try:
+			for i in range(0, self.num_searches):
+				search_payload = dict(self.payload)
+				search_payload["seed"] = base_seed + i
+				on_event = lambda event_type, data, search_index=i: self.handle_event(search_index, event_type, data)
+				self.tasks.append(self.pool.submit("solve", search_payload, on_event=on_event))
+		except Exception:
+			# Don't leave part of the portfolio running if the pool couldn't take all of it
+			self.cancel()
+			raise
+		return self
+
+	def cancel(self):
+		for task in self.tasks:
+			task.cancel()
+
+	def result(self, timeout=None):
+		if not self.done.wait(timeout):
+			raise TimeoutError("Portfolio search did not finish in time")
+		return self.combined_result()
+
+	def handle_event(self, search_index, event_type, data):
+		# Called on the pool's dispatcher thread for every search in the portfolio
+		send = []
+		enough = False
+		with self.lock:
+			if self.finished:
+				return
+
+			if event_type == "started" and not self.started:
+				self.started = True
+				send.append(("started", None))
+			elif event_type == "solution":
+				self.search_stats[search_index] = data["stats"]
+				key = solution_key(data["solution"])
+				if key not in self.solution_keys and len(self.solutions) < self.num_solutions:
+					self.solution_keys.add(key)
+					self.solutions.append(data["solution"])
+
+					progress = dict()
+					progress["solution"] = data["solution"]
+					progress["stats"] = self.combined_stats()
+					send.append(("solution", progress))
+					enough = len(self.solutions) >= self.num_solutions
+			elif event_type == "result":
+				self.search_stats[search_index] = data["stats"]
+				self.num_finished += 1
+				self.num_succeeded += 1
+			elif event_type == "error":
+				self.num_finished += 1
+				print("Portfolio search failed: " + str(data))
+			elif event_type == "cancelled":
+				self.num_finished += 1
+
+			all_finished = self.num_finished == self.num_searches
+			if enough or all_finished:
+				self.finished = True
+				if len(self.solutions) or self.num_succeeded:
+					send.append(("result", self.combined_result()))
+				else:
+					send.append(("error", "All of the searches in the portfolio failed"))
+
+		if enough:
+			# The other searches are not needed anymore
+			self.cancel()
+
+		for event in send:
+			if self.on_event is not None:
+				self.on_event(*event)
+
+		if self.finished:
+			self.done.set()
+
+	def combined_stats(self):
+		stats = dict()
+		for key in SUMMED_STATS:
+			stats[key] = 0
+
+		for search_stats in self.search_stats.values():
+			for key in SUMMED_STATS:
+				stats[key] += search_stats.get(key, 0)
+
+		# One search trying every design is enough to know there are no more,
+		# but a time out in any of them means some designs might have been missed
+		stats["exhausted"] = any(search_stats.get("exhausted", False) for search_stats in self.search_stats.values())
+		stats["timed_out"] = any(search_stats.get("timed_out", False) for search_stats in self.search_stats.values())
+
+		stats["num_solutions"] = len(self.solutions)
+		stats["num_searches"] = self.num_searches
+		return stats
+
+	def combined_result(self):
+		result = dict()
+		result["solutions"] = sorted(self.solutions, key=lambda s: s["cost"])
+		result["stats"] = self.combined_stats()
+		return result
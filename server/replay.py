@@ -0,0 +1,190 @@
+# Replays /solve and /check requests recorded with SCOUT_RECORD_FILE and reports their latencies
+#
+# 	python replay.py requests.jsonl --concurrency 4
+# 	python replay.py requests.jsonl --url http://localhost:5000 --concurrency 8 -o replay.json
+#
+# Without --url the requests go through the server's routes in this process (with its own solver pool),
+# with --url they are sent to a running server. A /solve is timed until its job has finished.
+import argparse
+import concurrent.futures
+import json
+import math
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import request_recorder
+
+# Seconds between polls of /jobs/<job_id> while waiting for a replayed solve to finish
+JOB_POLL_SECONDS = 0.1
+
+# Endpoints that can be replayed
+REPLAYED_ENDPOINTS = ["/solve", "/solve/stream", "/check", "/check_batch"]
+
+class LocalClient(object):
+	# Sends the requests to the Flask app in this process
+	def __init__(self, check_cache=True):
+		import server
+		import check_cache as cc
+		self.app = server.app
+		if not check_cache:
+			server.check_results = cc.CheckCache(0)
+
+		# Start the solver processes now so the first requests aren't timed with their start up
+		server.get_job_manager()
+
+	def post(self, path, form):
+		response = self.app.test_client().post(path, data=form)
+		return response.status_code, response.get_data(as_text=True)
+
+	def get(self, path):
+		response = self.app.test_client().get(path)
+		return response.status_code, response.get_data(as_text=True)
+
+class HttpClient(object):
+	def __init__(self, url):
+		self.url = url.rstrip("/")
+
+	def post(self, path, form):
+		data = urllib.parse.urlencode(form).encode("utf-8")
+		return self.send(urllib.request.Request(self.url + path, data=data))
+
+	def get(self, path):
+		return self.send(urllib.request.Request(self.url + path))
+
+	def send(self, http_request):
+		try:
+			with urllib.request.urlopen(http_request) as response:
+				return response.status, response.read().decode("utf-8")
+		except urllib.error.HTTPError as error:
+			return error.code, error.read().decode("utf-8")
+
+def replay_record(client, record):
+	# Returns the latency of the request and what came out of it
+	form = dict(record["form"])
+
+	# Replayed solves from the same session would cancel each other
+	form.pop("session_id", None)
+
+	time_start = time.time()
+	endpoint = record["endpoint"]
+	if endpoint == "/solve/stream":
+		endpoint = "/solve"
+
+	status, body = client.post(endpoint, form)
+	outcome = dict()
+	outcome["http_status"] = status
+	if status == 200 and endpoint == "/solve":
+		job_id = json.loads(body)["job_id"]
+		while True:
+			status, body = client.get("/jobs/" + job_id)
+			job = json.loads(body)
+			if job["status"] in ["done", "failed", "cancelled"]:
+				break
+			time.sleep(JOB_POLL_SECONDS)
+		outcome["status"] = job["status"]
+		outcome["num_solutions"] = len(job["solutions"])
+	elif status == 200 and endpoint == "/check":
+		outcome["valid"] = json.loads(body)["result"]
+	elif status == 200 and endpoint == "/check_batch":
+		outcome["valid"] = [result["result"] for result in json.loads(body)["results"]]
+	return time.time() - time_start, outcome
+
+def percentile(values, percent):
+	# Nearest rank percentile
+	if not len(values):
+		return None
+	ordered = sorted(values)
+	rank = max(1, int(math.ceil(percent / 100.0 * len(ordered))))
+	return ordered[rank - 1]
+
+def summarize(durations):
+	summary = dict()
+	summary["count"] = len(durations)
+	summary["p50"] = percentile(durations, 50)
+	summary["p95"] = percentile(durations, 95)
+	summary["p99"] = percentile(durations, 99)
+	summary["max"] = max(durations) if len(durations) else None
+	return summary
+
+def replay(client, records, concurrency=1, repeat=1):
+	records = [record for record in records if record["endpoint"] in REPLAYED_ENDPOINTS] * repeat
+	results = []
+	with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+		futures = dict((executor.submit(replay_record, client, record), record) for record in records)
+		for future in concurrent.futures.as_completed(futures):
+			record = futures[future]
+			result = dict()
+			result["endpoint"] = record["endpoint"]
+			result["recorded_duration"] = record["duration"]
+			result["recorded_outcome"] = record["outcome"]
+			try:
+				result["duration"], result["outcome"] = future.result()
+			except Exception as error:
+				result["error"] = str(error)
+			results.append(result)
+	return results
+
+def report(results):
+	by_endpoint = dict()
+	for result in results:
+		by_endpoint.setdefault(result["endpoint"], []).append(result)
+
+	summary = dict()
+	for endpoint, endpoint_results in sorted(by_endpoint.items()):
+		replayed = [result["duration"] for result in endpoint_results if "duration" in result]
+		summary[endpoint] = dict()
+		summary[endpoint]["replayed"] = summarize(replayed)
+		summary[endpoint]["recorded"] = summarize([result["recorded_duration"] for result in endpoint_results])
+		summary[endpoint]["errors"] = len([result for result in endpoint_results if "error" in result or result["outcome"]["http_status"] != 200])
+		summary[endpoint]["changed"] = len([result for result in endpoint_results if "outcome" in result and outcome_changed(result)])
+	return summary
+
+def outcome_changed(result):
+	# Whether the replayed request came out differently than when it was recorded
+	recorded = result["recorded_outcome"]
+	replayed = result["outcome"]
+	if "valid" in recorded:
+		return recorded["valid"] != replayed.get("valid")
+	if "status" in recorded:
+		return recorded["status"] != replayed.get("status")
+	return False
+
+def print_report(summary):
+	for endpoint, endpoint_summary in summary.items():
+		print(endpoint + ": " + str(endpoint_summary["replayed"]["count"]) + " requests, " + str(endpoint_summary["errors"]) + " errors, " +
+			str(endpoint_summary["changed"]) + " with a different outcome than recorded")
+		for name in ["replayed", "recorded"]:
+			latencies = endpoint_summary[name]
+			if latencies["count"]:
+				print("  " + name.ljust(8) + "  p50 %.3fs  p95 %.3fs  p99 %.3fs  max %.3fs" % (latencies["p50"], latencies["p95"], latencies["p99"], latencies["max"]))
+
+def main():
+	parser = argparse.ArgumentParser(description='Replay recorded solver requests and report their latencies')
+	parser.add_argument("records", help="file recorded with SCOUT_RECORD_FILE")
+	parser.add_argument("-u", "--url", dest="url", help="address of a running server (default: replay in this process)", default=None)
+	parser.add_argument("-c", "--concurrency", dest="concurrency", help="number of requests to send at once (default:%(default)s)", type=int, default=1)
+	parser.add_argument("-r", "--repeat", dest="repeat", help="number of times to replay each request (default:%(default)s)", type=int, default=1)
+	parser.add_argument("--no-check-cache", dest="check_cache", action="store_false",
+						help="don't answer repeated /check requests from the cache (only when replaying in this process)", default=True)
+	parser.add_argument("-o", "--output", dest="output", help="file to save the latency of every request to as JSON", default=None)
+	cmd_args = parser.parse_args()
+
+	records = request_recorder.read_records(cmd_args.records)
+	client = HttpClient(cmd_args.url) if cmd_args.url is not None else LocalClient(cmd_args.check_cache)
+
+	time_start = time.time()
+	results = replay(client, records, max(1, cmd_args.concurrency), max(1, cmd_args.repeat))
+	print("Replayed " + str(len(results)) + " requests in %.2f seconds" % (time.time() - time_start), file=sys.stderr)
+
+	summary = report(results)
+	print_report(summary)
+
+	if cmd_args.output is not None:
+		with open(cmd_args.output, "w") as output_file:
+			json.dump({"summary": summary, "requests": results}, output_file, indent=2)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,31 @@
+import json
+import threading
+import time
+
+class RequestRecorder(object):
+	# Appends the form of each solver request, how long it took and what came out of it to a file as JSON lines
+	# so slow requests can be replayed later (see replay.py)
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+
+	def record(self, endpoint, form, time_start, outcome):
+		line = dict()
+		line["time"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(time_start))
+		line["endpoint"] = endpoint
+		line["form"] = form
+		line["duration"] = time.time() - time_start
+		line["outcome"] = outcome
+
+		text = json.dumps(line) + "\n"
+		with self.lock:
+			with open(self.path, "a") as record_file:
+				record_file.write(text)
+
+def read_records(path):
+	records = []
+	with open(path) as record_file:
+		for line in record_file:
+			if len(line.strip()):
+				records.append(json.loads(line))
+	return records
@@ -0,0 +1,173 @@
+# Measures how the solver scales with the size and shape of the constraints tree
+#
+# 	python scaling_benchmark.py --depth 0,1,2 --fan-out 2,3,4,5 --lock-density 0,0.5 -o scaling.json --plot scaling.png
+#
+# Every combination of the parameters is generated with design_generator and solved in a new process,
+# so the peak memory of each run can be measured and a run that takes too long can be stopped.
+# Plotting needs matplotlib, which is not one of the server's requirements.
+import argparse
+import contextlib
+import copy
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import custom_solver
+import design_generator
+
+# Seconds to wait past the time budget for a run to return before it is killed
+# (the budget is only checked between calls to Z3 and encoding a large tree can take a while)
+KILL_GRACE_SECONDS = 30
+
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+def get_peak_memory():
+	# Peak resident memory of this process in megabytes (ru_maxrss is in kilobytes on Linux and bytes on macOS)
+	try:
+		import resource
+	except ImportError:
+		return None
+
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+def run_config(conn, config, num_solutions, seed, time_budget):
+	# Runs in its own process
+	design = design_generator.generate_design(config["depth"], config["fan_out"], config["leaf_width"], config["leaf_height"],
+		config["lock_density"], seed)
+
+	with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+		time_start = time.time()
+		solver = custom_solver.Solver(copy.deepcopy(design.elements), [], design.canvas_width, design.canvas_height,
+			seed=seed, num_solutions=num_solutions, time_budget=time_budget)
+		time_encoded = time.time()
+		solver.solve()
+		time_total = time.time() - time_start
+
+	stats = solver.stats()
+	result = dict()
+	result["num_leaves"] = design_generator.count_leaves(design.elements)
+	result["num_shapes"] = len(solver.shapes)
+	result["num_variables"] = len(solver.variables)
+	result["num_assertions"] = len(solver.solver.assertions())
+	result["time_encoding_structure"] = time_encoded - time_start
+	result["time_first_solution"] = stats["solution_times"][0] if len(stats["solution_times"]) else None
+	result["time_total"] = time_total
+	result["num_solutions"] = stats["num_solutions"]
+	result["z3_calls"] = stats["z3_calls"]
+	result["branches_pruned"] = stats["branches_pruned"]
+	result["exhausted"] = stats["exhausted"]
+	result["timed_out"] = stats["timed_out"]
+	result["peak_memory_mb"] = get_peak_memory()
+	conn.send(result)
+
+def run_in_process(config, num_solutions, seed, time_budget):
+	parent_conn, child_conn = MP_CONTEXT.Pipe(duplex=False)
+	process = MP_CONTEXT.Process(target=run_config, args=(child_conn, config, num_solutions, seed, time_budget), daemon=True)
+	process.start()
+	child_conn.close()
+
+	timeout = time_budget + KILL_GRACE_SECONDS if time_budget is not None else None
+	result = dict(config)
+	if parent_conn.poll(timeout):
+		try:
+			result.update(parent_conn.recv())
+		except EOFError:
+			result["error"] = "The solver process exited with code " + str(process.exitcode)
+	else:
+		process.terminate()
+		result["error"] = "Killed after " + str(timeout) + " seconds"
+	process.join()
+	return result
+
+def sweep(depths, fan_outs, lock_densities, leaf_width, leaf_height, num_solutions, seed, time_budget):
+	results = []
+	for depth, fan_out, lock_density in itertools.product(depths, fan_outs, lock_densities):
+		config = dict()
+		config["depth"] = depth
+		config["fan_out"] = fan_out
+		config["lock_density"] = lock_density
+		config["leaf_width"] = leaf_width
+		config["leaf_height"] = leaf_height
+
+		print("depth " + str(depth) + ", fan out " + str(fan_out) + ", lock density " + str(lock_density) + "...", file=sys.stderr)
+		result = run_in_process(config, num_solutions, seed, time_budget)
+		results.append(result)
+		print("  " + format_result(result), file=sys.stderr)
+	return results
+
+def format_result(result):
+	if "error" in result:
+		return result["error"]
+
+	first = "-" if result["time_first_solution"] is None else "%.3fs" % result["time_first_solution"]
+	return (str(result["num_leaves"]) + " leaves, " + str(result["num_assertions"]) + " assertions, encoded in %.3fs, " % result["time_encoding_structure"] +
+		"first solution " + first + ", " + str(result["num_solutions"]) + " solutions in %.3fs, " % result["time_total"] +
+		("%.0f MB" % result["peak_memory_mb"] if result["peak_memory_mb"] is not None else ""))
+
+def plot(results, path):
+	try:
+		import matplotlib
+		matplotlib.use("Agg")
+		import matplotlib.pyplot as plt
+	except ImportError:
+		print("matplotlib is not installed, skipping the plot.", file=sys.stderr)
+		return
+
+	figure, (time_axis, memory_axis) = plt.subplots(1, 2, figsize=(12, 5))
+	series = sorted(set((result["depth"], result["lock_density"]) for result in results))
+	for depth, lock_density in series:
+		points = sorted([result for result in results if result["depth"] == depth and result["lock_density"] == lock_density and "error" not in result],
+			key=lambda result: result["num_leaves"])
+		label = "depth " + str(depth) + ", locks " + str(lock_density)
+		leaves = [result["num_leaves"] for result in points]
+		time_axis.plot(leaves, [result["time_total"] for result in points], marker="o", label=label)
+		memory_axis.plot(leaves, [result["peak_memory_mb"] for result in points], marker="o", label=label)
+
+	time_axis.set_xlabel("leaves")
+	time_axis.set_ylabel("solve time (s)")
+	time_axis.set_yscale("log")
+	memory_axis.set_xlabel("leaves")
+	memory_axis.set_ylabel("peak memory (MB)")
+	time_axis.legend()
+	figure.tight_layout()
+	figure.savefig(path)
+
+def parse_list(value, value_type):
+	return [value_type(item) for item in value.split(",")]
+
+def parse_range(value):
+	low, high = parse_list(value, int)
+	return (low, high)
+
+def main():
+	parser = argparse.ArgumentParser(description='Measure how solving scales with the depth, fan out and locks of the constraints tree')
+	parser.add_argument("--depth", dest="depths", help="levels of groups below the page (default:%(default)s)", default="0,1,2")
+	parser.add_argument("--fan-out", dest="fan_outs", help="children of the page and each group (default:%(default)s)", default="2,3,4")
+	parser.add_argument("--lock-density", dest="lock_densities", help="fraction of containers with a locked property (default:%(default)s)", default="0")
+	parser.add_argument("--leaf-width", dest="leaf_width", help="smallest and largest leaf width (default:%(default)s)", default="20,60")
+	parser.add_argument("--leaf-height", dest="leaf_height", help="smallest and largest leaf height (default:%(default)s)", default="10,30")
+	parser.add_argument("-n", "--solutions", dest="num_solutions",
+						help="number of solutions to find for each tree (default:%(default)s)", type=int, default=custom_solver.NUM_SOLUTIONS)
+	parser.add_argument("-s", "--seed", dest="seed", help="random seed for generating and solving (default:%(default)s)", type=int, default=1)
+	parser.add_argument("-t", "--time-budget", dest="time_budget",
+						help="maximum seconds to search for each tree (default:%(default)s)", type=float, default=60)
+	parser.add_argument("-o", "--output", dest="output", help="file to save the results to as JSON", default=None)
+	parser.add_argument("--plot", dest="plot", help="image file to plot the solve time and memory to (needs matplotlib)", default=None)
+	cmd_args = parser.parse_args()
+
+	results = sweep(parse_list(cmd_args.depths, int), parse_list(cmd_args.fan_outs, int), parse_list(cmd_args.lock_densities, float),
+		parse_range(cmd_args.leaf_width), parse_range(cmd_args.leaf_height), cmd_args.num_solutions, cmd_args.seed, cmd_args.time_budget)
+
+	if cmd_args.output is not None:
+		with open(cmd_args.output, "w") as output_file:
+			json.dump(results, output_file, indent=2)
+
+	if cmd_args.plot is not None:
+		plot(results, cmd_args.plot)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,389 @@
+import time
+
+from z3 import sat, unsat, Bool, Implies, And
+
+import layout_engine
+import nogood_store
+
+# Name of the literal that guards the constraints the search adds to block the solutions it found
+BLOCKED_SOLUTIONS = "search_blocked_solutions"
+
+# Start of the tracking names of the constraints blocking previous solutions (see ConstraintBuilder.init_previous_solution_constraints)
+PREVIOUS_SOLUTION_PREFIX = "prevent previous solution"
+
+# Heuristics for choosing the next variable to assign. Each returns the index in engine.unassigned of the variable.
+# Ties are broken at random so different seeds still search differently.
+def select_random(engine):
+	return engine.owner.random.randint(0, len(engine.unassigned) - 1)
+
+def select_last(engine):
+	# The order of Solver.init_variables: the container arrangements, then the alignments and proximities
+	return len(engine.unassigned) - 1
+
+def select_first_fail(engine):
+	# The variable with the fewest feasible values left
+	return select_min(engine, lambda variable: len(variable.get_feasible_values()))
+
+def select_dom_wdeg(engine):
+	# The variable with the fewest feasible values for how often it was part of a nogood
+	return select_min(engine, lambda variable: len(variable.get_feasible_values()) / (1.0 + engine.weights[variable.key()]))
+
+def select_top_down(engine):
+	# The variables of the canvas and the outer containers first, and a container's arrangement before its other variables
+	return select_min(engine, lambda variable: (engine.depths[variable.key()], variable.name != "arrangement"))
+
+def select_min(engine, score):
+	scores = [score(variable) for variable in engine.unassigned]
+	best = min(scores)
+	return engine.owner.random.choice([index for index in range(0, len(scores)) if scores[index] == best])
+
+ORDERINGS = {
+	"random": select_random,
+	"last": select_last,
+	"first_fail": select_first_fail,
+	"dom_wdeg": select_dom_wdeg,
+	"top_down": select_top_down,
+}
+
+DEFAULT_ORDERING = "random"
+
+# "dfs" returns solutions in the order the search finds them, "beam" orders the values of each variable
+# by the estimated cost of the layouts they lead to, keeps the best few and returns the lowest cost designs of the ones it finds
+SEARCH_MODES = ["dfs", "beam"]
+DEFAULT_SEARCH_MODE = "dfs"
+
+# Number of values of each variable beam search keeps, and how many designs it finds for each one it returns
+DEFAULT_BEAM_WIDTH = 3
+BEAM_CANDIDATES = 3
+
+class Frame(object):
+	# One level of the search: the variable assigned at this depth and the values left to try for it
+	def __init__(self, variable, unassigned_index, values):
+		self.variable = variable
+
+		# Where the variable was in the list of unassigned variables so it can be put back in the same place
+		self.unassigned_index = unassigned_index
+
+		# Indexes into the variable's domain in the order they are tried, and the next one to try
+		self.values = values
+		self.cursor = 0
+
+		# Models already found for some of the values (see BeamSearchEngine), and the number of times
+		# the search had added blocking constraints then, since a model found before a block might be blocked
+		self.models = dict()
+		self.num_blocked = 0
+
+class SearchEngine(object):
+	# Depth first search over the decision variables of a custom_solver.Solver.
+	# The search is kept on an explicit stack instead of in recursive calls, so it can stop after finding a solution
+	# (or when the solver asks it to stop) and later continue from the same place for the next one.
+	# Nothing is pushed on the Z3 solver for the assignments. Each check passes the assignment literals of the
+	# values on the stack as assumptions, so Z3 keeps what it learned between sibling values.
+	#
+	# When a check is unsat, the assignments in its unsat core are recorded as a nogood. Assignments that contain
+	# a nogood are skipped without calling Z3, and the search jumps back to the deepest variable in the nogood.
+	# Nogoods that only follow from the structure and locks go in the owner's store, which is kept for the design,
+	# the ones that involve blocked solutions only hold for this search.
+	#
+	# Once every variable has a value, the layout is computed directly by a layout_engine.LayoutEngine when the
+	# owner uses one and it supports the tree, so only the partial assignments are checked with Z3.
+	#
+	# The variables are ordered by one of the ORDERINGS. The ordering of the values and the check of an assignment
+	# are methods so other search strategies can replace them.
+	def __init__(self, owner, ordering=DEFAULT_ORDERING):
+		if ordering not in ORDERINGS:
+			raise ValueError("Unknown variable ordering: " + str(ordering))
+		self.select = ORDERINGS[ordering]
+		self.owner = owner
+		self.solver = owner.solver
+		self.variables = owner.variables
+		self.stack = []
+
+		# Variables with a single feasible value (see Solver.filter_domains) are fixed for the whole search
+		# and only the others are branched on
+		self.fixed = []
+		self.unassigned = []
+		for variable in owner.variables:
+			values = variable.get_feasible_values()
+			if len(values) == 1:
+				variable.assigned = values[0]
+				self.fixed.append(variable)
+			else:
+				self.unassigned.append(variable)
+		self.started = False
+		self.exhausted = False
+
+		# The constraints blocking found solutions only apply while this literal is assumed
+		self.blocked = Bool(BLOCKED_SOLUTIONS)
+
+		# The assignment each literal stands for, to read the unsat cores
+		self.literal_assignments = dict()
+		for variable in owner.variables:
+			for index in range(0, len(variable.literals)):
+				self.literal_assignments[str(variable.literals[index])] = (variable.key(), index)
+
+		self.nogoods = owner.nogoods if owner.nogoods is not None else nogood_store.NogoodStore()
+		self.search_nogoods = nogood_store.NogoodStore()
+
+		# Number of nogoods each variable was part of (for dom_wdeg) and how deep its shape is in the hierarchy (for top_down)
+		self.weights = dict((variable.key(), 0) for variable in owner.variables)
+
+		# Number of times constraints were added with add_to_base
+		self.num_blocked = 0
+		self.depths = dict()
+		self.set_depths(owner.root, 0)
+
+		# Computes the layouts of complete assignments, and the model of the last one it computed
+		self.layout = None
+		self.layout_model = None
+		if owner.use_layout_engine: 
+			self.layout = layout_engine.LayoutEngine(owner)
+			if self.layout.is_supported(): 
+				self.layout.block_previous_solutions(owner.previous_solutions)
+			else: 
+				print("Checking complete assignments with Z3: " + self.layout.unsupported_reason)
+				self.layout = None
+
+	def set_depths(self, shape, depth):
+		# Keyed by the variables since the canvas variables don't use the canvas's shape id
+		for variable in shape.variables.toDict().values():
+			self.depths[variable.key()] = depth
+		for child in getattr(shape, "children", []):
+			self.set_depths(child, depth + 1)
+
+	def select_variable(self):
+		# Returns the index in self.unassigned of the variable to assign next
+		return self.select(self)
+
+	def order_values(self, variable):
+		# Returns the domain indexes of the variable in the order they should be tried
+		values = variable.get_feasible_values()
+		self.owner.random.shuffle(values)
+		return values
+
+	def get_assigned(self):
+		return self.fixed + [frame.variable for frame in self.stack if frame.variable.assigned is not None]
+
+	def get_assumptions(self):
+		# Counted as the encoding time, since the assumptions take the place of encoding the assignment
+		time_encoding_start = time.time()
+		assumptions = [self.blocked] + [variable.literals[variable.assigned] for variable in self.get_assigned()]
+		self.owner.time_encoding += time.time() - time_encoding_start
+		return assumptions
+
+	def try_assign(self, frame, value):
+		# Returns whether the values on the stack with this value for the frame's variable can still be solved
+		frame.variable.assigned = value
+
+		assignments = set((variable.key(), variable.assigned) for variable in self.get_assigned())
+		assignment = (frame.variable.key(), value)
+		nogood = self.nogoods.find(assignment, assignments)
+		if nogood is None:
+			nogood = self.search_nogoods.find(assignment, assignments)
+		if nogood is not None:
+			self.owner.nogood_hits += 1
+			self.backjump(nogood)
+			return False
+
+		self.layout_model = None
+		if self.layout is not None and not len(self.unassigned): 
+			return self.check_layout()
+
+		time_z3_start = time.time()
+		result = self.owner.check_within_budget(self.get_assumptions())
+		self.owner.z3_calls += 1
+		self.owner.time_z3 += time.time() - time_z3_start
+		if result == unsat:
+			self.backjump(self.learn())
+		return result == sat
+
+	def check_layout(self):
+		# Complete assignments don't need Z3. An assignment without a layout isn't learned from since it is never tried again.
+		time_layout_start = time.time()
+		self.layout_model = self.layout.solve()
+		self.owner.layout_checks += 1
+		self.owner.time_layout += time.time() - time_layout_start
+		return self.layout_model is not None
+
+	def last_model(self):
+		# Model of the last check that succeeded
+		if self.layout_model is not None: 
+			return self.layout_model
+		return self.solver.model()
+
+	def learn(self):
+		# Records the assignments in the unsat core of the last check as a nogood and returns it.
+		# The core can also name tracked structural and lock constraints, which the owner's store is kept for,
+		# and the blocked or previous solutions, which means the nogood only holds for this search.
+		nogood = []
+		for_search_only = False
+		for literal in self.solver.unsat_core():
+			name = str(literal)
+			if name in self.literal_assignments:
+				nogood.append(self.literal_assignments[name])
+				self.weights[self.literal_assignments[name][0]] += 1
+			elif name == BLOCKED_SOLUTIONS or name.startswith(PREVIOUS_SOLUTION_PREFIX):
+				for_search_only = True
+
+		store = self.search_nogoods if for_search_only else self.nogoods
+		if store.add(nogood):
+			self.owner.nogoods_learned += 1
+		return frozenset(nogood)
+
+	def backjump(self, nogood):
+		# No assignment below the deepest variable of the nogood can be solved,
+		# so the values left to try for the variables after it are skipped
+		variable_keys = set(variable_key for variable_key, index in nogood)
+		deepest = -1
+		for depth in range(0, len(self.stack)):
+			if self.stack[depth].variable.key() in variable_keys:
+				deepest = depth
+
+		if deepest < len(self.stack) - 1:
+			self.owner.backjumps += 1
+			for frame in self.stack[deepest + 1:]:
+				frame.cursor = len(frame.values)
+
+	def push_frame(self):
+		index = self.select_variable()
+		variable = self.unassigned.pop(index)
+		self.stack.append(Frame(variable, index, self.order_values(variable)))
+
+	def pop_frame(self):
+		frame = self.stack.pop()
+		frame.variable.assigned = None
+		self.unassigned.insert(frame.unassigned_index, frame.variable)
+
+	def unassign(self, frame):
+		frame.variable.assigned = None
+
+	def next_solution(self):
+		# Continues the search until every variable has a value that Z3 can solve and returns the model.
+		# Returns None when there are no assignments left (exhausted is set) or the solver asked to stop,
+		# in which case calling it again continues where it stopped.
+		if not self.started:
+			self.started = True
+			if not len(self.unassigned):
+				# Every variable is fixed, so there is only the one assignment to check
+				self.exhausted = True
+				return self.check_fixed()
+			self.push_frame()
+
+		while len(self.stack):
+			if self.owner.stop_requested():
+				return None
+
+			frame = self.stack[-1]
+			self.unassign(frame)
+			if frame.cursor >= len(frame.values):
+				# Every value of this variable has been tried under the values above it
+				self.pop_frame()
+				continue
+
+			value = frame.values[frame.cursor]
+			frame.cursor += 1
+			if self.try_assign(frame, value):
+				if not len(self.unassigned):
+					return self.get_model(frame, value)
+				self.push_frame()
+			elif not len(self.unassigned):
+				self.owner.invalid_solutions += 1
+			else:
+				self.owner.branches_pruned += 1
+
+		self.exhausted = True
+		return None
+
+	def get_model(self, frame, value):
+		# Model of the last successful check, for the value just assigned to the frame's variable
+		return self.last_model()
+
+	def check_fixed(self):
+		if self.layout is not None: 
+			if self.check_layout(): 
+				return self.layout_model
+			self.owner.invalid_solutions += 1
+			return None
+
+		time_z3_start = time.time()
+		result = self.owner.check_within_budget(self.get_assumptions())
+		self.owner.z3_calls += 1
+		self.owner.time_z3 += time.time() - time_z3_start
+		if result == sat:
+			return self.solver.model()
+		self.owner.invalid_solutions += 1
+		return None
+
+	def add_to_base(self, constraints):
+		# Adds constraints that hold for the rest of the search (e.g. to block a solution)
+		# They go in the scope solve() pushed for the search, so they are removed when the solver is released.
+		# They are guarded by a literal so the unsat cores show when they were needed.
+		if isinstance(constraints, list):
+			constraints = And(constraints)
+		self.solver.add(Implies(self.blocked, constraints))
+		self.num_blocked += 1
+
+	def block_solution(self, model):
+		# The search can't find a solution with the same outputs as this one again
+		self.add_to_base(self.owner.get_previous_solution_constraint(model))
+		if self.layout is not None: 
+			self.layout.block_layout(model)
+
+class BeamSearchEngine(SearchEngine):
+	# Heuristic beam search. Checks every feasible value of a variable as soon as it is chosen, and estimates the cost of
+	# each value with the symmetry cost of the layout in the model Z3 returns for it (one completion of the values assigned so far).
+	# The values are tried from the lowest estimate and only the beam_width best are kept. Values whose estimate is
+	# higher than the owner's cost cutoff (the cost of the k-th best design found so far) are dropped too.
+	# The symmetry cost depends on where every shape ends up, so a partial assignment doesn't bound it: the estimate
+	# is only a guess, and the designs the search returns are not guaranteed to be the lowest cost ones.
+	def __init__(self, owner, ordering=DEFAULT_ORDERING, beam_width=DEFAULT_BEAM_WIDTH):
+		SearchEngine.__init__(self, owner, ordering)
+		self.beam_width = max(1, beam_width)
+
+		# Whether any value was skipped for its cost, in which case running out of values doesn't mean there are no more designs
+		self.pruned_by_cost = False
+
+	def push_frame(self):
+		SearchEngine.push_frame(self)
+		frame = self.stack[-1]
+		cutoff = self.owner.get_cost_cutoff()
+
+		scored = []
+		for value in frame.values:
+			if not self.try_assign(frame, value):
+				self.owner.branches_pruned += 1
+				if frame.cursor >= len(frame.values):
+					# The nogood showed that none of the values can be solved
+					break
+				continue
+
+			model = self.last_model()
+			cost = self.owner.estimate_cost(model)
+			if cutoff is not None and cost > cutoff:
+				self.owner.cost_pruned += 1
+				self.pruned_by_cost = True
+				continue
+			scored.append((cost, value))
+			frame.models[value] = model
+		frame.variable.assigned = None
+
+		scored.sort()
+		if len(scored) > self.beam_width:
+			self.owner.cost_pruned += len(scored) - self.beam_width
+			self.pruned_by_cost = True
+		frame.values = [value for cost, value in scored[0:self.beam_width]]
+		frame.num_blocked = self.num_blocked
+
+	def try_assign(self, frame, value):
+		# A value that was already checked is still solvable, unless it was for the last variable and a solution
+		# has been blocked since (the check gives the solution itself)
+		if value in frame.models and (len(self.unassigned) or frame.num_blocked == self.num_blocked):
+			frame.variable.assigned = value
+			return True
+		frame.models.pop(value, None)
+		return SearchEngine.try_assign(self, frame, value)
+
+	def get_model(self, frame, value):
+		if value in frame.models:
+			return frame.models.pop(value)
+		return self.last_model()
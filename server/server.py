@@ -1,5 +1,5 @@
 # server.py
-from flask import Flask, render_template, request
+from flask import Flask, Response, render_template, request
 import json
 import base64
 # import solver
@@ -7,12 +7,73 @@ import base64
 import uuid
 import random
 import copy
-import custom_solver
+import math
+import os
+import atexit
+import threading
+import time
+import jobs
+import solver_pool
+import check_cache
+import batch_check
+import metrics
+import request_recorder
+import search
 
 app = Flask(__name__, static_folder="../static/dist", template_folder="../static")
 DEFAULT_APP_HEIGHT = 667
 DEFAULT_APP_WIDTH = 375
 
+# Size of the solver process pool and of its queue of waiting tasks
+# Can also be set with the --workers and --queue-size options when running this file directly
+SOLVER_WORKERS = int(os.environ.get("SCOUT_SOLVER_WORKERS", solver_pool.DEFAULT_NUM_WORKERS))
+SOLVER_QUEUE_SIZE = int(os.environ.get("SCOUT_SOLVER_QUEUE_SIZE", solver_pool.DEFAULT_MAX_QUEUE))
+
+# Number of differently seeded searches to race for each solve (1 turns the portfolio off)
+# Can be changed per request with the "portfolio" form field
+PORTFOLIO_SIZE = int(os.environ.get("SCOUT_PORTFOLIO_SIZE", 1))
+
+# Solving happens in the worker processes of the pool so the request threads are not blocked
+# Both are created on the first request so the Flask reloader process doesn't start its own workers
+pool = None
+job_manager = None
+pool_lock = threading.Lock()
+
+# Default limit in seconds on how long a solve can search before returning the solutions found so far
+# Requests can also send their own "time_budget" and "check_timeout" (for a single call to Z3)
+SOLVE_TIME_BUDGET = os.environ.get("SCOUT_SOLVE_TIME_BUDGET")
+SOLVE_TIME_BUDGET = float(SOLVE_TIME_BUDGET) if SOLVE_TIME_BUDGET is not None else None
+
+# Results of /check for constraints trees and solutions that have been checked before
+CHECK_CACHE_SIZE = int(os.environ.get("SCOUT_CHECK_CACHE_SIZE", check_cache.DEFAULT_MAX_ENTRIES))
+check_results = check_cache.CheckCache(CHECK_CACHE_SIZE)
+
+# Seconds between keepalive messages on a solution stream when no new solutions are found
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Set SCOUT_RECORD_FILE to record every /solve and /check request with its timing and outcome,
+# so slow requests can be replayed later with replay.py
+RECORD_FILE = os.environ.get("SCOUT_RECORD_FILE")
+recorder = request_recorder.RequestRecorder(RECORD_FILE) if RECORD_FILE is not None else None
+
+@app.before_request
+def start_request_timer(): 
+	request.time_start = time.time()
+
+@app.after_request
+def record_request_metrics(response): 
+	# Label by the route pattern (e.g. /jobs/<job_id>) so each job doesn't get its own series
+	# Streamed responses are timed until the stream starts, the solve itself shows up in the solver task metrics
+	endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+	if hasattr(request, "time_start"): 
+		metrics.request_latency.observe(time.time() - request.time_start, endpoint=endpoint, method=request.method)
+	metrics.requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+	return response
+
+@app.route("/metrics")
+def metrics_endpoint(): 
+	return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/")
 def index():
 	return render_template("index.html")
@@ -37,25 +98,204 @@ def solve():
 	form_data = request.form
 
 	if "elements" in form_data and "solutions" in form_data:
-		elements_json = form_data["elements"]
-		solutions_json = form_data["solutions"]
-		elements = json.loads(elements_json)
-		solutions = json.loads(solutions_json)
-
-		relative_designs = dict() 
-		if "relative_designs" in form_data: 
-			relative_designs_json = form_data["relative_designs"]
-			relative_designs = json.loads(relative_designs_json)
+		job = submit_solve_job(form_data)
 
-		solutions = get_solution_from_custom_solver(elements, solutions, relative_designs)
-
-		# Output dictionary 
+		# Queue up the solve and return the job ID right away
+		# The client polls /jobs/<job_id> for the progress and the results
 		output = dict() 
-		output["solutions"] = solutions
+		output["job_id"] = job.job_id
 
 		return json.dumps(output).encode('utf-8')
 	return ""
 
+@app.route('/solve/stream', methods=['POST','GET'])
+def solve_stream(): 
+	print("solving (streaming)!")
+	# Also accept the query string so the endpoint can be used from an EventSource
+	form_data = request.values
+
+	if "elements" in form_data and "solutions" in form_data:
+		job = submit_solve_job(form_data)
+
+		# Each solution is sent as a server-sent event as soon as the solver finds it
+		return Response(stream_job_events(job), mimetype="text/event-stream")
+	return ""
+
+def get_job_manager(): 
+	global pool, job_manager
+	with pool_lock: 
+		if pool is None: 
+			pool = solver_pool.SolverPool(SOLVER_WORKERS, SOLVER_QUEUE_SIZE)
+			job_manager = jobs.JobManager(pool, on_job_finished=on_job_finished)
+			atexit.register(pool.close)
+	return job_manager
+
+def get_solver_pool(): 
+	return get_job_manager().pool
+
+def on_job_finished(kind, job): 
+	metrics.solver_task_duration.observe(job.elapsed(), task=kind, status=job.status)
+	metrics.record_solver_stats(kind, job.stats)
+	if job.status != "failed": 
+		metrics.solutions_per_request.observe(len(job.solutions), task=kind)
+
+	if recorder is not None and job.request is not None: 
+		endpoint, form, time_start = job.request
+		outcome = dict()
+		outcome["status"] = job.status
+		outcome["num_solutions"] = len(job.solutions)
+		outcome["stats"] = job.stats
+		if job.error is not None: 
+			outcome["error"] = job.error
+		recorder.record(endpoint, form, time_start, outcome)
+
+def get_pool_size(get_value): 
+	# Leaves the pool metrics out until the pool has been started by the first solve or check
+	return lambda: get_value(pool) if pool is not None else None
+
+metrics.REGISTRY.register(metrics.Gauge("scout_solver_queue_length", "Solver tasks waiting for a free worker.", get_pool_size(lambda p: p.queue_length())))
+metrics.REGISTRY.register(metrics.Gauge("scout_solver_workers_busy", "Solver worker processes running a task.", get_pool_size(lambda p: p.num_busy())))
+metrics.REGISTRY.register(metrics.Gauge("scout_solver_workers", "Solver worker processes in the pool.", get_pool_size(lambda p: p.num_workers)))
+metrics.REGISTRY.register(metrics.Gauge("scout_check_cache_hits_total", "Trees and solutions answered from the /check cache.", lambda: check_results.hits, metric_type="counter"))
+metrics.REGISTRY.register(metrics.Gauge("scout_check_cache_misses_total", "Trees and solutions that were not in the /check cache.", lambda: check_results.misses, metric_type="counter"))
+
+@app.errorhandler(solver_pool.PoolFull)
+def solver_pool_full(error): 
+	output = dict()
+	output["error"] = str(error)
+	return json.dumps(output).encode('utf-8'), 503
+
+class InvalidRequest(Exception): 
+	pass
+
+@app.errorhandler(InvalidRequest)
+def invalid_request(error): 
+	output = dict()
+	output["error"] = str(error)
+	return json.dumps(output).encode('utf-8'), 400
+
+def get_number(form_data, name, parse, minimum=None, positive=False): 
+	# Parses a numeric form field (int or float) and checks that it is in range
+	kind = "an integer" if parse is int else "a number"
+	try: 
+		value = parse(form_data[name])
+	except ValueError: 
+		value = None
+
+	if value is None or not math.isfinite(value): 
+		raise InvalidRequest("\"" + name + "\" must be " + kind + ", got " + repr(form_data[name]))
+	if positive and value <= 0: 
+		raise InvalidRequest("\"" + name + "\" must be more than 0, got " + repr(form_data[name]))
+	if minimum is not None and value < minimum: 
+		raise InvalidRequest("\"" + name + "\" must be at least " + str(minimum) + ", got " + repr(form_data[name]))
+	return value
+
+def submit_solve_job(form_data): 
+	elements_json = form_data["elements"]
+	solutions_json = form_data["solutions"]
+	elements = json.loads(elements_json)
+	solutions = json.loads(solutions_json)
+
+	relative_designs = dict() 
+	if "relative_designs" in form_data: 
+		relative_designs_json = form_data["relative_designs"]
+		relative_designs = json.loads(relative_designs_json)
+
+	payload = dict()
+	payload["elements"] = elements
+	payload["solutions"] = solutions
+	payload["relative_designs"] = relative_designs
+	payload["canvas_width"] = DEFAULT_APP_WIDTH
+	payload["canvas_height"] = DEFAULT_APP_HEIGHT
+
+	if "seed" in form_data: 
+		payload["seed"] = get_number(form_data, "seed", int)
+
+	payload["time_budget"] = SOLVE_TIME_BUDGET
+	if "time_budget" in form_data: 
+		payload["time_budget"] = get_number(form_data, "time_budget", float, positive=True)
+
+	if "check_timeout" in form_data: 
+		payload["check_timeout"] = get_number(form_data, "check_timeout", float, positive=True)
+
+	# Heuristic for the order the search assigns the variables in (see search.ORDERINGS)
+	if "ordering" in form_data: 
+		if form_data["ordering"] not in search.ORDERINGS: 
+			raise InvalidRequest("Unknown \"ordering\" " + repr(form_data["ordering"]) + ", expected one of " + ", ".join(sorted(search.ORDERINGS)))
+		payload["ordering"] = form_data["ordering"]
+
+	# "beam" returns the lowest cost designs of more that it finds (see search.BeamSearchEngine)
+	if "search" in form_data: 
+		if form_data["search"] not in search.SEARCH_MODES: 
+			raise InvalidRequest("Unknown \"search\" " + repr(form_data["search"]) + ", expected one of " + ", ".join(search.SEARCH_MODES))
+		payload["search_mode"] = form_data["search"]
+	if "beam_width" in form_data: 
+		payload["beam_width"] = get_number(form_data, "beam_width", int, 1)
+
+	# Debugging flag to get back how long each phase of the solve took
+	payload["trace"] = is_flag_set(form_data, "trace")
+
+	num_searches = PORTFOLIO_SIZE
+	if "portfolio" in form_data: 
+		num_searches = get_number(form_data, "portfolio", int, 1)
+
+	# A newer solve for the same design session cancels the one still running
+	session_id = form_data.get("session_id")
+
+	# The worker keeps the search of a session's last solve so "continue" can pick it up where it stopped
+	# instead of starting over (not for portfolios, whose searches run on different workers)
+	if session_id is not None and num_searches == 1: 
+		payload["search_session"] = session_id
+	payload["continue"] = is_flag_set(form_data, "continue")
+
+	# The request is recorded once the job has finished
+	job_request = (request.path, form_data.to_dict(), request.time_start) if recorder is not None else None
+
+	return get_job_manager().submit("solve", payload, num_searches=num_searches, session_id=session_id, request=job_request)
+
+def is_flag_set(form_data, name): 
+	return form_data.get(name, "false").lower() in ["true", "1"]
+
+def stream_job_events(job): 
+	# Let the client know which job this is so it can still look it up on /jobs/<job_id>
+	yield format_event("job", {"job_id": job.job_id})
+
+	num_events = 0
+	finished = False
+	while not finished: 
+		events = job.wait_for_events(num_events, timeout=STREAM_KEEPALIVE_SECONDS)
+		if not len(events): 
+			# SSE comment line to keep the connection open while the solver is searching
+			yield ": keepalive\n\n"
+
+		for event_type, data in events: 
+			yield format_event(event_type, data)
+			finished = event_type == "done" or event_type == "failed" or event_type == "cancelled"
+		num_events += len(events)
+
+def format_event(event_type, data): 
+	return "event: " + event_type + "\ndata: " + json.dumps(data) + "\n\n"
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id): 
+	job = get_job_manager().get(job_id)
+	if job is None: 
+		output = dict()
+		output["error"] = "Unknown job " + job_id
+		return json.dumps(output).encode('utf-8'), 404
+
+	return json.dumps(job.to_json()).encode('utf-8')
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id): 
+	job = get_job_manager().cancel(job_id)
+	if job is None: 
+		output = dict()
+		output["error"] = "Unknown job " + job_id
+		return json.dumps(output).encode('utf-8'), 404
+
+	return json.dumps(job.to_json()).encode('utf-8')
+
 @app.route('/check', methods=['POST','GET'])
 def check(): 
 	print("checking!")
@@ -70,12 +310,56 @@ def check():
 
 		# Will return the status of whether the current set of constraints is valid
 		# and also update the valid state of each of the previous solutions
-		result = check_solution_exists_and_validate_previous_solutions(elements, solutions)
+		# When debugging with the "trace" flag the cache is skipped so the trace shows the solver's work
+		trace = is_flag_set(form_data, "trace")
+		if trace: 
+			result = run_check(elements, solutions, trace=True)
+		else: 
+			result = check_solution_exists_and_validate_previous_solutions(elements, solutions)
 
 		# Don't return back any results, just the status of whether it could be solved or not
 		output = dict() 
 		output["result"] = result["valid"]
 		output["solutions"] = result["solutions"]
+		if trace: 
+			output["trace"] = result["trace"]
+
+		if recorder is not None: 
+			outcome = dict()
+			outcome["valid"] = result["valid"]
+			outcome["solutions_valid"] = [solution["valid"] for solution in result["solutions"]]
+			recorder.record(request.path, form_data.to_dict(), request.time_start, outcome)
+		return json.dumps(output).encode('utf-8')
+	return ""
+
+@app.route('/check_batch', methods=['POST'])
+def check_batch(): 
+	print("checking batch!")
+
+	form_data = request.form
+
+	if "designs" in form_data:
+		# List of {"elements": ..., "solutions": [...]} to validate
+		designs_json = form_data["designs"]
+		designs = json.loads(designs_json)
+
+		results = batch_check.check_batch(get_solver_pool(), designs, DEFAULT_APP_WIDTH, DEFAULT_APP_HEIGHT)
+		for result in results: 
+			metrics.record_solver_stats("check_batch", result["stats"])
+
+		# Same format as the output of /check for each design
+		output = dict()
+		output["results"] = []
+		for result in results: 
+			design_output = dict()
+			design_output["result"] = result["valid"]
+			design_output["solutions"] = result["solutions"]
+			output["results"].append(design_output)
+
+		if recorder is not None: 
+			outcome = dict()
+			outcome["valid"] = [result["valid"] for result in results]
+			recorder.record(request.path, form_data.to_dict(), request.time_start, outcome)
 		return json.dumps(output).encode('utf-8')
 	return ""
 
@@ -99,15 +383,24 @@ def check():
 # 	return json.dumps(output).encode('utf-8')
 
 def check_solution_exists_and_validate_previous_solutions(elements, solutions):
-	solver = custom_solver.Solver(elements, solutions, DEFAULT_APP_WIDTH, DEFAULT_APP_HEIGHT)
-	result = solver.check()
+	# Trees and solutions that were checked before (e.g. after an undo) are answered from the cache
+	return check_results.check(elements, solutions, run_check)
+
+def run_check(elements, solutions, trace=False): 
+	payload = dict()
+	payload["elements"] = elements
+	payload["solutions"] = solutions
+	payload["canvas_width"] = DEFAULT_APP_WIDTH
+	payload["canvas_height"] = DEFAULT_APP_HEIGHT
+	payload["trace"] = trace
+
+	# Runs on one of the pool's worker processes, this thread only waits for the result
+	time_start = time.time()
+	result = get_solver_pool().run("check", payload)
+	metrics.solver_task_duration.observe(time.time() - time_start, task="check", status="done")
+	metrics.record_solver_stats("check", result["stats"])
 	return result
 
-def get_solution_from_custom_solver(elements, solutions, relative_designs): 
-	solver = custom_solver.Solver(elements, solutions, DEFAULT_APP_WIDTH, DEFAULT_APP_HEIGHT, relative_designs=relative_designs)
-	solutions = solver.solve()
-	return solutions
-
 def get_solution_from_solver(elements, canvas_width, canvas_height, tags): 
 	layout_solver = solver.LayoutSolver(elements, canvas_width, canvas_height, tags)
 	solutions = layout_solver.solve()
@@ -194,8 +487,14 @@ if __name__ == "__main__":
 						help="run in debug mode (for use with PyCharm)", default=False)
 	parser.add_argument("-p", "--port", dest="port",
 						help="port of server (default:%(default)s)", type=int, default=5000)
+	parser.add_argument("-w", "--workers", dest="workers",
+						help="number of solver processes (default:%(default)s)", type=int, default=SOLVER_WORKERS)
+	parser.add_argument("-q", "--queue-size", dest="queue_size",
+						help="maximum number of solver tasks waiting for a worker (default:%(default)s)", type=int, default=SOLVER_QUEUE_SIZE)
 
 	cmd_args = parser.parse_args()
+	SOLVER_WORKERS = cmd_args.workers
+	SOLVER_QUEUE_SIZE = cmd_args.queue_size
 	app_options = {"port": cmd_args.port}
 
 	if cmd_args.debug_mode:
@@ -0,0 +1,94 @@
+from z3 import Not
+
+class SizeBounds(object):
+	# Smallest and largest width and height each container can have, propagated up the hierarchy from the leaf sizes.
+	# Along its arrangement a container is as long as its children and the proximity between them, and across it
+	# as wide as its widest child (see ConstraintBuilder.arrange_container), so the bounds of the children and the
+	# proximity domain bound the container for each arrangement and proximity value.
+	#
+	# A container also has to fit in the canvas minus the smallest margin. Arrangement and proximity values that make
+	# the container too large for any value of the other one can't be solved and are removed (see Solver.filter_domains),
+	# and the bounds of the container only cover the values that are left.
+	def __init__(self, root, canvas_width, canvas_height):
+		# Shape id -> (min width, max width, min height, max height)
+		self.bounds = dict()
+
+		# Variable key -> domain indexes that can't be solved
+		self.removed = dict()
+		self.containers = []
+
+		for child in getattr(root, "children", []):
+			max_width = canvas_width
+			max_height = canvas_height
+			if root.type == "canvas" and child is root.children[0]:
+				# The page stays inside the canvas minus the margin
+				margin = min(root.variables.margin.domain)
+				max_width = min(max_width, root.width - 2 * margin)
+				max_height = min(max_height, root.height - 2 * margin)
+			self.propagate(child, max_width, max_height)
+
+	def num_removed(self):
+		return sum([len(indexes) for indexes in self.removed.values()])
+
+	def is_removed(self, variable, index):
+		return index in self.removed.get(variable.key(), [])
+
+	def propagate(self, shape, max_width, max_height):
+		# Returns the bounds of the shape, which has to fit in max_width by max_height
+		if shape.type != "container":
+			return (shape.width, shape.width, shape.height, shape.height)
+
+		# Children are inside the container, so they have to fit in the same space
+		children = [self.propagate(child, max_width, max_height) for child in shape.children]
+		if not len(children):
+			return (0, max_width, 0, max_height)
+
+		arrangement = shape.variables.arrangement
+		proximity = shape.variables.proximity
+		fits = dict()
+		for arrangement_index in range(0, len(arrangement.domain)):
+			vertical = arrangement.domain[arrangement_index] == "vertical"
+			for proximity_index in range(0, len(proximity.domain)):
+				bounds = arrange(children, vertical, proximity.domain[proximity_index])
+				fits[(arrangement_index, proximity_index)] = (bounds, bounds[0] <= max_width and bounds[2] <= max_height)
+
+		feasible = [bounds for bounds, fit in fits.values() if fit]
+		self.removed[arrangement.key()] = [index for index in range(0, len(arrangement.domain))
+			if not any(fits[(index, proximity_index)][1] for proximity_index in range(0, len(proximity.domain)))]
+		self.removed[proximity.key()] = [index for index in range(0, len(proximity.domain))
+			if not any(fits[(arrangement_index, index)][1] for arrangement_index in range(0, len(arrangement.domain)))]
+		if not len(feasible):
+			# The container can't fit with any values. The bounds stay valid for its parent, which can't be solved either.
+			feasible = [bounds for bounds, fit in fits.values()]
+
+		bounds = (min([bounds[0] for bounds in feasible]), min(max_width, max([bounds[1] for bounds in feasible])),
+			min([bounds[2] for bounds in feasible]), min(max_height, max([bounds[3] for bounds in feasible])))
+		self.bounds[shape.shape_id] = bounds
+		self.containers.append(shape)
+		return bounds
+
+	def get_constraints(self, solver):
+		# Constraints on the container sizes and the values removed, for the structure of the given custom_solver.Solver
+		constraints = []
+		for container in self.containers:
+			min_width, max_width, min_height, max_height = self.bounds[container.shape_id]
+			constraints.append(container.width >= min_width)
+			constraints.append(container.width <= max_width)
+			constraints.append(container.height >= min_height)
+			constraints.append(container.height <= max_height)
+
+		for variable in solver.variables:
+			for index in self.removed.get(variable.key(), []):
+				constraints.append(Not(solver.get_assignment_constraint(variable, index)))
+		return constraints
+
+def arrange(children, vertical, proximity):
+	# Bounds of a container with the given children bounds, arrangement and proximity
+	space = proximity * (len(children) - 1)
+	widths = (max([child[0] for child in children]), max([child[1] for child in children]))
+	heights = (max([child[2] for child in children]), max([child[3] for child in children]))
+	if vertical:
+		heights = (sum([child[2] for child in children]) + space, sum([child[3] for child in children]) + space)
+	else:
+		widths = (sum([child[0] for child in children]) + space, sum([child[1] for child in children]) + space)
+	return (widths[0], widths[1], heights[0], heights[1])
@@ -0,0 +1,55 @@
+import collections
+import threading
+
+# Number of encoded designs to keep and the approximate memory they can use
+DEFAULT_MAX_ENTRIES = 32
+DEFAULT_MAX_MEGABYTES = 256
+
+class CachedSolver(object):
+	def __init__(self, layers, size):
+		# Layered Z3 solver with the structural constraints of a design asserted at its base scope
+		# and the lock and previous solution layers of the last request that used it
+		self.layers = layers
+
+		# Approximate memory used by the encoding (the length of its SMT-LIB text)
+		self.size = size
+
+class SolverCache(object):
+	# Keeps the Z3 solvers for recently used design structures so a request only has to replace
+	# the locks and previous solution layers that changed. A solver is checked out while a request
+	# uses it so two requests never share one.
+	def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_megabytes=DEFAULT_MAX_MEGABYTES):
+		self.max_entries = max_entries
+		self.max_bytes = max_megabytes * 1024 * 1024
+		self.entries = collections.OrderedDict()
+		self.total_size = 0
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def checkout(self, structure_key):
+		with self.lock:
+			if structure_key not in self.entries:
+				self.misses += 1
+				return None
+
+			self.hits += 1
+			cached = self.entries.pop(structure_key)
+			self.total_size -= cached.size
+			return cached
+
+	def checkin(self, structure_key, cached):
+		# The caller must have ended its search so only the structure and the layers are left
+		with self.lock:
+			if structure_key in self.entries:
+				# Another request encoded the same structure in the meantime, keep the newest one
+				self.total_size -= self.entries.pop(structure_key).size
+
+			if cached.size > self.max_bytes:
+				return
+
+			self.entries[structure_key] = cached
+			self.total_size += cached.size
+			while len(self.entries) > self.max_entries or self.total_size > self.max_bytes:
+				key, evicted = self.entries.popitem(last=False)
+				self.total_size -= evicted.size
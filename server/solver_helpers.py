@@ -1,8 +1,9 @@
-from z3 import Int, String, StringVal
+from z3 import Int, String, StringVal, Bool
 import copy 
 import uuid 
 import numpy as np
 import math
+import tracing
 
 CANVAS_WIDTH = 375
 CANVAS_HEIGHT = 667
@@ -31,6 +32,9 @@ class Variable(object):
 		self.domain = domain
 		self.type = varType
 
+		# Indexes of the domain values that can still be solved with the design's structure and locks (None until filtered)
+		self.feasible = None
+
 		# Z3 Variable for testing (??)
 		if self.type == "str": 
 			self.z3 = String(shape_id + "_" + name)
@@ -40,6 +44,19 @@ class Variable(object):
 	def domain(self, domain): 
 		self.domain = domain
 
+	def get_assignment_literals(self): 
+		# One Boolean for each value in the domain that stands for the variable having that value
+		# The solver asserts what each of them means once, then assignments can be checked as assumptions
+		return [Bool(self.shape_id + "_" + self.name + "_is_" + str(index)) for index in range(0, len(self.domain))]
+
+	def key(self): 
+		return self.shape_id + "_" + self.name
+
+	def get_feasible_values(self): 
+		if self.feasible is None: 
+			return list(range(0, len(self.domain)))
+		return list(self.feasible)
+
 	def assign(self, value): 
 		self.assigned = value
 
@@ -54,8 +71,9 @@ class Variable(object):
 		return element[self.name]
 
 class Solution(object): 
-	def __init__(self): 
+	def __init__(self, tracer=None): 
 		self.variables = []
+		self.tracer = tracer if tracer is not None else tracing.NO_TRACE
 
 	def add_assigned_variable(self, variable): 
 		self.variables.append(variable)
@@ -87,6 +105,16 @@ class Solution(object):
 		total = total_lr # + total_tb
 		return int(total)
 
+	def compute_cost_from_model(self, shapes, model): 
+		# Symmetry cost of the layout in the model, without converting it to JSON
+		cost_matrix = np.zeros((CANVAS_HEIGHT, CANVAS_WIDTH), dtype=np.uint8)
+		for shape in shapes.values(): 
+			if shape.type == "leaf": 
+				adj_x = int(model[shape.variables.x.z3].as_string())
+				adj_y = int(model[shape.variables.y.z3].as_string())
+				cost_matrix[adj_y:(adj_y+shape.height-1),adj_x:(adj_x+shape.width-1)] = 1
+		return self.compute_symmetry_cost(cost_matrix)
+
 	def convert_to_json(self, shapes, model):
 		sln = dict()
 		cost_matrix = np.zeros((CANVAS_HEIGHT, CANVAS_WIDTH), dtype=np.uint8)
@@ -147,7 +175,8 @@ class Solution(object):
 					# Only the locations of leaf level shapes to compute the symmetry cost
 					cost_matrix[adj_y:(adj_y+height-1),adj_x:(adj_x+width-1)] = 1
 
-		cost = self.compute_symmetry_cost(cost_matrix)
+		with self.tracer.span("symmetry_cost"): 
+			cost = self.compute_symmetry_cost(cost_matrix)
 
 		# print("Total cost: " + str(cost))
 		sln["elements"] = new_elements
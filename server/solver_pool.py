@@ -0,0 +1,262 @@
+import collections
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+import traceback
+import uuid
+
+import solver_tasks
+
+# Z3 solving is single threaded, so by default run one solver process per core
+DEFAULT_NUM_WORKERS = os.cpu_count() or 1
+
+# Maximum number of tasks waiting for a free worker before new submissions are rejected
+DEFAULT_MAX_QUEUE = 64
+
+# Start the workers fresh instead of forking so they don't inherit the server's threads or Z3 state
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+# Number of affinity keys to remember the worker for
+MAX_AFFINITIES = 4096
+
+class PoolFull(Exception):
+	pass
+
+class TaskFailed(Exception):
+	pass
+
+class TaskCancelled(TaskFailed):
+	pass
+
+class Task(object):
+	def __init__(self, pool, task_id, kind, payload, on_event=None, affinity=None):
+		self.pool = pool
+		self.task_id = task_id
+		self.kind = kind
+		self.payload = payload
+		self.on_event = on_event
+		self.affinity = affinity
+		self.status = "queued"
+		self.result_value = None
+		self.error = None
+		self.cancelled = False
+		self.finished = threading.Event()
+
+	def result(self, timeout=None):
+		# Blocks until the task has finished on a worker and returns its result
+		if not self.finished.wait(timeout):
+			raise TimeoutError("Solver task " + self.task_id + " did not finish in time")
+
+		if self.status == "cancelled":
+			raise TaskCancelled("Solver task " + self.task_id + " was cancelled before it started")
+
+		if self.error is not None:
+			raise TaskFailed(self.error)
+		return self.result_value
+
+	def cancel(self):
+		# A running task stops at its next check and still sends back what it found so far
+		self.pool.cancel(self)
+
+	def handle_event(self, event_type, data):
+		# Called on the pool's dispatcher thread for each message the worker sends back
+		if event_type == "started":
+			self.status = "running"
+		elif event_type == "result":
+			self.status = "done"
+			self.result_value = data
+		elif event_type == "error":
+			self.status = "failed"
+			self.error = data
+		elif event_type == "cancelled":
+			self.status = "cancelled"
+
+		if self.on_event is not None:
+			try:
+				self.on_event(event_type, data)
+			except Exception:
+				traceback.print_exc()
+
+		if event_type == "result" or event_type == "error" or event_type == "cancelled":
+			self.finished.set()
+
+class Worker(object):
+	def __init__(self, index):
+		self.index = index
+		self.conn, child_conn = MP_CONTEXT.Pipe()
+
+		# Set by the pool to ask the worker to stop the task it is running
+		self.cancel_event = MP_CONTEXT.Event()
+		self.process = MP_CONTEXT.Process(target=worker_main, args=(child_conn, self.cancel_event), daemon=True)
+		self.process.start()
+		child_conn.close()
+		self.task = None
+
+	def send(self, message):
+		self.conn.send_bytes(json.dumps(message).encode('utf-8'))
+
+class SolverPool(object):
+	def __init__(self, num_workers=DEFAULT_NUM_WORKERS, max_queue=DEFAULT_MAX_QUEUE):
+		self.num_workers = max(1, num_workers)
+		self.max_queue = max_queue
+		self.pending = collections.deque()
+		self.lock = threading.Lock()
+		self.closed = False
+
+		# Worker index for each affinity key. Tasks with the same key always run on the same worker
+		# so they can use state the worker kept from the earlier ones
+		self.affinities = collections.OrderedDict()
+
+		self.workers = [Worker(i) for i in range(0, self.num_workers)]
+
+		# Written to whenever a task is submitted so the dispatcher thread wakes up and hands it out
+		self.wakeup_reader, self.wakeup_writer = MP_CONTEXT.Pipe(duplex=False)
+
+		self.dispatcher = threading.Thread(target=self.dispatch_loop, name="solver-pool-dispatcher", daemon=True)
+		self.dispatcher.start()
+
+	def submit(self, kind, payload, on_event=None, affinity=None):
+		# The payload must be JSON-serializable since it is sent to another process
+		task = Task(self, uuid.uuid4().hex, kind, payload, on_event, affinity)
+		with self.lock:
+			if self.closed:
+				raise PoolFull("The solver pool has been shut down")
+
+			if len(self.pending) >= self.max_queue:
+				raise PoolFull("Too many solver tasks are waiting (" + str(len(self.pending)) + ")")
+
+			self.pending.append(task)
+			self.wakeup_writer.send_bytes(b"")
+		return task
+
+	def run(self, kind, payload, timeout=None):
+		return self.submit(kind, payload).result(timeout)
+
+	def cancel(self, task):
+		cancelled_before_start = False
+		with self.lock:
+			task.cancelled = True
+			if task in self.pending:
+				self.pending.remove(task)
+				cancelled_before_start = True
+			else:
+				for worker in self.workers:
+					if worker.task is task:
+						worker.cancel_event.set()
+
+		if cancelled_before_start:
+			task.handle_event("cancelled", None)
+
+	def queue_length(self):
+		with self.lock:
+			return len(self.pending)
+
+	def num_busy(self):
+		with self.lock:
+			return len([worker for worker in self.workers if worker.task is not None])
+
+	def dispatch_loop(self):
+		while not self.closed:
+			self.assign_tasks()
+
+			connections = [worker.conn for worker in self.workers]
+			connections.append(self.wakeup_reader)
+			ready = multiprocessing.connection.wait(connections)
+			for conn in ready:
+				if conn is self.wakeup_reader:
+					conn.recv_bytes()
+					continue
+
+				worker = [w for w in self.workers if w.conn is conn][0]
+				try:
+					message = json.loads(conn.recv_bytes().decode('utf-8'))
+				except (EOFError, OSError):
+					self.replace_worker(worker)
+					continue
+
+				task_id, event_type, data = message
+				task = worker.task
+				if task is None or task.task_id != task_id:
+					continue
+
+				if event_type == "result" or event_type == "error":
+					worker.task = None
+				task.handle_event(event_type, data)
+
+	def assign_tasks(self):
+		with self.lock:
+			free_workers = [worker for worker in self.workers if worker.task is None]
+			for task in list(self.pending):
+				if not len(free_workers):
+					break
+
+				if task.affinity in self.affinities:
+					# Waits for its worker without holding up the tasks behind it
+					worker = self.workers[self.affinities[task.affinity]]
+					self.affinities.move_to_end(task.affinity)
+					if worker not in free_workers:
+						continue
+				else:
+					worker = free_workers[0]
+					if task.affinity is not None:
+						self.affinities[task.affinity] = worker.index
+						while len(self.affinities) > MAX_AFFINITIES:
+							self.affinities.popitem(last=False)
+
+				free_workers.remove(worker)
+				self.pending.remove(task)
+				worker.task = task
+				worker.send([task.task_id, task.kind, task.payload])
+
+	def replace_worker(self, worker):
+		# The worker process died (crashed inside of Z3 or was killed), fail its task and start a new one
+		print("Solver worker " + str(worker.index) + " exited unexpectedly, restarting it.")
+		task = worker.task
+		worker.conn.close()
+		with self.lock:
+			self.workers[worker.index] = Worker(worker.index)
+
+		if task is not None:
+			task.handle_event("error", "The solver process exited while running the task")
+
+	def close(self):
+		with self.lock:
+			self.closed = True
+			self.wakeup_writer.send_bytes(b"")
+			for worker in self.workers:
+				try:
+					worker.send(None)
+				except (OSError, ValueError):
+					pass
+
+		for worker in self.workers:
+			worker.process.join(timeout=1)
+			if worker.process.is_alive():
+				worker.process.terminate()
+
+def worker_main(conn, cancel_event):
+	# Runs in each worker process. Receives one task at a time and sends back its events and result
+	while True:
+		try:
+			message = json.loads(conn.recv_bytes().decode('utf-8'))
+		except (EOFError, OSError):
+			break
+
+		if message is None:
+			break
+
+		task_id, kind, payload = message
+
+		def emit(event_type, data):
+			conn.send_bytes(json.dumps([task_id, event_type, data]).encode('utf-8'))
+
+		cancel_event.clear()
+		emit("started", None)
+		try:
+			with solver_tasks.watch_for_cancel(cancel_event):
+				result = solver_tasks.run_task(kind, payload, emit, cancel_event.is_set)
+			emit("result", result)
+		except Exception:
+			emit("error", traceback.format_exc())
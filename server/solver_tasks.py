@@ -0,0 +1,185 @@
+import collections
+import contextlib
+import os
+import threading
+import z3
+import custom_solver
+import solver_cache
+import domain_cache
+import nogood_store
+import design_hash
+import tracing
+import search
+
+DEFAULT_APP_HEIGHT = 667
+DEFAULT_APP_WIDTH = 375
+
+# Encoded solvers for the design structures this worker process has seen recently
+solvers = solver_cache.SolverCache(int(os.environ.get("SCOUT_SOLVER_CACHE_SIZE", solver_cache.DEFAULT_MAX_ENTRIES)), 
+	int(os.environ.get("SCOUT_SOLVER_CACHE_MB", solver_cache.DEFAULT_MAX_MEGABYTES)))
+
+# Domains of the decision variables left after filtering, for the designs (structure and locks) this worker has solved
+domains = domain_cache.DomainCache(int(os.environ.get("SCOUT_DOMAIN_CACHE_SIZE", domain_cache.DEFAULT_MAX_ENTRIES)))
+
+# Nogoods learned by the searches of the designs this worker has solved
+nogoods = nogood_store.NogoodCache(int(os.environ.get("SCOUT_NOGOOD_CACHE_SIZE", nogood_store.DEFAULT_MAX_ENTRIES)))
+
+# How often the cancel watcher checks whether the task has been cancelled
+CANCEL_POLL_SECONDS = 0.05
+
+# Searches kept for design sessions so "show more" can continue them instead of starting over
+# (the pool sends every solve of a session to the same worker)
+MAX_SEARCH_SESSIONS = int(os.environ.get("SCOUT_SEARCH_SESSIONS", 8))
+search_sessions = collections.OrderedDict()
+
+class SearchSession(object):
+	def __init__(self, design_key, solver):
+		# design_key identifies the constraints and the search options the search was started with
+		self.design_key = design_key
+		self.solver = solver
+
+def end_search_session(session_id):
+	# Gives the session's encoded solver back to the cache
+	session = search_sessions.pop(session_id, None)
+	if session is not None:
+		session.solver.release()
+
+def keep_search_session(session_id, session):
+	search_sessions[session_id] = session
+	search_sessions.move_to_end(session_id)
+	while len(search_sessions) > MAX_SEARCH_SESSIONS:
+		end_search_session(next(iter(search_sessions)))
+
+@contextlib.contextmanager
+def watch_for_cancel(cancel_event):
+	# Started around each task in a worker process. The search checks for cancellation between calls to Z3, 
+	# but a single check can run for a long time, so it is interrupted as soon as the task is cancelled.
+	# Only a running check is interrupted (see custom_solver.RunningCheck), so it is tried again until the search stops,
+	# and the watcher is stopped before the task returns so a late cancel can't interrupt the next task.
+	done = threading.Event()
+	def watch():
+		while not done.is_set():
+			if cancel_event.is_set():
+				custom_solver.running_check.interrupt()
+			done.wait(CANCEL_POLL_SECONDS)
+
+	# An interrupt left over from before would fail the first push of the task
+	custom_solver.clear_interrupt()
+	watcher = threading.Thread(target=watch, name="solver-cancel-watcher", daemon=True)
+	watcher.start()
+	try: 
+		yield
+	finally: 
+		done.set()
+		watcher.join()
+
+# Work that can be sent to the solver pool
+# Every task takes a JSON-serializable payload and returns a JSON-serializable result
+# emit(event_type, data) sends progress back to the process that submitted the task
+# should_stop() becomes true when the task has been cancelled
+def run_task(kind, payload, emit, should_stop=None):
+	if kind not in TASKS:
+		raise ValueError("Unknown solver task: " + str(kind))
+
+	# Phase timings are returned with the result when the payload asks for a "trace",
+	# and written to SCOUT_TRACE_FILE for every task when that is set
+	return_trace = payload.get("trace", False)
+	tracer = tracing.Tracer(kind, enabled=return_trace or tracing.TRACE_FILE is not None)
+	try: 
+		with tracing.profile(kind), tracer.span(kind): 
+			result = TASKS[kind](payload, emit, should_stop, tracer)
+	finally: 
+		if tracing.TRACE_FILE is not None: 
+			tracer.write(tracing.TRACE_FILE)
+
+	if return_trace and isinstance(result, dict): 
+		result["trace"] = tracer.to_json()
+	return result
+
+def solve(payload, emit, should_stop, tracer):
+	def on_solution(solution, stats):
+		progress = dict()
+		progress["solution"] = solution
+		progress["stats"] = stats
+		emit("solution", progress)
+
+	canvas_width = payload.get("canvas_width", DEFAULT_APP_WIDTH)
+	canvas_height = payload.get("canvas_height", DEFAULT_APP_HEIGHT)
+	num_solutions = payload.get("num_solutions", custom_solver.NUM_SOLUTIONS)
+
+	# A session's search can only be continued if the constraints are the same as when it was started
+	session_id = payload.get("search_session")
+	ordering = payload.get("ordering", search.DEFAULT_ORDERING)
+	search_mode = payload.get("search_mode", search.DEFAULT_SEARCH_MODE)
+	beam_width = payload.get("beam_width", search.DEFAULT_BEAM_WIDTH)
+	design_key = design_hash.canonical_hash([payload["elements"], canvas_width, canvas_height, payload.get("relative_designs", dict()), 
+		ordering, search_mode, beam_width])
+	session = search_sessions.get(session_id) if session_id is not None else None
+	if session is not None and payload.get("continue", False) and session.design_key == design_key:
+		search_sessions.move_to_end(session_id)
+		try: 
+			solutions = session.solver.continue_solve(payload["solutions"], num_solutions, on_solution, should_stop, 
+				payload.get("time_budget"), payload.get("check_timeout"), tracer)
+		except Exception:
+			end_search_session(session_id)
+			raise
+
+		result = dict()
+		result["solutions"] = solutions
+		result["stats"] = session.solver.stats()
+		return result
+
+	if session_id is not None: 
+		end_search_session(session_id)
+
+	solver = custom_solver.Solver(payload["elements"], payload["solutions"],
+		canvas_width, canvas_height, relative_designs=payload.get("relative_designs", dict()), on_solution=on_solution, 
+		seed=payload.get("seed"), num_solutions=num_solutions, should_stop=should_stop, 
+		solver_cache=solvers, time_budget=payload.get("time_budget"), check_timeout=payload.get("check_timeout"), tracer=tracer, 
+		domain_cache=domains, nogood_cache=nogoods, ordering=ordering, search_mode=search_mode, beam_width=beam_width)
+	kept = False
+	try: 
+		solutions = solver.solve()
+		if session_id is not None: 
+			# Keep the search going for the session instead of giving the solver back
+			keep_search_session(session_id, SearchSession(design_key, solver))
+			kept = True
+	finally: 
+		if not kept: 
+			solver.release()
+
+	result = dict()
+	result["solutions"] = solutions
+	result["stats"] = solver.stats()
+	return result
+
+def check(payload, emit, should_stop, tracer):
+	solver = custom_solver.Solver(payload["elements"], payload["solutions"],
+		payload.get("canvas_width", DEFAULT_APP_WIDTH), payload.get("canvas_height", DEFAULT_APP_HEIGHT), solver_cache=solvers, tracer=tracer)
+	try: 
+		result = solver.check()
+	finally: 
+		solver.release()
+
+	result["stats"] = solver.stats()
+	return result
+
+def check_batch(payload, emit, should_stop, tracer):
+	# The designs in a batch usually share a structure, so after the first one the encoding comes from the cache
+	results = []
+	for design in payload["designs"]:
+		if should_stop is not None and should_stop():
+			break
+
+		design_payload = dict(design)
+		design_payload["canvas_width"] = payload.get("canvas_width", DEFAULT_APP_WIDTH)
+		design_payload["canvas_height"] = payload.get("canvas_height", DEFAULT_APP_HEIGHT)
+		with tracer.span("design"): 
+			results.append(check(design_payload, emit, should_stop, tracer))
+	return results
+
+TASKS = {
+	"solve": solve,
+	"check": check,
+	"check_batch": check_batch,
+}
@@ -0,0 +1,116 @@
+import contextlib
+import copy
+import io
+import unittest
+
+import check_cache
+import custom_solver
+import design_generator
+
+# Run from the server folder:
+# 	python -m unittest test_check_cache
+
+CHECKED_FIELDS = ["valid", "conflicts", "added", "removed"]
+
+def group(elements):
+	return elements["children"][0]["children"][0]
+
+def lock_location(elements, solution):
+	# Locks the first leaf to where it is in the solution
+	elements = copy.deepcopy(elements)
+	leaf = group(elements)["children"][0]
+	leaf["location"] = dict(solution["elements"][leaf["name"]]["location"])
+	leaf["locks"] = ["location"]
+	return elements
+
+def remove_leaf(elements):
+	elements = copy.deepcopy(elements)
+	group(elements)["children"].pop()
+	return elements
+
+def checked_fields(solutions):
+	return [dict((field, solution[field]) for field in CHECKED_FIELDS if field in solution) for solution in solutions]
+
+class CheckCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.design = design_generator.generate_design(1, 3, seed=3)
+		with contextlib.redirect_stdout(io.StringIO()):
+			solver = custom_solver.Solver(copy.deepcopy(self.design.elements), [], self.design.canvas_width, self.design.canvas_height,
+				seed=1, num_solutions=4)
+			self.solutions = solver.solve()
+		self.assertEqual(len(self.solutions), 4)
+		self.num_checks = 0
+
+	def run_check(self, elements, solutions):
+		self.num_checks += 1
+		with contextlib.redirect_stdout(io.StringIO()):
+			solver = custom_solver.Solver(copy.deepcopy(elements), solutions, self.design.canvas_width, self.design.canvas_height)
+			return solver.check()
+
+	def assert_same_as_check(self, cache, elements, solutions):
+		# The cached result is the one Solver.check() gives for the same tree and solutions
+		expected = self.run_check(elements, copy.deepcopy(solutions))
+		self.num_checks -= 1
+		result = cache.check(copy.deepcopy(elements), solutions, self.run_check)
+		self.assertEqual(result["valid"], expected["valid"])
+		self.assertEqual(checked_fields(result["solutions"]), checked_fields(expected["solutions"]))
+		return result
+
+	def test_same_results_as_check(self):
+		cache = check_cache.CheckCache()
+		locked = lock_location(self.design.elements, self.solutions[0])
+		removed = remove_leaf(self.design.elements)
+
+		# Each edit is a new tree, undoing it gets the tree back from the cache
+		for elements in [self.design.elements, locked, removed, self.design.elements, locked, removed]:
+			self.assert_same_as_check(cache, elements, copy.deepcopy(self.solutions))
+		self.assertEqual(self.num_checks, 3)
+
+		result = self.assert_same_as_check(cache, locked, copy.deepcopy(self.solutions))
+		self.assertTrue(result["solutions"][0]["valid"])
+		self.assertFalse(all(solution["valid"] for solution in result["solutions"]))
+		result = self.assert_same_as_check(cache, removed, copy.deepcopy(self.solutions))
+		self.assertTrue(all("added" in solution for solution in result["solutions"]))
+
+	def test_keys_cover_content(self):
+		cache = check_cache.CheckCache()
+		cache.check(copy.deepcopy(self.design.elements), copy.deepcopy(self.solutions), self.run_check)
+		self.assertEqual(self.num_checks, 1)
+
+		# The order of the keys in the JSON doesn't matter
+		reordered = dict(reversed(list(copy.deepcopy(self.design.elements).items())))
+		cache.check(reordered, copy.deepcopy(self.solutions), self.run_check)
+		self.assertEqual(self.num_checks, 1)
+
+		# Any change to a solution is checked again, but only that solution
+		moved = copy.deepcopy(self.solutions)
+		leaf = moved[1]["elements"][group(self.design.elements)["children"][0]["name"]]
+		leaf["location"]["x"] += 1
+		sent = []
+		def run_check(elements, solutions):
+			sent.extend(solution["id"] for solution in solutions)
+			return self.run_check(elements, solutions)
+		result = cache.check(copy.deepcopy(self.design.elements), moved, run_check)
+		self.assertEqual(sent, [moved[1]["id"]])
+		self.assertFalse(result["solutions"][1]["valid"])
+
+		# Any change to the tree is a different key, even one that isn't part of its structure
+		for elements in [lock_location(self.design.elements, self.solutions[0]), copy.deepcopy(self.design.elements)]:
+			elements["children"][0]["label"] = "changed"
+			num_checks = self.num_checks
+			self.assert_same_as_check(cache, elements, copy.deepcopy(self.solutions))
+			self.assertEqual(self.num_checks, num_checks + 1)
+
+	def test_least_recently_used_evicted(self):
+		cache = check_cache.CheckCache(max_entries=2)
+		cache.put("a", 1)
+		cache.put("b", 2)
+		self.assertEqual(cache.get("a"), 1)
+		cache.put("c", 3)
+		self.assertIsNone(cache.get("b"))
+		self.assertEqual(cache.get("a"), 1)
+		self.assertEqual(cache.get("c"), 3)
+		self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,162 @@
+import contextlib
+import copy
+import io
+import unittest
+import unittest.mock
+
+import custom_solver
+import design_generator
+import nogood_store
+import portfolio
+import search
+import shapes
+
+# Run from the server folder:
+# 	python -m unittest test_custom_solver
+
+def new_solver(design, solutions=[], **kwargs):
+	return custom_solver.Solver(copy.deepcopy(design.elements), solutions, design.canvas_width, design.canvas_height, seed=1, **kwargs)
+
+class FilterDomainsTest(unittest.TestCase):
+	def setUp(self):
+		self.design = design_generator.generate_design(1, 3, seed=3)
+
+	def test_stop_during_filtering(self):
+		# The solver is cancelled after the first check of the filter
+		solver = None
+		def should_stop():
+			return solver is not None and solver.filter_checks >= 1
+
+		with contextlib.redirect_stdout(io.StringIO()):
+			solver = new_solver(self.design, should_stop=should_stop)
+			solutions = solver.solve()
+
+		stats = solver.stats()
+		self.assertEqual(solutions, [])
+		self.assertTrue(stats["stopped"])
+		self.assertEqual(stats["filter_checks"], 1)
+		self.assertEqual(stats["z3_calls"], 0)
+
+		# The values that weren't checked are kept
+		for variable in solver.variables:
+			for index in range(0, len(variable.domain)):
+				if not solver.size_bounds.is_removed(variable, index):
+					self.assertIn(index, variable.feasible)
+
+	def test_stop_before_filtering(self):
+		# Values the size bounds removed aren't given back when no value was checked
+		design = design_generator.generate_design(0, 4, leaf_width=(80, 120), seed=1)
+		with contextlib.redirect_stdout(io.StringIO()):
+			solver = new_solver(design, should_stop=lambda: True)
+		self.assertGreater(solver.size_bounds.num_removed(), 0)
+
+		solver.set_lock_layer()
+		solver.layers.push_through("locks")
+		domains, complete = solver.find_feasible_values()
+		self.assertFalse(complete)
+		self.assertEqual(solver.filter_checks, 0)
+		for variable in solver.variables:
+			removed = solver.size_bounds.removed.get(variable.key(), [])
+			self.assertEqual(domains[variable.key()], [index for index in range(0, len(variable.domain)) if index not in removed])
+
+class ContinueSolveTest(unittest.TestCase):
+	def setUp(self):
+		self.design = design_generator.generate_design(1, 3, seed=3)
+
+	def test_continue_without_timeout_after_timeout(self):
+		# The second request leaves a 1ms timeout on the Z3 solver
+		with contextlib.redirect_stdout(io.StringIO()):
+			solver = new_solver(self.design, num_solutions=5)
+			solutions = solver.solve()
+			# It stops after one check so there is still something left to search
+			solutions = solutions + solver.continue_solve(solutions, num_solutions=5, check_timeout=0.001, 
+				should_stop=lambda: solver.z3_calls >= 1)
+			new_solutions = solver.continue_solve(solutions, num_solutions=5)
+
+		stats = solver.stats()
+		self.assertEqual(len(new_solutions), 5)
+		self.assertEqual(stats["checks_timed_out"], 0)
+		self.assertFalse(stats["timed_out"])
+
+class PlainSearchEngine(search.SearchEngine):
+	# Chronological backtracking: nothing is learned, so nothing is skipped without calling Z3
+	def learn(self):
+		return frozenset((variable.key(), variable.assigned) for variable in self.get_assigned())
+
+def find_all(design, plain=False, **kwargs):
+	# Layouts of every solution, found with the layout engine off so every assignment is checked with Z3
+	with contextlib.redirect_stdout(io.StringIO()), unittest.mock.patch.object(search, "SearchEngine", 
+		PlainSearchEngine if plain else search.SearchEngine):
+		solver = new_solver(design, num_solutions=100000, use_layout_engine=False, **kwargs)
+		solutions = solver.solve()
+	assert solver.exhausted
+	return solver, solutions
+
+def layouts(solutions):
+	return set(portfolio.solution_key(solution) for solution in solutions)
+
+class NogoodTest(unittest.TestCase):
+	def setUp(self):
+		# Small enough to search exhaustively, with leaves wide enough that some arrangements don't fit
+		self.designs = [design_generator.generate_design(0, 3, leaf_width=(60, 120), seed=1), 
+			design_generator.generate_design(0, 3, leaf_width=(60, 120), lock_density=1, seed=5), 
+			design_generator.generate_design(0, 2, leaf_width=(100, 160), seed=3)]
+
+	def test_nogoods_keep_solutions(self):
+		nogoods_learned = 0
+		nogood_hits = 0
+		for design in self.designs:
+			plain_solver, plain_solutions = find_all(design, plain=True)
+			solver, solutions = find_all(design, nogood_cache=nogood_store.NogoodCache())
+			self.assertEqual(layouts(solutions), layouts(plain_solutions))
+			self.assertEqual(len(solutions), len(plain_solutions))
+			nogoods_learned += solver.nogoods_learned
+			nogood_hits += solver.nogood_hits
+			self.assertEqual(plain_solver.nogood_hits, 0)
+		self.assertGreater(nogoods_learned, 0)
+		self.assertGreater(nogood_hits, 0)
+
+	def test_previous_solutions_not_learned(self):
+		# The nogoods that need the previous or blocked solutions only hold for their search.
+		# The next search of the design (with the stored nogoods and other previous solutions) still finds the rest.
+		for design in self.designs:
+			# A previous solution is only blocked when the labels are locked (see ConstraintBuilder.init_previous_solution_constraints)
+			design = lock_labels(design)
+			cache = nogood_store.NogoodCache()
+			solver, solutions = find_all(design, nogood_cache=cache)
+			previous = solutions[0:len(solutions) // 2]
+			expected = layouts(solutions) - layouts(previous)
+
+			plain_solver, plain_solutions = find_all(design, plain=True, solutions=copy.deepcopy(previous))
+			solver, solutions = find_all(design, nogood_cache=cache, solutions=copy.deepcopy(previous))
+			self.assertEqual(layouts(plain_solutions), expected)
+			self.assertEqual(layouts(solutions), expected)
+			self.assertGreater(len(solver.engine.search_nogoods), 0)
+
+			# Every stored nogood can't be solved with only the structure and locks (nothing else is assumed)
+			with contextlib.redirect_stdout(io.StringIO()):
+				checker = new_solver(design)
+				checker.set_lock_layer()
+			variables = dict((variable.key(), variable) for variable in checker.variables)
+			for nogood in solver.nogoods.nogoods:
+				literals = [variables[variable_key].literals[index] for variable_key, index in nogood]
+				self.assertEqual(checker.solver.check(*literals), custom_solver.unsat)
+
+			# The guard of the blocked solutions is never part of a nogood, only the assignments are
+			for nogood in list(solver.nogoods.nogoods) + list(solver.engine.search_nogoods.nogoods):
+				for variable_key, index in nogood:
+					self.assertIn(variable_key, variables)
+
+def lock_labels(design):
+	design = copy.deepcopy(design)
+	def lock(element):
+		if "children" in element:
+			for child in element["children"]:
+				lock(child)
+		elif element["type"] in shapes.label_types:
+			element["locks"] = ["label"]
+	lock(design.elements)
+	return design
+
+if __name__ == "__main__":
+	unittest.main()
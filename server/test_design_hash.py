@@ -0,0 +1,146 @@
+import contextlib
+import copy
+import io
+import unittest
+
+import custom_solver
+import design_generator
+import design_hash
+import solver_cache
+
+# Run from the server folder:
+# 	python -m unittest test_design_hash
+
+def page(elements):
+	return elements["children"][0]
+
+def group(elements):
+	return page(elements)["children"][0]
+
+def leaf(elements):
+	return group(elements)["children"][0]
+
+def rename_leaf(elements):
+	leaf(elements)["name"] = "renamed"
+
+def change_leaf_type(elements):
+	# Images don't have a label
+	leaf(elements)["type"] = "image" if leaf(elements)["type"] != "image" else "text"
+
+def widen_leaf(elements):
+	leaf(elements)["size"]["width"] += 2
+
+def unorder_group(elements):
+	group(elements)["order"] = "unimportant"
+
+def swap_children(elements):
+	children = group(elements)["children"]
+	children[0], children[1] = children[1], children[0]
+
+def remove_leaf(elements):
+	group(elements)["children"].pop()
+
+def change_group_type(elements):
+	group(elements)["type"] = "labelGroup"
+
+def move_leaf(elements):
+	leaf(elements)["location"] = {"x": 17, "y": 23}
+
+def lock_group(elements):
+	group(elements)["locks"] = ["arrangement"]
+	group(elements)["arrangement"] = 1
+
+def lock_location(elements):
+	leaf(elements)["location"] = {"x": 17, "y": 23}
+	leaf(elements)["locks"] = ["location"]
+
+def relabel_leaf(elements):
+	leaf(elements)["label"] = "relabelled"
+
+def resize_group(elements):
+	# Container sizes are solved for, the size the client sends is ignored
+	group(elements)["size"] = {"width": 120, "height": 80}
+
+STRUCTURAL_CHANGES = [rename_leaf, change_leaf_type, widen_leaf, unorder_group, swap_children, remove_leaf, change_group_type]
+OTHER_CHANGES = [move_leaf, lock_group, lock_location, relabel_leaf, resize_group]
+
+def changed(design, change):
+	elements = copy.deepcopy(design.elements)
+	change(elements)
+	return elements
+
+def encode(elements, design):
+	# The structural constraints of a new solver, as SMT-LIB text
+	with contextlib.redirect_stdout(io.StringIO()):
+		return custom_solver.Solver(copy.deepcopy(elements), [], design.canvas_width, design.canvas_height).solver.sexpr()
+
+class StructureHashTest(unittest.TestCase):
+	def setUp(self):
+		self.designs = [design_generator.generate_design(1, 3, seed=3),
+			design_generator.generate_design(1, 2, lock_density=0.5, seed=5)]
+
+	def test_structure_changes_change_hash(self):
+		for design in self.designs:
+			key = design_hash.structure_hash(design.elements, design.canvas_width, design.canvas_height)
+			for change in STRUCTURAL_CHANGES:
+				elements = changed(design, change)
+				self.assertNotEqual(design_hash.structure_hash(elements, design.canvas_width, design.canvas_height), key, change.__name__)
+
+			# The canvas size is part of the structure too
+			elements = copy.deepcopy(design.elements)
+			elements["size"]["height"] += 100
+			self.assertNotEqual(design_hash.structure_hash(elements, design.canvas_width, design.canvas_height + 100), key)
+
+	def test_same_hash_same_encoding(self):
+		# Designs that share a hash share a cached solver, so their structural constraints have to be the same
+		for design in self.designs:
+			key = design_hash.structure_hash(design.elements, design.canvas_width, design.canvas_height)
+			encoding = encode(design.elements, design)
+			for change in OTHER_CHANGES + STRUCTURAL_CHANGES:
+				elements = changed(design, change)
+				if design_hash.structure_hash(elements, design.canvas_width, design.canvas_height) == key:
+					self.assertIn(change, OTHER_CHANGES)
+					self.assertEqual(encode(elements, design), encoding, change.__name__)
+				else:
+					self.assertIn(change, STRUCTURAL_CHANGES)
+
+	def test_key_order(self):
+		design = self.designs[0]
+		elements = copy.deepcopy(design.elements)
+		reordered = dict(reversed(list(elements.items())))
+		self.assertEqual(design_hash.structure_hash(reordered, design.canvas_width, design.canvas_height),
+			design_hash.structure_hash(elements, design.canvas_width, design.canvas_height))
+		self.assertEqual(design_hash.canonical_hash(reordered), design_hash.canonical_hash(elements))
+
+class SolverCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.design = design_generator.generate_design(1, 3, seed=3)
+
+	def solve(self, elements, cache=None):
+		with contextlib.redirect_stdout(io.StringIO()):
+			solver = custom_solver.Solver(copy.deepcopy(elements), [], self.design.canvas_width, self.design.canvas_height,
+				seed=1, num_solutions=5, solver_cache=cache)
+			try:
+				solutions = solver.solve()
+			finally:
+				solver.release()
+		return [solution["elements"] for solution in solutions], solver.stats()
+
+	def test_cached_solver_same_results(self):
+		# A design solved with the solver another design with the same structure left in the cache
+		# gets the same solutions as with a new solver
+		cache = solver_cache.SolverCache()
+		self.solve(self.design.elements, cache)
+		for change in OTHER_CHANGES:
+			elements = changed(self.design, change)
+			expected, stats = self.solve(elements)
+			solutions, stats = self.solve(elements, cache)
+			self.assertTrue(stats["structure_cached"], change.__name__)
+			self.assertEqual(solutions, expected, change.__name__)
+
+		# A different structure isn't served from the cache
+		solutions, stats = self.solve(changed(self.design, widen_leaf), cache)
+		self.assertFalse(stats["structure_cached"])
+
+if __name__ == "__main__":
+	unittest.main()
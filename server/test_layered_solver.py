@@ -0,0 +1,159 @@
+import contextlib
+import copy
+import io
+import unittest
+
+import z3
+
+import custom_solver
+import design_generator
+import domain_cache
+import layered_solver
+import solver_cache
+
+# Run from the server folder:
+# 	python -m unittest test_layered_solver
+
+class LayeredSolverTest(unittest.TestCase):
+	def setUp(self):
+		self.x = z3.Int("x")
+		solver = z3.Solver()
+		solver.add(self.x >= 0, self.x <= 10)
+		self.layers = layered_solver.LayeredSolver(solver, ["locks", "previous"])
+		self.layers.set_layer("locks", [(self.x >= 5, "lock_x")], key="locks")
+		self.layers.set_layer("previous", [(self.x != 5, "")], key="previous")
+
+		# Records the layers that are asserted on the solver
+		self.pushed = []
+		push_layer = self.layers.push_layer
+		def record_push(name):
+			self.pushed.append(name)
+			push_layer(name)
+		self.layers.push_layer = record_push
+
+	def check(self, *assumptions):
+		return self.layers.solver.check(*assumptions)
+
+	def test_layers_scoped(self):
+		self.layers.begin_search()
+		self.assertEqual(self.pushed, ["locks", "previous"])
+		self.assertEqual(self.layers.solver.num_scopes(), 3)
+		self.assertEqual(self.check(self.x == 4), z3.unsat)
+		self.assertEqual(self.check(self.x == 5), z3.unsat)
+		self.assertEqual(self.check(self.x == 6), z3.sat)
+
+		# Tracked constraints show up in the cores
+		self.assertEqual(self.check(self.x == 4), z3.unsat)
+		self.assertIn("lock_x", [str(literal) for literal in self.layers.solver.unsat_core()])
+
+		# Only the constraints of the layers up to the one named
+		self.layers.push_through("locks")
+		self.assertEqual(self.layers.num_pushed, 1)
+		self.assertEqual(self.check(self.x == 5), z3.sat)
+		self.assertEqual(self.check(self.x == 4), z3.unsat)
+
+	def test_search_scope_removed(self):
+		self.layers.begin_search()
+		self.layers.solver.add(self.x == 7)
+		self.assertEqual(self.check(self.x == 6), z3.unsat)
+
+		self.layers.end_search()
+		self.assertEqual(self.layers.solver.num_scopes(), 2)
+		self.assertEqual(self.check(self.x == 6), z3.sat)
+
+		# Setting a layer with the same key also removes the search scope
+		self.layers.begin_search()
+		self.layers.solver.add(self.x == 7)
+		self.assertFalse(self.layers.set_layer("locks", [(self.x >= 5, "lock_x")], key="locks"))
+		self.assertEqual(self.check(self.x == 6), z3.sat)
+
+	def test_same_key_kept(self):
+		self.layers.begin_search()
+		self.layers.end_search()
+		num_replaced = self.layers.num_replaced
+		self.assertFalse(self.layers.set_layer("locks", [], key="locks"))
+		self.assertFalse(self.layers.set_layer("previous", [], key="previous"))
+		self.layers.begin_search()
+
+		# The layers are the ones pushed before, not the empty lists given with the same keys
+		self.assertEqual(self.pushed, ["locks", "previous"])
+		self.assertEqual(self.layers.num_replaced, num_replaced)
+		self.assertEqual(self.check(self.x == 5), z3.unsat)
+
+	def test_replace_top_layer(self):
+		self.layers.begin_search()
+		self.assertTrue(self.layers.set_layer("previous", [(self.x != 6, "")], key="other"))
+		self.assertEqual(self.layers.num_pushed, 1)
+		self.layers.begin_search()
+
+		# The lock layer below it isn't asserted again
+		self.assertEqual(self.pushed, ["locks", "previous", "previous"])
+		self.assertEqual(self.check(self.x == 5), z3.sat)
+		self.assertEqual(self.check(self.x == 6), z3.unsat)
+		self.assertEqual(self.check(self.x == 4), z3.unsat)
+
+	def test_replace_lower_layer(self):
+		self.layers.begin_search()
+		num_replaced = self.layers.num_replaced
+		self.assertTrue(self.layers.set_layer("locks", [(self.x <= 5, "lock_x")], key="other"))
+		self.assertEqual(self.layers.num_pushed, 0)
+		self.assertEqual(self.layers.num_replaced, num_replaced + 1)
+		self.layers.begin_search()
+
+		# The previous solution layer above it is asserted again as it was
+		self.assertEqual(self.pushed, ["locks", "previous", "locks", "previous"])
+		self.assertEqual(self.check(self.x == 4), z3.sat)
+		self.assertEqual(self.check(self.x == 5), z3.unsat)
+		self.assertEqual(self.check(self.x == 6), z3.unsat)
+
+class SolverLayersTest(unittest.TestCase):
+	# A solver kept in the cache between requests only replaces the layers whose constraints changed
+	def setUp(self):
+		self.design = design_generator.generate_design(1, 3, seed=3)
+		self.cache = solver_cache.SolverCache()
+
+		# As in the workers, the filtered domains are cached too. Filtering them only checks against the locks,
+		# so it takes the previous solution layer off the solver.
+		self.domains = domain_cache.DomainCache()
+
+	def solve(self, elements, solutions, cache=None):
+		with contextlib.redirect_stdout(io.StringIO()):
+			solver = custom_solver.Solver(copy.deepcopy(elements), copy.deepcopy(solutions), self.design.canvas_width, self.design.canvas_height,
+				seed=1, num_solutions=3, solver_cache=cache, domain_cache=self.domains if cache is not None else None)
+			try:
+				solutions = solver.solve()
+			finally:
+				solver.release()
+		return [solution["elements"] for solution in solutions], solver.stats()
+
+	def test_layers_replaced(self):
+		first, stats = self.solve(self.design.elements, [], self.cache)
+		self.assertEqual(stats["layers_replaced"], 2)
+
+		# Same locks and previous solutions
+		solutions, stats = self.solve(self.design.elements, [], self.cache)
+		self.assertTrue(stats["structure_cached"])
+		self.assertEqual(stats["layers_replaced"], 0)
+		self.assertEqual(solutions, first)
+
+		# New previous solutions, same locks
+		with contextlib.redirect_stdout(io.StringIO()):
+			previous = custom_solver.Solver(copy.deepcopy(self.design.elements), [], self.design.canvas_width, self.design.canvas_height,
+				seed=1, num_solutions=2).solve()
+		expected, stats = self.solve(self.design.elements, previous)
+		solutions, stats = self.solve(self.design.elements, previous, self.cache)
+		self.assertEqual(stats["layers_replaced"], 1)
+		self.assertEqual(solutions, expected)
+
+		# New locks, so both layers are asserted again
+		elements = copy.deepcopy(self.design.elements)
+		leaf = elements["children"][0]["children"][0]["children"][0]
+		leaf["location"] = dict(first[0][leaf["name"]]["location"])
+		leaf["locks"] = ["location"]
+		expected, stats = self.solve(elements, previous)
+		solutions, stats = self.solve(elements, previous, self.cache)
+		self.assertEqual(stats["layers_replaced"], 2)
+		self.assertEqual(solutions, expected)
+
+if __name__ == "__main__":
+	unittest.main()
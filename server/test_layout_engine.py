@@ -0,0 +1,121 @@
+import contextlib
+import copy
+import io
+import random
+import unittest
+
+import custom_solver
+import design_generator
+import design_loader
+import layout_engine
+import shapes
+
+# Run from the server folder:
+# 	python -m unittest test_layout_engine
+
+NUM_ASSIGNMENTS = 100
+
+def leaves(element):
+	if "children" not in element:
+		return [element]
+	return [leaf for child in element["children"] for leaf in leaves(child)]
+
+def with_odd_sizes(design):
+	# Odd sizes make the halves of the leaves fractions, so centring them only works in some containers
+	elements = copy.deepcopy(design.elements)
+	for leaf in leaves(elements)[::2]:
+		leaf["size"]["width"] += 1
+	return design_loader.Design(design.name + "-odd", elements, design.canvas_width, design.canvas_height)
+
+def find_solutions(design, num_solutions):
+	with contextlib.redirect_stdout(io.StringIO()):
+		solver = custom_solver.Solver(copy.deepcopy(design.elements), [], design.canvas_width, design.canvas_height,
+			seed=1, num_solutions=num_solutions)
+		return solver.solve()
+
+def with_locks(design, solution):
+	# Locks the labels (so previous solutions are blocked) and the location of one leaf to where it is in the solution
+	elements = copy.deepcopy(design.elements)
+	for leaf in leaves(elements):
+		if leaf["type"] in shapes.label_types:
+			leaf["locks"] = leaf.get("locks", []) + ["label"]
+	leaf = leaves(elements)[1]
+	leaf["location"] = dict(solution["elements"][leaf["name"]]["location"])
+	leaf["locks"] = leaf.get("locks", []) + ["location"]
+	return design_loader.Design(design.name + "-locked", elements, design.canvas_width, design.canvas_height)
+
+class LayoutEngineTest(unittest.TestCase):
+	# For random complete assignments, the layout engine and Z3 agree on whether the assignment can be solved
+	# and on the layout
+	def setUp(self):
+		self.designs = [design_generator.generate_design(1, 3, seed=3),
+			design_generator.generate_design(1, 2, lock_density=0.5, seed=5),
+			design_generator.generate_design(2, 2, lock_density=0.5, seed=7)]
+		self.designs += [with_odd_sizes(design) for design in self.designs]
+
+	def compare(self, design, previous_solutions=[]):
+		with contextlib.redirect_stdout(io.StringIO()):
+			solver = custom_solver.Solver(copy.deepcopy(design.elements), copy.deepcopy(previous_solutions),
+				design.canvas_width, design.canvas_height)
+			solver.set_lock_layer()
+			solver.filter_domains()
+			solver.set_previous_solution_layer(previous_solutions)
+			solver.layers.begin_search()
+
+		engine = layout_engine.LayoutEngine(solver)
+		self.assertTrue(engine.is_supported(), engine.unsupported_reason)
+		engine.block_previous_solutions(previous_solutions)
+
+		generator = random.Random(design.name)
+		num_solved = 0
+		num_centered = 0
+		num_blocked = 0
+		for i in range(0, NUM_ASSIGNMENTS):
+			# Mostly values left after filtering, which are more likely to be solvable
+			for variable in solver.variables:
+				values = variable.get_feasible_values() if generator.random() < 0.9 else range(0, len(variable.domain))
+				variable.assigned = generator.choice(values)
+			assumptions = [variable.literals[variable.assigned] for variable in solver.variables]
+
+			model = engine.solve()
+			result = solver.solver.check(*assumptions)
+			self.assertEqual(model is not None, result == custom_solver.sat, design.name + " assignment " + str(i))
+			if model is None:
+				continue
+
+			num_solved += 1
+			num_centered += any(variable.domain[variable.assigned] == "center" for variable in solver.variables 
+				if variable.name in ["alignment", "justification"])
+			z3_model = solver.solver.model()
+			for shape in solver.shapes.values():
+				for z3_variable in [shape.variables.x.z3, shape.variables.y.z3]:
+					self.assertEqual(model[z3_variable].as_long(), z3_model[z3_variable].as_long(), design.name + " " + str(z3_variable))
+				if shape.type == "container":
+					self.assertEqual(model[shape.width].as_long(), z3_model[shape.width].as_long())
+					self.assertEqual(model[shape.height].as_long(), z3_model[shape.height].as_long())
+
+			# Blocking the layout (as the search does for a solution) makes the assignment unsolvable for both
+			if num_blocked < 3:
+				num_blocked += 1
+				solver.solver.add(solver.get_previous_solution_constraint(z3_model))
+				engine.block_layout(model)
+				self.assertIsNone(engine.solve())
+				self.assertEqual(solver.solver.check(*assumptions), custom_solver.unsat)
+		return num_solved, num_centered, len(engine.blocked) - num_blocked
+
+	def test_same_as_z3(self):
+		for design in self.designs:
+			num_solved, num_centered, num_previous = self.compare(design)
+			self.assertGreater(num_solved, 0, design.name)
+			self.assertLess(num_solved, NUM_ASSIGNMENTS, design.name)
+			self.assertGreater(num_centered, 0, design.name)
+
+	def test_same_as_z3_with_locks_and_previous_solutions(self):
+		for design in self.designs:
+			solutions = find_solutions(design, 5)
+			self.assertGreater(len(solutions), 1, design.name)
+			num_solved, num_centered, num_previous = self.compare(with_locks(design, solutions[0]), solutions)
+			self.assertEqual(num_previous, len(solutions), design.name)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,45 @@
+import json
+import unittest
+
+import design_generator
+import server
+
+# Run from the server folder:
+# 	python -m unittest test_server
+
+class SolveRequestTest(unittest.TestCase):
+	def setUp(self):
+		self.client = server.app.test_client()
+		design = design_generator.generate_design(1, 3, seed=3)
+		self.form = dict(elements=json.dumps(design.elements), solutions="[]")
+
+	def assert_rejected(self, **fields):
+		# Invalid fields are rejected before a job is queued, so these don't start the solver pool
+		form = dict(self.form)
+		form.update(fields)
+		for path in ["/solve", "/solve/stream"]:
+			response = self.client.post(path, data=form)
+			self.assertEqual(response.status_code, 400, path + " " + str(fields))
+			self.assertIn(list(fields.keys())[0], json.loads(response.data)["error"])
+
+	def test_invalid_numbers(self):
+		self.assert_rejected(seed="one")
+		self.assert_rejected(seed="1.5")
+		self.assert_rejected(time_budget="soon")
+		self.assert_rejected(time_budget="0")
+		self.assert_rejected(time_budget="nan")
+		self.assert_rejected(check_timeout="-1")
+		self.assert_rejected(check_timeout="inf")
+		self.assert_rejected(beam_width="0")
+		self.assert_rejected(beam_width="-2")
+		self.assert_rejected(portfolio="0")
+		self.assert_rejected(portfolio="two")
+
+	def test_unknown_ordering(self):
+		self.assert_rejected(ordering="alphabetical")
+
+	def test_unknown_search_mode(self):
+		self.assert_rejected(search="breadth_first")
+
+if __name__ == "__main__":
+	unittest.main()
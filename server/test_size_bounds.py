@@ -0,0 +1,70 @@
+import contextlib
+import copy
+import io
+import unittest
+import unittest.mock
+
+import custom_solver
+import design_generator
+import size_bounds
+
+# Run from the server folder:
+# 	python -m unittest test_size_bounds
+
+def new_solver(design, **kwargs):
+	with contextlib.redirect_stdout(io.StringIO()):
+		return custom_solver.Solver(copy.deepcopy(design.elements), [], design.canvas_width, design.canvas_height, seed=1, **kwargs)
+
+def solve(solver):
+	with contextlib.redirect_stdout(io.StringIO()):
+		return solver.solve()
+
+class SizeBoundsTest(unittest.TestCase):
+	def setUp(self):
+		# Leaves too wide to put side by side, too tall to stack with large proximities, and in nested groups
+		self.designs = [design_generator.generate_design(0, 4, leaf_width=(80, 120), seed=1),
+			design_generator.generate_design(0, 3, leaf_width=(100, 140), leaf_height=(150, 200), seed=3),
+			design_generator.generate_design(1, 3, leaf_width=(60, 100), leaf_height=(40, 60), seed=5)]
+
+	def test_removed_values_infeasible(self):
+		# Without the constraints of the bounds, Z3 finds that the values removed can't be solved
+		num_removed = 0
+		for design in self.designs:
+			bounds = new_solver(design).size_bounds
+			with unittest.mock.patch.object(size_bounds.SizeBounds, "get_constraints", lambda self, solver: []):
+				checker = new_solver(design)
+			checker.set_lock_layer()
+			checker.layers.push_through("locks")
+
+			for variable in checker.variables:
+				for index in bounds.removed.get(variable.key(), []):
+					num_removed += 1
+					self.assertEqual(checker.solver.check(variable.literals[index]), custom_solver.unsat, variable.key() + " " + str(index))
+		self.assertGreater(num_removed, 0)
+
+	def test_solutions_in_bounds(self):
+		for design in self.designs:
+			solver = new_solver(design, num_solutions=5)
+			solutions = solve(solver)
+			self.assertGreater(len(solutions), 0, design.name)
+			for solution in solutions:
+				for container in solver.size_bounds.containers:
+					min_width, max_width, min_height, max_height = solver.size_bounds.bounds[container.shape_id]
+					size = solution["elements"][container.shape_id]["size"]
+					self.assertTrue(min_width <= size["width"] <= max_width, container.shape_id)
+					self.assertTrue(min_height <= size["height"] <= max_height, container.shape_id)
+
+	def test_overfull_container(self):
+		# Six leaves fit neither side by side nor stacked, so every arrangement and proximity is removed
+		design = design_generator.generate_design(0, 6, leaf_width=(100, 100), leaf_height=(150, 150), seed=4)
+		solver = new_solver(design, num_solutions=5)
+		page = solver.root.children[0]
+		self.assertEqual(solver.size_bounds.removed[page.variables.arrangement.key()], [0, 1])
+		self.assertEqual(len(solver.size_bounds.removed[page.variables.proximity.key()]), len(page.variables.proximity.domain))
+
+		self.assertEqual(solve(solver), [])
+		self.assertEqual(page.variables.arrangement.feasible, [])
+		self.assertTrue(solver.stats()["exhausted"])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,70 @@
+import threading
+import time
+import unittest
+
+import design_generator
+import portfolio
+import solver_pool
+
+# Run from the server folder:
+# 	python -m unittest test_solver_pool
+
+def solve_payload(design, **kwargs):
+	payload = dict(elements=design.elements, solutions=[], canvas_width=design.canvas_width, canvas_height=design.canvas_height, seed=1)
+	payload.update(kwargs)
+	return payload
+
+class CancelTest(unittest.TestCase):
+	def setUp(self):
+		self.design = design_generator.generate_design(1, 3, seed=3)
+		self.pool = solver_pool.SolverPool(1)
+
+	def tearDown(self):
+		self.pool.close()
+
+	def test_solve_after_cancel(self):
+		# The first search is cancelled while it is running, the worker then runs the next solve
+		found = threading.Event()
+		def on_event(event_type, data):
+			if event_type == "solution":
+				found.set()
+
+		task = self.pool.submit("solve", solve_payload(self.design, num_solutions=1000), on_event=on_event)
+		self.assertTrue(found.wait(60))
+		task.cancel()
+		self.assertLess(len(task.result(60)["solutions"]), 1000)
+
+		result = self.pool.run("solve", solve_payload(self.design, num_solutions=3, search_mode="beam"), 60)
+		self.assertEqual(len(result["solutions"]), 3)
+
+	def test_solve_after_late_cancel(self):
+		# A cancel that arrives after the task finished, while no check is running
+		result = self.pool.run("solve", solve_payload(self.design, num_solutions=3), 60)
+		self.assertEqual(len(result["solutions"]), 3)
+		self.pool.workers[0].cancel_event.set()
+		time.sleep(0.2)
+
+		result = self.pool.run("solve", solve_payload(self.design, num_solutions=3, search_mode="beam"), 60)
+		self.assertEqual(len(result["solutions"]), 3)
+
+class PortfolioTest(unittest.TestCase):
+	def setUp(self):
+		self.design = design_generator.generate_design(1, 3, seed=3)
+		self.pool = solver_pool.SolverPool(2)
+
+	def tearDown(self):
+		self.pool.close()
+
+	def test_solve_after_portfolio(self):
+		# The portfolio cancels the slower search once it has enough solutions. Both workers can still solve after it.
+		search = portfolio.PortfolioSearch(self.pool, solve_payload(self.design, num_solutions=3), num_searches=2).start()
+		self.assertEqual(len(search.result(60)["solutions"]), 3)
+		for task in search.tasks:
+			self.assertTrue(task.finished.wait(60))
+
+		tasks = [self.pool.submit("solve", solve_payload(self.design, num_solutions=3, seed=seed)) for seed in [1, 2]]
+		for task in tasks:
+			self.assertEqual(len(task.result(60)["solutions"]), 3)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,44 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+import tracing
+
+# Run from the server folder:
+# 	python -m unittest test_tracing
+
+def write_trace(path):
+	tracer = tracing.Tracer("worker")
+	with tracer.span("solve"):
+		with tracer.span("search", num_checks=3):
+			pass
+	tracer.write(path)
+
+def read_spans(path):
+	with open(path) as trace_file:
+		return [json.loads(line) for line in trace_file]
+
+class TraceFileTest(unittest.TestCase):
+	def test_other_processes_wait_for_file_lock(self):
+		# A worker process doesn't append its trace while another process holds the lock on the file
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, "trace.jsonl")
+			with open(path, "a") as trace_file:
+				with tracing.lock_file(trace_file):
+					process = multiprocessing.Process(target=write_trace, args=(path,))
+					process.start()
+					process.join(1)
+					self.assertIsNone(process.exitcode)
+					self.assertEqual(os.path.getsize(path), 0)
+
+			process.join(60)
+			self.assertEqual(process.exitcode, 0)
+			spans = read_spans(path)
+			self.assertEqual([span["name"] for span in spans], ["solve", "search"])
+			self.assertEqual(spans[1]["parent_id"], spans[0]["span_id"])
+			self.assertEqual(spans[1]["attributes"], {"num_checks": 3})
+
+if __name__ == "__main__":
+	unittest.main()
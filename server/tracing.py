@@ -0,0 +1,127 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+
+# Appends the spans of every solver task to this file as JSON lines when it is set
+TRACE_FILE = os.environ.get("SCOUT_TRACE_FILE")
+
+# Writes a cProfile dump for every solver task into this directory when it is set
+PROFILE_DIR = os.environ.get("SCOUT_PROFILE_DIR")
+
+# Several threads and worker processes can append to the same trace file. Each trace is written with one call
+# while holding this lock and, between processes, an exclusive lock on the file itself.
+trace_file_lock = threading.Lock()
+
+class Span(object):
+	def __init__(self, span_id, parent_id, name, start, attributes):
+		self.span_id = span_id
+		self.parent_id = parent_id
+		self.name = name
+		self.start = start
+		self.end = None
+		self.attributes = attributes
+
+	def set(self, key, value):
+		self.attributes[key] = value
+
+	def to_json(self, trace_start):
+		span = dict()
+		span["span_id"] = self.span_id
+		span["parent_id"] = self.parent_id
+		span["name"] = self.name
+		span["start"] = self.start - trace_start
+		span["duration"] = (self.end if self.end is not None else time.time()) - self.start
+		if len(self.attributes):
+			span["attributes"] = self.attributes
+		return span
+
+class Tracer(object):
+	# Records nested, named spans for the phases of a request
+	# A disabled tracer still runs the traced code but doesn't keep anything
+	def __init__(self, name=None, enabled=True):
+		self.trace_id = uuid.uuid4().hex
+		self.name = name
+		self.enabled = enabled
+		self.start = time.time()
+		self.spans = []
+		self.stack = []
+
+	@contextlib.contextmanager
+	def span(self, name, **attributes):
+		if not self.enabled:
+			yield NO_SPAN
+			return
+
+		parent_id = self.stack[-1].span_id if len(self.stack) else None
+		span = Span(len(self.spans), parent_id, name, time.time(), attributes)
+		self.spans.append(span)
+		self.stack.append(span)
+		try:
+			yield span
+		finally:
+			span.end = time.time()
+			self.stack.pop()
+
+	def to_json(self):
+		return [span.to_json(self.start) for span in self.spans]
+
+	def write(self, path):
+		# One JSON object per line for each span, tagged with the trace it belongs to
+		lines = []
+		for span in self.to_json():
+			span["trace_id"] = self.trace_id
+			span["trace"] = self.name
+			lines.append(json.dumps(span))
+
+		with trace_file_lock:
+			with open(path, "a") as trace_file:
+				with lock_file(trace_file):
+					trace_file.write("\n".join(lines) + "\n")
+
+@contextlib.contextmanager
+def lock_file(open_file):
+	# Holds an exclusive lock on the file so writes from other processes aren't interleaved with this one
+	# Where fcntl isn't available (Windows), only the threads of this process are serialized
+	try:
+		import fcntl
+	except ImportError:
+		yield
+		return
+
+	fcntl.flock(open_file.fileno(), fcntl.LOCK_EX)
+	try:
+		yield
+	finally:
+		open_file.flush()
+		fcntl.flock(open_file.fileno(), fcntl.LOCK_UN)
+
+class NoSpan(object):
+	def set(self, key, value):
+		pass
+
+NO_SPAN = NoSpan()
+
+# Used wherever no tracer is given
+NO_TRACE = Tracer(enabled=False)
+
+@contextlib.contextmanager
+def profile(name):
+	# Profiles the code inside of the block with cProfile if SCOUT_PROFILE_DIR is set
+	# Open the dumps with python -m pstats or snakeviz
+	if PROFILE_DIR is None:
+		yield
+		return
+
+	import cProfile
+	profiler = cProfile.Profile()
+	profiler.enable()
+	try:
+		yield
+	finally:
+		profiler.disable()
+		os.makedirs(PROFILE_DIR, exist_ok=True)
+		path = os.path.join(PROFILE_DIR, name + "-" + time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:8] + ".prof")
+		profiler.dump_stats(path)
@@ -2,6 +2,11 @@ class Constants {
 	static designCanvasScalingFactor() {
 		return 0.5; 
 	}
+
+	static solveJobPollInterval() {
+		// Milliseconds between requests for the status of a queued solve
+		return 250; 
+	}
 }
 
 export default Constants; 
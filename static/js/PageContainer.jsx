@@ -5,6 +5,7 @@ import ConstraintsCanvas from "./ConstraintsCanvas";
 import FabricHelpers from './FabricHelpers.js';
 import DesignCanvas from './DesignCanvas';
 import Sidebar from 'react-sidebar';
+import Constants from './Constants';
 import $ from 'jquery';
 
 export default class PageContainer extends React.Component {
@@ -14,6 +15,8 @@ export default class PageContainer extends React.Component {
     this.drawContainersCanvas = this.drawContainersCanvas.bind(this);
     this.getMoreDesigns = this.getMoreDesigns.bind(this); 
     this.parseSolutions = this.parseSolutions.bind(this);
+    this.pollSolveJob = this.pollSolveJob.bind(this);
+    this.showSolveError = this.showSolveError.bind(this);
     this.updateConstraintsCanvasFromDesignCanvas = this.updateConstraintsCanvasFromDesignCanvas.bind(this); 
     this.updateConstraintsCanvas = this.updateConstraintsCanvas.bind(this);
     this.getConstraintsCanvasShape = this.getConstraintsCanvasShape.bind(this);
@@ -28,11 +31,15 @@ export default class PageContainer extends React.Component {
       designsFound: -1, 
       treeData: [], 
       sidebarOpen: true,
+      solveError: undefined,
     };   
 
     // Dictionaries for being able to retrieve a design canvas by ID more efficiently
     this.solutionsMap ={};
 
+    // Identifies this design session to the server so a new solve request cancels the one still running
+    this.sessionID = Date.now().toString(36) + Math.random().toString(36).substring(2); 
+
     this.constraintsCanvasRef = React.createRef();
   }
 
@@ -227,6 +234,53 @@ export default class PageContainer extends React.Component {
     });
   }
 
+  showSolveError(request) {
+    // The server couldn't start the solve or lost track of it
+    // It sends back a 503 when too many solves are already waiting for the solver
+    let message = request.status == 503 ? "The solver is busy. Please try again in a moment." : "The designs could not be found."; 
+    try {
+      let error = JSON.parse(request.responseText).error; 
+      if(error) {
+        message = message + " (" + error + ")"; 
+      }
+    } catch(e) {
+      // Not a response from the solver (e.g. the server is down)
+    }
+
+    this.setState({
+      solveError: message
+    }); 
+  }
+
+  pollSolveJob(requestData) {
+    // The server queues up the solve and sends back a job ID right away
+    // Keep asking for the job status until the designs are ready
+    let job = JSON.parse(requestData); 
+    var self = this; 
+    $.get("/jobs/" + job.job_id, function(jobData) {
+      let jobParsed = JSON.parse(jobData); 
+      if(jobParsed.status == "done") {
+        self.parseSolutions(jobData); 
+      } else if(jobParsed.status == "failed") {
+        // Keep any designs found before the solver failed, and say why no more were found
+        // Without any, "Show More" stays enabled so the solve can be tried again
+        if(jobParsed.solutions.length) {
+          self.parseSolutions(jobData); 
+        }
+        self.setState({
+          solveError: "The solver failed while looking for designs. (" + jobParsed.error + ")"
+        }); 
+      } else if(jobParsed.status == "cancelled") {
+        // A newer request replaced this one, its results will arrive instead
+        return; 
+      } else {
+        setTimeout(function() {
+          self.pollSolveJob(requestData); 
+        }, Constants.solveJobPollInterval()); 
+      }
+    }, 'text').fail(this.showSolveError); 
+  }
+
   getMoreDesigns() {
     // get more designs
     // without changing any new constraints
@@ -237,11 +291,14 @@ export default class PageContainer extends React.Component {
    
    // Send an ajax request to the server 
    // Solve for the new designs
-    $.post("/solve", {"elements": jsonShapes, "solutions": prevSolutions}, this.parseSolutions, 'text');
+   // If the constraints haven't changed the server continues its last search for this session instead of starting over
+    $.post("/solve", {"elements": jsonShapes, "solutions": prevSolutions, "session_id": this.sessionID, "continue": true}, this.pollSolveJob, 'text')
+      .fail(this.showSolveError);
 
     // Reset the state of the designs canvas
     this.setState({
-      constraintChanged: false
+      constraintChanged: false, 
+      solveError: undefined
     });
   }
 
@@ -257,15 +314,17 @@ export default class PageContainer extends React.Component {
     $.post("/solve", {
       "elements": jsonShapes, 
       "solutions": prevSolutions, 
+      "session_id": this.sessionID, 
       "relative_designs": {
         "relative_design": elements, 
         "relative_action": action
       }
-    }, this.parseSolutions, 'text');
+    }, this.pollSolveJob, 'text').fail(this.showSolveError);
 
     // Reset the state of the designs canvas
     this.setState({
-      constraintChanged: false
+      constraintChanged: false, 
+      solveError: undefined
     });
   }
 
@@ -274,6 +333,7 @@ export default class PageContainer extends React.Component {
     const designsFound = this.state.designsFound; 
     const errorMessageShown = this.state.errorMessageShown; 
     const constraintChanged = this.state.constraintChanged;
+    const solveError = this.state.solveError; 
     const designsAlertMessage = designsFound > 0 ? "Here " + (designsFound > 1 ? "are" : "is") + " " + designsFound + " very different " + (designsFound > 1 ? "designs" : "design") + ". " : "No more designs found. "; 
     const savedCanvases = this.state.solutions.filter(function(solution) { return (solution.saved == 1); })
               .map(function(solution) {
@@ -334,6 +394,7 @@ export default class PageContainer extends React.Component {
                 <button type="button" className="btn btn-default design-canvas-button" disabled={(designsFound > 0 || designsFound == -1) ? null : "disabled"} onClick={this.getMoreDesigns}>{(designsFound == 0 ? "Get Designs" : "Show More")}</button>
               </h3>
             </div>
+            { solveError ? (<div className="alert alert-danger constraint-error-message" role="alert">{solveError}</div>) : null }
             <div className="constraints-canvas-container"> 
               <ConstraintsCanvas ref={this.constraintsCanvasRef} 
                 updateConstraintsCanvas={this.updateConstraintsCanvas} 